@@ -0,0 +1,156 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from collections import deque
+
+from .exceptions import PoolTimeout
+
+
+class AsyncPool:
+    """
+    A pool of asynchronous connections, made by the given coroutine factory.
+    It works like Pool, but tasks wait on futures instead of a condition, and
+    reaping happens on checkout instead of in a thread.
+    """
+
+    __slots__ = ('factory', 'minimum', 'maximum', 'timeout', 'lifetime',
+                 'idle', 'ping', 'connections', 'size', 'waiters',
+                 'stopped', 'reaped')
+
+    def __init__(self, factory, minimum=1, maximum=10, timeout=30.0,
+                 lifetime=3600.0, idle=600.0, ping=1.0):
+        self.factory = factory
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.timeout = timeout
+        self.lifetime = lifetime
+        self.idle = idle
+        self.ping = ping
+        self.connections = deque()
+        self.size = 0
+        self.waiters = deque()
+        self.stopped = False
+        self.reaped = time.monotonic()
+
+    def interval(self):
+        timeouts = [value for value in (self.idle, self.lifetime) if value]
+        if timeouts:
+            return min(timeouts) / 2
+        return None
+
+    async def open(self):
+        """
+        Opens the minimum number of connections.
+        """
+        while self.size < self.minimum:
+            self.size += 1
+            self.connections.append(await self.make())
+
+    async def make(self):
+        try:
+            return await self.factory()
+        except Exception:
+            self.release()
+            raise
+
+    def wake(self):
+        """
+        Wakes up the first task that is still waiting for a connection.
+        """
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def release(self):
+        self.size -= 1
+        self.wake()
+
+    async def take(self, deadline):
+        """
+        Takes the most recently used idle connection, or reserves a slot for
+        a new one, in which case it returns None.
+        """
+        while not self.connections:
+            if self.size < self.maximum:
+                self.size += 1
+                return None
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                raise PoolTimeout(self.timeout)
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        return self.connections.pop()
+
+    async def checkout(self):
+        now = time.monotonic()
+        interval = self.interval()
+        if interval and now - self.reaped > interval:
+            self.reap()
+        deadline = now + self.timeout
+        while True:
+            connection = await self.take(deadline)
+            if connection is None:
+                return await self.make()
+            now = time.monotonic()
+            expired = connection.expired(self.lifetime, now)
+            if not expired and await connection.ahealthy(self.ping, now):
+                return connection
+            self.discard(connection)
+
+    def checkin(self, connection):
+        now = time.monotonic()
+        broken = connection.broken()
+        if self.stopped or broken or connection.expired(self.lifetime, now):
+            return self.discard(connection)
+        connection.used = now
+        self.connections.append(connection)
+        self.wake()
+        return None
+
+    def discard(self, connection):
+        connection.close()
+        self.release()
+
+    def reap(self):
+        """
+        Closes expired connections and those that have been idle for too
+        long, keeping at least minimum open. Returns how many were closed.
+        """
+        now = time.monotonic()
+        self.reaped = now
+        stale = []
+        for connection in list(self.connections):
+            expired = connection.expired(self.lifetime, now)
+            idle = connection.idle(self.idle, now)
+            if expired or (idle and self.size > self.minimum):
+                self.connections.remove(connection)
+                stale.append(connection)
+                self.discard(connection)
+        return len(stale)
+
+    def stats(self):
+        idle = len(self.connections)
+        return {'size': self.size, 'idle': idle, 'used': self.size - idle}
+
+    def close(self):
+        """
+        Closes the idle connections. Connections that are checked out are
+        closed when they are checked in.
+        """
+        self.stopped = True
+        while self.connections:
+            self.discard(self.connections.pop())
+
+    def __repr__(self):
+        return f'<AsyncPool({self.size}/{self.maximum})>'
@@ -0,0 +1,72 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from threading import Lock
+
+
+class Cache:
+    """
+    A bounded least-recently-used cache that keeps track of its hits, misses
+    and evictions. It can be shared between threads.
+    """
+
+    __slots__ = ('size', 'items', 'hits', 'misses', 'evictions', 'lock')
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        """
+        Gets an item, marking it as the most recently used one.
+        """
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Stores an item, and returns the (key, value) evicted to make room for
+        it, if any.
+        """
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.size:
+                self.evictions += 1
+                return self.items.popitem(last=False)
+            return None
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def stats(self):
+        return {'size': len(self.items), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hit_rate()}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return f'<Cache({len(self.items)}/{self.size})>'
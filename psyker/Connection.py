@@ -0,0 +1,114 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import psycopg2
+from psycopg2.extensions import (POLL_OK, POLL_READ,
+                                 TRANSACTION_STATUS_IDLE)
+
+
+class Connection:
+    """
+    A pooled connection, together with its cursor and its prepared
+    statements.
+    """
+
+    __slots__ = ('conn', 'cursor', 'prepared', 'created', 'used', 'tags')
+
+    def __init__(self, conn, cursor, prepared=None):
+        self.conn = conn
+        self.cursor = cursor
+        self.prepared = prepared
+        self.created = time.monotonic()
+        self.used = self.created
+        self.tags = set()
+
+    def expired(self, lifetime, now):
+        if lifetime:
+            return now - self.created > lifetime
+        return False
+
+    def idle(self, timeout, now):
+        if timeout:
+            return now - self.used > timeout
+        return False
+
+    def broken(self):
+        """
+        Whether the connection is closed or was left in a transaction. This
+        doesn't need a round trip.
+        """
+        if self.conn.closed:
+            return True
+        return self.conn.get_transaction_status() != TRANSACTION_STATUS_IDLE
+
+    def healthy(self, ping, now):
+        """
+        Checks the connection, pinging the server when it was idle for longer
+        than ping seconds.
+        """
+        if self.broken():
+            return False
+        if ping is None or now - self.used < ping:
+            return True
+        try:
+            self.cursor.execute('select 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    @staticmethod
+    def wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    async def wait(self):
+        """
+        Waits for an asynchronous connection to finish its current operation,
+        without blocking the event loop.
+        """
+        loop = asyncio.get_event_loop()
+        fileno = self.conn.fileno()
+        state = self.conn.poll()
+        while state != POLL_OK:
+            future = loop.create_future()
+            if state == POLL_READ:
+                loop.add_reader(fileno, self.wake, future)
+                remove = loop.remove_reader
+            else:
+                loop.add_writer(fileno, self.wake, future)
+                remove = loop.remove_writer
+            try:
+                await future
+            finally:
+                remove(fileno)
+            state = self.conn.poll()
+
+    async def ahealthy(self, ping, now):
+        """
+        Like healthy, for asynchronous connections.
+        """
+        if self.broken():
+            return False
+        if ping is None or now - self.used < ping:
+            return True
+        try:
+            self.cursor.execute('select 1')
+            await self.wait()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def close(self):
+        try:
+            self.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def __repr__(self):
+        return f'<Connection({self.conn.dsn})>'
@@ -0,0 +1,45 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class CopyReader:
+    """
+    A file-like object that feeds copy from an iterator of lines, so that
+    only about one chunk at a time is kept in memory.
+    """
+
+    __slots__ = ('lines', 'buffer', 'rows')
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = ''
+        self.rows = 0
+
+    def fill(self, size):
+        """
+        Pulls lines until the buffer holds at least size characters or the
+        lines are over.
+        """
+        parts = [self.buffer]
+        length = len(self.buffer)
+        for line in self.lines:
+            parts.append(line)
+            length += len(line)
+            self.rows += 1
+            if length >= size:
+                break
+        self.buffer = ''.join(parts)
+
+    def read(self, size=8192):
+        if size is None or size < 0:
+            self.fill(float('inf'))
+            size = len(self.buffer)
+        elif len(self.buffer) < size:
+            self.fill(size)
+        chunk = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return chunk
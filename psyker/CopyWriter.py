@@ -0,0 +1,49 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from queue import Empty, Queue
+
+
+class CopyWriter:
+    """
+    A file-like object that hands the chunks written by copy to a consumer
+    through a bounded queue, so that copy waits for the consumer rather than
+    piling chunks up in memory.
+    """
+
+    __slots__ = ('queue', 'stopped')
+
+    def __init__(self, size):
+        self.queue = Queue(size)
+        self.stopped = False
+
+    def write(self, chunk):
+        if self.stopped is False:
+            self.queue.put(chunk)
+
+    def finish(self):
+        """
+        Signals the consumer that there are no more chunks.
+        """
+        self.write(None)
+
+    def stop(self):
+        """
+        Discards any further chunk, and frees a writer that may be waiting on
+        a full queue.
+        """
+        self.stopped = True
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+
+    def __iter__(self):
+        chunk = self.queue.get()
+        while chunk is not None:
+            yield chunk
+            chunk = self.queue.get()
@@ -18,8 +18,17 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
 # License for more details.
 # -*- coding: utf-8 -*-
+from collections import namedtuple
+
 from psycopg2.extras import NamedTupleCursor
 
+from .Session import Session
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class Cursor(NamedTupleCursor):
     """
@@ -28,6 +37,8 @@ class Cursor(NamedTupleCursor):
     psycopg2 does not have an argument to set rename to True.
     """
 
+    row_types = {}
+
     @staticmethod
     def columns(description):
         return [column.name for column in description]
@@ -39,54 +50,210 @@ class Cursor(NamedTupleCursor):
     def count(self):
         return super(NamedTupleCursor, self).fetchall()[0][0]
 
-    def fetch_returned(self):
+    def returned(self):
         """
-        Fetches the result of a returning clause.
+        Fetches all the results of a returning clause.
         """
-        row = super(NamedTupleCursor, self).fetchone()
-        return row[0]
+        rows = super(NamedTupleCursor, self).fetchall()
+        return [row[0] for row in rows]
 
     def fetchone(self, targets, mode=None):
         row = super(NamedTupleCursor, self).fetchone()
         if row:
             table = targets[0]
-            row_dict = dict(zip(table.columns.keys(), row))
             if mode == 'dictionaries':
-                return row_dict
-            return self.models[table.name](**row_dict)
+                return dict(zip(table.columns.keys(), row))
+            return self.hydrator(table, tuple(table.columns))(row)
+
+    def hydrator(self, target, columns):
+        """
+        Gets the hydrator of the model of a target. Within a session, it
+        reuses the instances that were already loaded.
+        """
+        model = self.models[target.name]
+        hydrate = model.hydrator(columns)
+        session = Session.current.get()
+        if session is None or 'id' not in columns:
+            return hydrate
+        return session.hydrator(model, hydrate, columns)
+
+    @staticmethod
+    def make_dict(columns):
+        def make(row):
+            return dict(zip(columns, row))
+        return make
+
+    def levels(self, targets, mode=None):
+        """
+        Gets how to make the items of each target from a joined row: the
+        function that makes them, where their columns start, how many there
+        are, and the position of the primary key.
+        """
+        levels = []
+        start = 0
+        for target in targets:
+            columns = tuple(target.columns)
+            if mode == 'dictionaries':
+                make = self.make_dict(columns)
+            else:
+                make = self.hydrator(target, columns)
+            key = None
+            if 'id' in columns:
+                key = columns.index('id')
+            levels.append((make, start, len(columns), key))
+            start += len(columns)
+        return levels
+
+    def make_joined(self, rows, targets, mode=None):
+        """
+        Makes items from the rows of a join. Rows are grouped by the primary
+        key of each table, so that each entity is made once and holds a list
+        of its related items. Each joined table is related to the previous
+        one. Items of an outer join that has no match are left out.
+        """
+        levels = self.levels(targets, mode)
+        last = len(levels) - 1
+        # NOTE(vesuvium): nodes map the identity of an entity to the entity,
+        # the list of its related items and the identities in that list.
+        nodes = [{} for level in levels]
+        result = []
+        for row in rows:
+            parent = None
+            for index, (make, start, size, key) in enumerate(levels):
+                if key is None:
+                    identity = row[start:start + size]
+                else:
+                    identity = row[start + key]
+                    if identity is None:
+                        break
+                node = nodes[index].get(identity)
+                if node is None:
+                    instance = make(row[start:])
+                    children = None
+                    if index < last:
+                        children = []
+                        name = targets[index + 1].name
+                        if mode == 'dictionaries':
+                            instance[name] = children
+                        else:
+                            setattr(instance, name, children)
+                    node = (instance, children, set())
+                    nodes[index][identity] = node
+                    if index == 0:
+                        result.append(instance)
+                if parent is not None and identity not in parent[2]:
+                    parent[2].add(identity)
+                    parent[1].append(node[0])
+                parent = node
+        return result
+
+    @staticmethod
+    def array(values, dtype):
+        """
+        Makes a NumPy array of the given dtype, or a list when NumPy is not
+        installed. Nulls can't be stored in integer or boolean arrays, so
+        those columns become object arrays when they have any.
+        """
+        if numpy is None:
+            return list(values)
+        if dtype is None:
+            return numpy.array(values, dtype=object)
+        if not dtype.startswith('datetime') and None in values:
+            return numpy.array(values, dtype=object)
+        return numpy.array(values, dtype=dtype)
+
+    @staticmethod
+    def names(targets, separator='.'):
+        """
+        Gets the column names of targets. The columns of joined tables are
+        prefixed with the table name.
+        """
+        names = []
+        for index, target in enumerate(targets):
+            for name in target.columns:
+                if index:
+                    name = f'{target.name}{separator}{name}'
+                names.append(name)
+        return names
+
+    @classmethod
+    def row_type(cls, names):
+        """
+        Gets the namedtuple used for rows with the given column names,
+        making it the first time. Invalid or duplicate names are renamed.
+        """
+        if names not in cls.row_types:
+            cls.row_types[names] = namedtuple('Row', names, rename=True)
+        return cls.row_types[names]
+
+    def columnar(self, rows, targets):
+        """
+        Makes a dictionary of column arrays from rows.
+        """
+        names = self.names(targets)
+        dtypes = [
+            column.dtype()
+            for target in targets for column in target.columns.values()
+        ]
+        values = list(zip(*rows)) or [()] * len(names)
+        result = {}
+        for index, name in enumerate(names):
+            result[name] = self.array(values[index], dtypes[index])
+        return result
 
-    def make_related(self, row, targets, mode=None):
+    def materialize(self, rows, targets, mode=None):
         """
-        Splits a long row resulting from a join so that related items are
-        where they should be.
+        Makes models, dictionaries, namedtuples, or column arrays from rows.
+        Models are made with their generated hydrator, and tuples are the
+        rows as the driver returns them.
         """
-        columns = targets[0].columns
-        model = self.models[targets[0].name]
-        start = len(columns)
+        if mode == 'tuples':
+            return rows
+        if mode == 'rows':
+            row_type = self.row_type(tuple(self.names(targets, '_')))
+            return list(map(row_type._make, rows))
+        if mode == 'columns':
+            return self.columnar(rows, targets)
+        if len(targets) > 1:
+            return self.make_joined(rows, targets, mode)
+        columns = tuple(targets[0].columns)
         if mode == 'dictionaries':
-            return self.make_dicts(row[start:], columns.keys(), targets[1:])
-        return self.make(model, row[start:], columns.keys(), targets[1:])
-
-    def make(self, model, row, columns, targets):
-        instance = model(**dict(zip(columns, row)))
-        if targets:
-            target = targets[0]
-            setattr(instance, target.name, (self.make_related(row, targets), ))
-        return instance
-
-    def make_dicts(self, row, columns, targets):
-        instance = dict(zip(columns, row))
-        if targets:
-            related = self.make_related(row, targets, 'dictionaries')
-            instance[targets[0].name] = (related, )
-        return instance
+            return [dict(zip(columns, row)) for row in rows]
+        hydrate = self.hydrator(targets[0], columns)
+        return [hydrate(row) for row in rows]
+
+    def fetch_rows(self, fetch):
+        """
+        Fetches the rows of a result as they are, so that they can be cached.
+        """
+        if fetch == 'one':
+            row = super(NamedTupleCursor, self).fetchone()
+            return [row] if row else []
+        return super(NamedTupleCursor, self).fetchall()
+
+    def from_rows(self, rows, fetch, mode, targets):
+        """
+        Makes the result that fetchone, fetchall or count would make, from
+        rows that were fetched already.
+        """
+        if fetch == 'count':
+            return rows[0][0]
+        if fetch == 'one':
+            if rows:
+                return self.materialize(rows, targets[:1], mode)[0]
+            return None
+        return self.materialize(list(rows), targets, mode)
 
     def fetchall(self, targets, mode=None):
         rows = super(NamedTupleCursor, self).fetchall()
-        columns = targets[0].columns.keys()
-        model = self.models[targets[0].name]
-        if mode == 'dictionaries':
-            return [
-                self.make_dicts(r, columns, targets[1:]) for r in rows
-            ]
-        return [self.make(model, row, columns, targets[1:]) for row in rows]
+        return self.materialize(rows, targets, mode)
+
+    def iterate(self, targets, size, mode=None):
+        """
+        Fetches rows in batches of the given size, yielding them one by one.
+        The rows of joins are grouped within each batch.
+        """
+        rows = super(NamedTupleCursor, self).fetchmany(size)
+        while rows:
+            yield from self.materialize(rows, targets, mode)
+            rows = super(NamedTupleCursor, self).fetchmany(size)
@@ -4,9 +4,23 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Thread, local
+from uuid import uuid4
+
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, encodings
 
+from .AsyncPool import AsyncPool
+from .Cache import Cache
+from .Connection import Connection
+from .CopyWriter import CopyWriter
 from .Cursor import Cursor
+from .Pool import Pool
+from .ResultCache import ResultCache
+from .Statements import Statements
+from .Transaction import Transaction
 from .exceptions import ConnectionError
 
 
@@ -15,17 +29,70 @@ class Db:
     Responsible for interactions with the database.
     """
 
-    __slots__ = ('url', 'models', 'conn', 'cursor')
+    __slots__ = ('url', 'models', 'pool', 'async_pool', 'options',
+                 'statements', 'prepare', 'local', 'held', 'result_cache')
 
-    def __init__(self, url, models):
+    def __init__(self, url, models, cache_size=256, prepare_threshold=None,
+                 prepare_size=64, pool_min=1, pool_max=10, pool_timeout=30.0,
+                 pool_lifetime=3600.0, pool_idle=600.0, pool_ping=1.0,
+                 result_cache=None, result_cache_size=67108864,
+                 result_cache_ttl=60.0):
         self.url = url
         self.models = models
-        self.conn = None
-        self.cursor = None
+        self.pool = None
+        self.async_pool = None
+        self.options = {'minimum': pool_min, 'maximum': pool_max,
+                        'timeout': pool_timeout, 'lifetime': pool_lifetime,
+                        'idle': pool_idle, 'ping': pool_ping}
+        self.statements = self.make_cache(cache_size)
+        self.prepare = (prepare_threshold, prepare_size)
+        self.local = local()
+        self.held = ContextVar(f'psyker_held_{id(self)}', default=None)
+        self.result_cache = result_cache
+        if result_cache is None:
+            self.result_cache = self.make_result_cache(result_cache_size,
+                                                       result_cache_ttl)
+
+    @staticmethod
+    def make_cache(size):
+        """
+        Makes the cache for rendered statements. A size of 0 or None disables
+        it.
+        """
+        if size:
+            return Cache(size)
+        return None
+
+    @staticmethod
+    def make_result_cache(size, ttl):
+        """
+        Makes the cache for the results of queries that ask for it. A size
+        of 0 or None disables it.
+        """
+        if size:
+            return ResultCache(size, ttl)
+        return None
+
+    @staticmethod
+    def make_statements(threshold, size):
+        """
+        Makes the registry of prepared statements. Statements are prepared
+        only when a threshold is given.
+        """
+        if threshold:
+            return Statements(threshold, size)
+        return None
 
     @classmethod
-    def setup_cursor(cls, conn, models):
-        cursor = conn.cursor(cursor_factory=Cursor)
+    def setup_cursor(cls, conn, models, name=None, hold=False):
+        """
+        Creates a cursor. Named cursors are server-side cursors, which need
+        hold to be used in autocommit mode.
+        """
+        if name:
+            cursor = conn.cursor(name, cursor_factory=Cursor, withhold=hold)
+        else:
+            cursor = conn.cursor(cursor_factory=Cursor)
         cursor.models = models
         return cursor
 
@@ -35,36 +102,320 @@ class Db:
         """
         return self.models[table_name].__table__
 
-    def connect(self):
+    def make_connection(self):
         """
-        Connects to the database.
+        Connects to the database, making a connection for the pool.
         """
         try:
-            self.conn = psycopg2.connect(self.url)
+            conn = psycopg2.connect(self.url)
         except psycopg2.OperationalError:
             raise ConnectionError(self.url)
-        self.conn.set_session(autocommit=True)
+        conn.set_session(autocommit=True)
+        cursor = self.setup_cursor(conn, self.models)
+        return Connection(conn, cursor, self.make_statements(*self.prepare))
 
-    def start(self):
+    async def make_async_connection(self):
+        """
+        Makes an asynchronous connection. These are always in autocommit
+        mode, and don't use prepared statements.
+        """
+        try:
+            conn = psycopg2.connect(self.url, async_=1)
+            connection = Connection(conn, None)
+            await connection.wait()
+        except psycopg2.OperationalError:
+            raise ConnectionError(self.url)
+        connection.cursor = self.setup_cursor(conn, self.models)
+        return connection
+
+    def connect(self):
         """
-        Connects to the database and creates the cursor.
+        Opens the pool of connections, replacing the current one.
         """
+        if self.pool:
+            self.pool.close()
+        self.pool = Pool(self.make_connection, **self.options)
+        self.pool.open()
+
+    def start(self):
         self.connect()
-        self.cursor = self.setup_cursor(self.conn, self.models)
 
-    def execute(self, query, params, fetch, mode, targets):
-        self.cursor.execute(query, params)
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for a statement, or gives the one held by the
+        current thread.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection:
+            yield connection
+            return
+        # NOTE(vesuvium): connect may replace the pool in the meantime, and
+        # the connection has to go back to the one that counts it.
+        pool = self.pool
+        connection = pool.checkout()
+        connection.cursor.models = self.models
+        try:
+            yield connection
+        finally:
+            pool.checkin(connection)
+
+    def transaction(self, isolation=None, readonly=False):
+        return Transaction(self, isolation, readonly)
+
+    async def acheckout(self):
+        """
+        Borrows an asynchronous connection, opening the pool on first use, or
+        gives the one held by the current task.
+        """
+        held = self.held.get()
+        if held:
+            return held
+        if self.async_pool is None:
+            self.async_pool = AsyncPool(self.make_async_connection,
+                                        **self.options)
+            await self.async_pool.open()
+        connection = await self.async_pool.checkout()
+        connection.cursor.models = self.models
+        return connection
+
+    def acheckin(self, connection):
+        if connection is not self.held.get():
+            self.async_pool.checkin(connection)
+
+    def statement(self, connection, query, params, shape):
+        """
+        Gets the statement to execute for a query, which is a prepared one
+        when the shape of the query is hot enough.
+        """
+        if shape is None or connection.prepared is None:
+            return query
+        if type(query) != str:
+            query = query.as_string(connection.cursor)
+        return connection.prepared.statement(connection.cursor, shape, query,
+                                             params)
+
+    @staticmethod
+    def results(cursor, fetch, mode, targets):
         if fetch == 'one':
-            return self.cursor.fetchone(targets, mode=mode)
+            return cursor.fetchone(targets, mode=mode)
+        elif fetch == 'returned':
+            return cursor.returned()
+        elif fetch == 'count':
+            return cursor.count()
         elif fetch:
-            return self.cursor.fetchall(targets, mode=mode)
+            return cursor.fetchall(targets, mode=mode)
+
+    def execute(self, query, params, fetch, mode, targets, shape=None):
+        with self.connection() as connection:
+            cursor = connection.cursor
+            cursor.execute(self.statement(connection, query, params, shape),
+                           params)
+            return self.results(cursor, fetch, mode, targets)
 
-    def count(self, query, params=None):
-        self.cursor.execute(query, params)
-        return self.cursor.count()
+    async def aexecute(self, query, params, fetch, mode, targets):
+        connection = await self.acheckout()
+        try:
+            connection.cursor.execute(query, params)
+            await connection.wait()
+            return self.results(connection.cursor, fetch, mode, targets)
+        finally:
+            self.acheckin(connection)
+
+    @staticmethod
+    def cache_key(query, params, fetch):
+        """
+        Makes the result cache key of a query, or None when its params can't
+        be hashed.
+        """
+        key = (query, fetch, tuple(params or ()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def lookup(self, connection, query, params, fetch):
+        """
+        Gets the cache key of a query and its cached rows. Queries in a
+        transaction are not cached, since they could see uncommitted
+        changes.
+        """
+        if self.result_cache is None:
+            return None, None
+        status = connection.conn.get_transaction_status()
+        if status != TRANSACTION_STATUS_IDLE:
+            return None, None
+        if type(query) != str:
+            query = query.as_string(connection.cursor)
+        key = self.cache_key(query, params, fetch)
+        if key is None:
+            return None, None
+        return key, self.result_cache.get(key)
+
+    def cached(self, query, params, fetch, mode, targets, shape, ttl):
+        """
+        Like execute, going through the result cache. Rows are cached
+        rather than results, so that cached results never share instances.
+        """
+        with self.connection() as connection:
+            cursor = connection.cursor
+            key, rows = self.lookup(connection, query, params, fetch)
+            if rows is not None:
+                return cursor.from_rows(rows, fetch, mode, targets)
+            cursor.execute(self.statement(connection, query, params, shape),
+                           params)
+            if key is None:
+                return self.results(cursor, fetch, mode, targets)
+            rows = cursor.fetch_rows(fetch)
+            tags = [target.name for target in targets]
+            self.result_cache.set(key, rows, tags, ttl)
+            return cursor.from_rows(rows, fetch, mode, targets)
+
+    async def acached(self, query, params, fetch, mode, targets, ttl):
+        """
+        Like cached, on an asynchronous connection.
+        """
+        connection = await self.acheckout()
+        try:
+            cursor = connection.cursor
+            key, rows = self.lookup(connection, query, params, fetch)
+            if rows is not None:
+                return cursor.from_rows(rows, fetch, mode, targets)
+            cursor.execute(query, params)
+            await connection.wait()
+            if key is None:
+                return self.results(cursor, fetch, mode, targets)
+            rows = cursor.fetch_rows(fetch)
+            tags = [target.name for target in targets]
+            self.result_cache.set(key, rows, tags, ttl)
+            return cursor.from_rows(rows, fetch, mode, targets)
+        finally:
+            self.acheckin(connection)
+
+    def invalidate(self, tables):
+        """
+        Drops the cached results of tables after a write. Writes made in a
+        transaction are invalidated again when it ends, since other
+        connections can cache the old rows until then.
+        """
+        if self.result_cache is None:
+            return
+        self.result_cache.invalidate(tables)
+        connection = getattr(self.local, 'connection', None) or self.held.get()
+        if connection is None:
+            return
+        status = connection.conn.get_transaction_status()
+        if status != TRANSACTION_STATUS_IDLE:
+            connection.tags.update(tables)
+
+    def iterate(self, query, params, mode, targets, size):
+        """
+        Runs a query on a server-side cursor and yields its results, fetching
+        size rows at a time. The cursor and its connection are released when
+        the consumer is done, even if it stops early.
+        """
+        name = f'psyker_{uuid4().hex}'
+        with self.connection() as connection:
+            conn = connection.conn
+            # NOTE(vesuvium): a cursor held past the end of its transaction
+            # is materialized first, so it runs in a transaction of its own,
+            # or in the one in progress, where it is closed before the end.
+            owned = conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+            if owned:
+                conn.autocommit = False
+            cursor = self.setup_cursor(conn, self.models, name=name,
+                                       hold=not owned)
+            cursor.itersize = size
+            try:
+                cursor.execute(query, params)
+                yield from cursor.iterate(targets, size, mode=mode)
+            finally:
+                try:
+                    cursor.close()
+                    if owned:
+                        conn.commit()
+                finally:
+                    if owned:
+                        conn.autocommit = True
+
+    def count(self, query, params=None, shape=None):
+        with self.connection() as connection:
+            cursor = connection.cursor
+            cursor.execute(self.statement(connection, query, params, shape),
+                           params)
+            return cursor.count()
+
+    async def acount(self, query, params=None):
+        connection = await self.acheckout()
+        try:
+            connection.cursor.execute(query, params)
+            await connection.wait()
+            return connection.cursor.count()
+        finally:
+            self.acheckin(connection)
+
+    def copy_from(self, query, reader, size):
+        with self.connection() as connection:
+            connection.cursor.copy_expert(query, reader, size)
+
+    def copy_to(self, query, file):
+        with self.connection() as connection:
+            connection.cursor.copy_expert(query, file)
+
+    def copy_chunks(self, query, size):
+        """
+        Runs a copy to stdout in a thread and yields the chunks it writes, at
+        most size chunks ahead of the consumer. The copy is cancelled when the
+        consumer stops early.
+        """
+        writer = CopyWriter(size)
+        errors = []
+        with self.connection() as connection:
+
+            def copy():
+                # NOTE(vesuvium): any error is handed to the consumer, which
+                # would otherwise wait forever for the end of the chunks.
+                try:
+                    connection.cursor.copy_expert(query, writer)
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    writer.finish()
+
+            thread = Thread(target=copy, daemon=True)
+            thread.start()
+            try:
+                yield from writer
+            finally:
+                if thread.is_alive():
+                    writer.stop()
+                    connection.conn.cancel()
+                thread.join()
+        if errors:
+            raise errors[0]
+
+    def mogrify(self, query, params):
+        """
+        Binds params client-side, for statements that can't take them such as
+        copy.
+        """
+        with self.connection() as connection:
+            encoding = encodings[connection.conn.encoding]
+            return connection.cursor.mogrify(query, params).decode(encoding)
 
     def sql(self, query):
-        return query.as_string(self.cursor)
+        with self.connection() as connection:
+            return query.as_string(connection.cursor)
+
+    async def asql(self, query):
+        connection = await self.acheckout()
+        try:
+            return query.as_string(connection.cursor)
+        finally:
+            self.acheckin(connection)
 
     def close(self):
-        self.conn.close()
+        self.pool.close()
+        if self.async_pool:
+            self.async_pool.close()
@@ -0,0 +1,60 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from hashlib import md5
+
+from .Sql import Sql
+from .exceptions import IndexMethodError
+
+
+class Index:
+    """
+    An index on one or more columns. Indexes can be unique, use any method
+    of postgres, cover more columns with include, and be partial with a
+    where predicate, given as sql.
+    """
+
+    __slots__ = ('columns', 'name', 'unique', 'method', 'include', 'where')
+
+    methods = ('btree', 'hash', 'gist', 'spgist', 'gin', 'brin')
+
+    def __init__(self, *columns, name=None, unique=False, method=None,
+                 include=(), where=None):
+        if method and method not in self.methods:
+            raise IndexMethodError(method)
+        self.columns = columns
+        self.name = name
+        self.unique = unique
+        self.method = method
+        self.include = tuple(include)
+        self.where = where
+
+    def index_name(self, table):
+        """
+        Gets the name of the index, which defaults to the one postgres would
+        give it, e.g. todos_user_idx. Options are part of default names, so
+        that indexes on the same columns don't share them, e.g.
+        todos_tags_gin_idx or todos_user_key for unique ones.
+        """
+        if self.name:
+            return self.name
+        parts = [table, *self.columns]
+        if self.method and self.method != 'btree':
+            parts.append(self.method)
+        if self.include:
+            parts += ['include', *self.include]
+        if self.where:
+            parts.append(md5(self.where.encode()).hexdigest()[:8])
+        parts.append('key' if self.unique else 'idx')
+        return '_'.join(parts)
+
+    def sql(self, table, concurrently=False):
+        return Sql.index(self.index_name(table), table, self.columns,
+                         self.unique, self.method, self.include, self.where,
+                         concurrently)
+
+    def __repr__(self):
+        return f'<Index({", ".join(self.columns)})>'
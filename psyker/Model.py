@@ -4,15 +4,29 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+import time
+from contextvars import ContextVar
+from keyword import iskeyword
+
+from .CopyReader import CopyReader
+from .ModelMeta import ModelMeta
 from .Query import Query
 from .Sql import Sql
 from .Table import Table
+from .exceptions import PaginationError, ReturningError, RowError
 
 
-class Model:
+class Model(metaclass=ModelMeta):
     __db__ = None
     __table__ = None
-    __query__ = None
+    __query__ = ContextVar('query', default=None)
+    __hydrators__ = None
+    # NOTE(vesuvium): models with a ttl cache their selects and counts, and
+    # a ttl of None uses the default one of the result cache.
+    __ttl__ = False
+    # NOTE(vesuvium): the columns that were left out of the query that
+    # loaded an instance, which are loaded on first access.
+    __deferred__ = frozenset()
     __slots__ = ()
 
     def __init__(self, **kwargs):
@@ -26,6 +40,14 @@ class Model:
         """
         raise NotImplementedError()
 
+    @classmethod
+    def indexes(cls):
+        """
+        Can be implemented in models to declare more indexes, such as
+        composite or partial ones, as a list of Index.
+        """
+        return []
+
     @classmethod
     def setup(cls, db, alias):
         """
@@ -33,17 +55,70 @@ class Model:
         underlying table.
         """
         cls.__db__ = db
+        # NOTE(vesuvium): the pending query is per context, so that threads
+        # and tasks can build queries on the same model at the same time.
+        cls.__query__ = ContextVar(f'{cls.__name__}_query', default=None)
+        cls.__hydrators__ = {}
         cls.__table__ = Table(db, cls.__name__.lower(), **cls.columns(),
-                              alias=alias)
+                              alias=alias, indexes=cls.indexes())
+
+    @classmethod
+    def make_hydrator(cls, columns):
+        """
+        Generates a function that makes an instance straight from a row,
+        storing the values of the columns without going through __init__.
+        Models that override __init__ still go through it. Columns of the
+        table that are not in the row are recorded as deferred.
+        """
+        deferred = frozenset()
+        if cls.__table__ is not None:
+            deferred = frozenset(cls.__table__.columns).difference(columns)
+        if cls.__init__ is not Model.__init__:
+            def hydrate(row):
+                instance = cls(**dict(zip(columns, row)))
+                if deferred:
+                    instance.__deferred__ = deferred
+                return instance
+            return hydrate
+        lines = ['def hydrate(row):', '    instance = new(cls)']
+        for index, column in enumerate(columns):
+            value = f'row[{index}]'
+            if column.isidentifier() and not iskeyword(column):
+                lines.append(f'    instance.{column} = {value}')
+            else:
+                lines.append(f'    setattr(instance, {column!r}, {value})')
+        if deferred:
+            lines.append('    instance.__deferred__ = deferred')
+        lines.append('    return instance')
+        namespace = {'new': object.__new__, 'cls': cls, 'deferred': deferred}
+        exec('\n'.join(lines), namespace)
+        return namespace['hydrate']
 
     @classmethod
-    def create_table(cls):
+    def hydrator(cls, columns):
+        """
+        Gets the hydrator for a tuple of columns, generating it on first use.
+        """
+        hydrate = cls.__hydrators__.get(columns)
+        if hydrate is None:
+            hydrate = cls.make_hydrator(columns)
+            cls.__hydrators__[columns] = hydrate
+        return hydrate
+
+    @classmethod
+    def create_table(cls, concurrently=False):
+        """
+        Creates the table and its indexes. Indexes built concurrently don't
+        lock writes, but can't be built in a transaction.
+        """
         cls.__db__.execute(cls.__table__.sql(), None, None, None, None)
+        for sql in cls.__table__.indexes_sql(concurrently):
+            cls.__db__.execute(sql, None, None, None, None)
 
     @classmethod
     def execute(cls, fetch=None, mode=None):
-        result = cls.__query__.execute(fetch, mode)
-        cls.__query__ = None
+        result = cls.__query__.get().execute(fetch, mode)
+        cls.__query__.set(None)
         return result
 
     def related_as_dictionary(self, values):
@@ -69,20 +144,120 @@ class Model:
             values['id'] = self.id
         return self.related_as_dictionary(values)
 
-    def save(self, fetch='id'):
+    def insert_statement(self, fetch):
         """
-        Saves an instance of the model to the database.
+        Builds the arguments for Db.execute that insert the instance.
         """
-        values = self.__table__.cast(self.as_dictionary())
-        sql = Sql.insert(self.__table__.name, fetch, **values)
-        self.__db__.execute(sql, list(values.values()), None, None, None)
-        if fetch:
-            id = self.__db__.cursor.fetch_returned()
-            return self.select().where(id=id).one()
+        table = self.__table__
+        values = table.cast(self.as_dictionary())
+        returning = table.quoted_columns if fetch else None
+        sql = Sql.insert(table.name, returning, **values)
+        shape = ('insert', table.name, tuple(values), bool(fetch))
+        return (sql, list(values.values()), 'one' if fetch else None, None,
+                [table], shape)
+
+    def save(self, fetch=True):
+        """
+        Saves an instance of the model to the database. With fetch, the saved
+        row is returned as a new instance in the same round trip.
+        """
+        result = self.__db__.execute(*self.insert_statement(fetch))
+        self.__db__.invalidate([self.__table__.name])
+        return result
+
+    async def asave(self, fetch=True):
+        """
+        Awaitable save.
+        """
+        statement = self.insert_statement(fetch)[:-1]
+        result = await self.__db__.aexecute(*statement)
+        self.__db__.invalidate([self.__table__.name])
+        return result
+
+    @staticmethod
+    def row_values(row):
+        """
+        Gets the values of a row given either as instance or dictionary.
+        """
+        if type(row) == dict:
+            return row
+        return row.as_dictionary()
+
+    @classmethod
+    def insert_many(cls, rows, returning=None, page_size=1000):
+        """
+        Inserts many rows, as instances or dictionaries, sending page_size
+        rows per multi-row insert. Returning can be 'id', to get the ids, or
+        '*', to get instances, in the same order as the rows. Rows must all
+        have the same columns.
+        """
+        if returning not in (None, 'id', '*'):
+            raise ReturningError(returning)
+        table = cls.__table__
+        values = [table.cast(cls.row_values(row)) for row in rows]
+        if values == []:
+            return [] if returning else None
+        columns = list(values[0].keys())
+        for value in values:
+            if value.keys() != values[0].keys():
+                raise RowError(table.name, columns)
+        fetch = {None: None, 'id': 'returned'}.get(returning, True)
+        clause = returning
+        if returning == '*':
+            clause = table.quoted_columns
+        statements = {}
+        results = []
+        for start in range(0, len(values), page_size):
+            page = values[start:start + page_size]
+            rows = len(page)
+            if rows not in statements:
+                sql = Sql.insert_many(table.name, columns, rows, clause)
+                statements[rows] = cls.__db__.sql(sql)
+            params = [row[column] for row in page for column in columns]
+            shape = ('insert_many', table.name, tuple(columns), rows,
+                     returning)
+            result = cls.__db__.execute(statements[rows], params, fetch, None,
+                                        [table], shape)
+            if returning:
+                results += result
+        cls.__db__.invalidate([table.name])
+        if returning:
+            return results
+
+    @classmethod
+    def copy_from(cls, rows, columns=None, format='text', analyze=False,
+                  size=65536):
+        """
+        Bulk loads rows with copy, streaming them in chunks of the given size.
+        Columns default to all but the id. Returns the rows loaded and the
+        throughput.
+        """
+        table = cls.__table__
+        if columns is None:
+            columns = [column for column in table.columns if column != 'id']
+        reader = CopyReader(table.copy_lines(rows, columns, format))
+        sql = Sql.copy_from(table.name, columns, format)
+        start = time.perf_counter()
+        cls.__db__.copy_from(sql, reader, size)
+        seconds = time.perf_counter() - start
+        cls.__db__.invalidate([table.name])
+        if analyze:
+            cls.__db__.execute(Sql.analyze(table.name), None, None, None, None)
+        return {'rows': reader.rows, 'seconds': seconds,
+                'rows_per_second': reader.rows / seconds if seconds else 0.0}
 
     @classmethod
     def update(cls, **values):
-        cls.__query__ = Query.update(cls.__db__, cls.__table__, values)
+        cls.__query__.set(Query.update(cls.__db__, cls.__table__, values))
+        return cls
+
+    @classmethod
+    def returning(cls):
+        """
+        Makes an update or a delete return the affected rows, which are then
+        fetched with the usual terminals, e.g. get or dictionaries.
+        """
+        cls.__query__.get().returning()
         return cls
 
     @classmethod
@@ -90,7 +265,7 @@ class Model:
         """
         Adds a where clause to the current query
         """
-        cls.__query__.where(**conditions)
+        cls.__query__.get().where(**conditions)
         return cls
 
     @classmethod
@@ -100,26 +275,36 @@ class Model:
         """
         if type(on) == tuple:
             on = (cls.__db__.get_table(on[0]), on[1])
-        cls.__query__.join(cls.__db__.get_table(table), on, join_type)
+        table = cls.__db__.get_table(table)
+        cls.__query__.get().join(table, on, join_type)
         return cls
 
     @classmethod
     def select(cls, **conditions):
-        cls.__query__ = Query.select(cls.__db__, cls.__table__)
+        query = Query.select(cls.__db__, cls.__table__)
+        query.ttl = cls.__ttl__
+        cls.__query__.set(query)
         if conditions:
-            cls.__query__.where(**conditions)
+            cls.__query__.get().where(**conditions)
         return cls
 
     @classmethod
-    def count(cls, **conditions):
-        cls.__query__ = Query.count(cls.__db__, cls.__table__)
+    def count(cls, estimate=False, **conditions):
+        """
+        Counts rows. Estimates come from the statistics of the planner
+        instead: the size of the table, or the rows the plan expects when
+        there are conditions.
+        """
+        query = Query.count(cls.__db__, cls.__table__, estimate)
+        query.ttl = cls.__ttl__
+        cls.__query__.set(query)
         if conditions:
-            cls.__query__.where(**conditions)
+            cls.__query__.get().where(**conditions)
         return cls
 
     @classmethod
     def get(cls):
-        if cls.__query__ is None:
+        if cls.__query__.get() is None:
             cls.select()
         return cls.execute(fetch=True)
 
@@ -129,35 +314,204 @@ class Model:
         Produces a list of dictionaries instead of model instances, at the
         cursor level.
         """
-        if cls.__query__ is None:
+        if cls.__query__.get() is None:
             cls.select()
         return cls.execute(fetch=True, mode='dictionaries')
 
+    @classmethod
+    def tuples(cls):
+        """
+        Produces the rows as plain tuples, the way the driver returns them.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        return cls.execute(fetch=True, mode='tuples')
+
+    @classmethod
+    def rows(cls):
+        """
+        Produces the rows as namedtuples, with a type that is made once for
+        each set of columns.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        return cls.execute(fetch=True, mode='rows')
+
+    @classmethod
+    def columnar(cls):
+        """
+        Produces a dictionary of column arrays, filled straight from the
+        rows. Arrays are NumPy arrays when NumPy is installed, and lists
+        otherwise.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        return cls.execute(fetch=True, mode='columns')
+
+    @classmethod
+    def exists(cls):
+        """
+        Checks whether the current query has any result, fetching at most
+        one row.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().exists()
+        return cls.execute()
+
     @classmethod
     def dictionary(cls):
-        if cls.__query__ is None:
+        if cls.__query__.get() is None:
             cls.select()
         return cls.execute(fetch='one', mode='dictionaries')
 
     @classmethod
     def one(cls):
-        if cls.__query__ is None:
+        if cls.__query__.get() is None:
             cls.select()
         return cls.execute(fetch='one')
 
+    @classmethod
+    def aget(cls):
+        """
+        Awaitable get. The query is taken right away rather than when the
+        result is awaited, so that chains built in the meantime don't affect
+        it.
+        """
+        return cls.pop_query().aexecute(True, None)
+
+    @classmethod
+    def aone(cls):
+        return cls.pop_query().aexecute('one', None)
+
+    @classmethod
+    def acount(cls, estimate=False, **conditions):
+        cls.count(estimate, **conditions)
+        return cls.pop_query().aexecute(None, None)
+
+    @classmethod
+    def aexists(cls):
+        query = cls.pop_query()
+        query.exists()
+        return query.aexecute(None, None)
+
+    @classmethod
+    def pop_query(cls):
+        """
+        Takes the current query, defaulting to a select, for terminals that
+        don't go through Model.execute.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        query = cls.__query__.get()
+        cls.__query__.set(None)
+        return query
+
+    @classmethod
+    def copy_to(cls, file, format='csv'):
+        """
+        Exports the results of the current query to a file with copy.
+        """
+        return cls.pop_query().copy_to(file, format)
+
+    @classmethod
+    def copy_chunks(cls, format='csv', size=16):
+        """
+        Exports the results of the current query with copy, yielding the raw
+        chunks as they arrive.
+        """
+        return cls.pop_query().copy_chunks(format, size)
+
+    @classmethod
+    def iterate(cls, itersize=2000, mode=None):
+        """
+        Lazily yields the results of the current query, as models or
+        dictionaries, fetching itersize rows at a time from a server-side
+        cursor.
+        """
+        return cls.pop_query().iterate(itersize, mode)
+
+    @classmethod
+    def prefetch(cls, *names):
+        """
+        Loads the given relationships of the results, forward or reverse,
+        with one more query for each, e.g. Todos.prefetch('users').
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().prefetch(*names)
+        return cls
+
+    @classmethod
+    def only(cls, *names, **joined):
+        """
+        Selects only the given columns, and the id. Joined tables are
+        projected by name, e.g. Todos.only('title', users=('name', )).
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().only(*names, **joined)
+        return cls
+
+    @classmethod
+    def defer(cls, *names, **joined):
+        """
+        Selects all columns but the given ones. Deferred columns of instances
+        are loaded when they are first accessed.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().defer(*names, **joined)
+        return cls
+
+    @classmethod
+    def cached(cls, ttl=None):
+        """
+        Caches the results of the current query in the result cache, for ttl
+        seconds or for the default ttl of the cache.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().cached(ttl)
+        return cls
+
+    @classmethod
+    def aggregate(cls, **aggregates):
+        """
+        Selects named aggregates, computed by postgres, e.g.
+        Payments.aggregate(total=('sum', 'amount'), n='count'). Aggregate
+        queries produce dictionaries by default and can't be joined.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().aggregate(**aggregates)
+        return cls
+
+    @classmethod
+    def group_by(cls, *columns):
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().group_by(*columns)
+        return cls
+
+    @classmethod
+    def having(cls, **conditions):
+        cls.__query__.get().having(**conditions)
+        return cls
+
     @classmethod
     def order_by(cls, **conditions):
-        cls.__query__.order_by(**conditions)
+        cls.__query__.get().order_by(**conditions)
         return cls
 
     @classmethod
     def random(cls):
-        cls.__query__.random()
+        cls.__query__.get().random()
         return cls
 
     @classmethod
     def limit(cls, limit, offset=None):
-        cls.__query__.limit(limit, offset)
+        cls.__query__.get().limit(limit, offset)
         return cls
 
     @classmethod
@@ -167,21 +521,55 @@ class Model:
         """
         return cls.limit(items, offset=page * items)
 
+    @classmethod
+    def after(cls, token=None, **keys):
+        """
+        Keyset pagination: seeks past the row with the given order values, or
+        past the page the token comes from. The id is part of the order, as
+        a tie-breaker, so its value must be given too.
+        """
+        if cls.__query__.get() is None:
+            cls.select()
+        cls.__query__.get().after(token, **keys)
+        return cls
+
+    @classmethod
+    def page(cls, mode=None):
+        """
+        Gets a page of results and the token for the next one, which is None
+        when the page is empty. Pages are made of models, dictionaries or
+        rows, which the token is read from by name.
+        """
+        query = cls.pop_query()
+        if mode not in (None, 'dictionaries', 'rows'):
+            raise PaginationError(query.order, mode=mode)
+        columns = query.seek_order().keys()
+        items = query.execute(True, mode)
+        if not items:
+            return items, None
+        last = items[-1]
+        if type(last) == dict:
+            values = [last[column] for column in columns]
+        else:
+            values = [getattr(last, column) for column in columns]
+        return items, query.encode_token(values)
+
     @classmethod
     def delete(cls, **conditions):
-        cls.__query__ = Query.delete(cls.__db__, cls.__table__)
+        cls.__query__.set(Query.delete(cls.__db__, cls.__table__))
         if conditions:
-            cls.__query__.where(**conditions)
+            cls.__query__.get().where(**conditions)
         return cls
 
     @classmethod
     def truncate(cls, cascade=None):
-        cls.__query__ = Query.truncate(cls.__db__, cls.__table__, cascade)
+        query = Query.truncate(cls.__db__, cls.__table__, cascade)
+        cls.__query__.set(query)
         return cls.execute()
 
     @classmethod
     def drop(cls, cascade=None):
-        cls.__query__ = Query.drop(cls.__db__, cls.__table__, cascade)
+        cls.__query__.set(Query.drop(cls.__db__, cls.__table__, cascade))
         return cls.execute()
 
     @classmethod
@@ -189,7 +577,31 @@ class Model:
         """
         Produces the SQL of the current query.
         """
-        return cls.__query__.sql()
+        return cls.__query__.get().sql()
+
+    def load_deferred(self, name):
+        """
+        Loads the value of a column that was left out of a query.
+        """
+        table = self.__table__.project((name, ))
+        sql = Sql.join(Sql.select(table), Sql.where([('id', '=')]))
+        row = self.__db__.execute(sql, [self.id], 'one', 'dictionaries',
+                                  [table])
+        if row is None:
+            raise AttributeError(name)
+        return row[name]
+
+    def __getattr__(self, name):
+        # NOTE(vesuvium): only called when the attribute is not set. Only
+        # the columns that the instance was loaded without are loaded.
+        if name == '__deferred__':
+            return frozenset()
+        if name not in self.__deferred__:
+            raise AttributeError(name)
+        value = self.load_deferred(name)
+        setattr(self, name, value)
+        self.__deferred__ = self.__deferred__.difference((name, ))
+        return value
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -0,0 +1,70 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from keyword import iskeyword
+from types import MemberDescriptorType
+
+
+class ModelMeta(type):
+    """
+    Generates the __slots__ of models from their columns and relationships,
+    so that instances don't carry a __dict__. Models with columns also get a
+    slot for the columns they were loaded without. A __dict__ slot is added
+    as a fallback for extra attributes, such as reverse relationships, unless
+    the model is declared with fallback=False. Models that declare their own
+    __slots__ are left alone.
+    """
+
+    def __new__(cls, name, bases, namespace, fallback=True, **kwargs):
+        if '__slots__' in namespace:
+            return super().__new__(cls, name, bases, namespace, **kwargs)
+        # NOTE(vesuvium): slots can only be set when a class is created, so
+        # a draft is made first to get the columns.
+        draft = super().__new__(cls, name, bases, dict(namespace), **kwargs)
+        try:
+            columns = draft.columns()
+        except NotImplementedError:
+            columns = {}
+        except Exception:
+            return draft
+        slots = cls.slots(bases, namespace, columns, fallback)
+        namespace = {**namespace, '__slots__': slots}
+        return super().__new__(cls, name, bases, namespace, **kwargs)
+
+    @staticmethod
+    def names(columns):
+        """
+        Gets the attribute names of instances: columns, the primary key, and
+        the tables of forward relationships.
+        """
+        names = list(columns) + ['id']
+        for field in columns.values():
+            if hasattr(field, 'relationship'):
+                relationship = field.relationship()
+                if relationship:
+                    names.append(relationship)
+        return names
+
+    @classmethod
+    def slots(cls, bases, namespace, columns, fallback=True):
+        slots = []
+        if columns:
+            for name in cls.names(columns):
+                if not name.isidentifier() or iskeyword(name):
+                    continue
+                if name in namespace or name in slots:
+                    continue
+                if any(hasattr(base, name) for base in bases):
+                    continue
+                slots.append(name)
+            deferred = [getattr(base, '__deferred__', None) for base in bases]
+            if not any(type(d) == MemberDescriptorType for d in deferred):
+                slots.append('__deferred__')
+        if not any(base.__weakrefoffset__ for base in bases):
+            slots.append('__weakref__')
+        if fallback and not any(base.__dictoffset__ for base in bases):
+            slots.append('__dict__')
+        return tuple(slots)
@@ -0,0 +1,193 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+from logging import getLogger
+from threading import Condition, Event, Thread
+
+from .exceptions import PoolTimeout
+
+
+logger = getLogger(__name__)
+
+
+class Pool:
+    """
+    A thread-safe pool of connections, made by the given factory. Connections
+    are checked before being handed out, and closed when they get older than
+    lifetime or stay idle for longer than idle seconds.
+    """
+
+    __slots__ = ('factory', 'minimum', 'maximum', 'timeout', 'lifetime',
+                 'idle', 'ping', 'connections', 'size', 'condition',
+                 'stopped', 'reaper')
+
+    def __init__(self, factory, minimum=1, maximum=10, timeout=30.0,
+                 lifetime=3600.0, idle=600.0, ping=1.0):
+        self.factory = factory
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.timeout = timeout
+        self.lifetime = lifetime
+        self.idle = idle
+        self.ping = ping
+        self.connections = deque()
+        self.size = 0
+        self.condition = Condition()
+        self.stopped = Event()
+        self.reaper = None
+
+    def interval(self):
+        """
+        How often the reaper runs, or None when nothing needs reaping.
+        """
+        timeouts = [value for value in (self.idle, self.lifetime) if value]
+        if timeouts:
+            return min(timeouts) / 2
+        return None
+
+    def open(self):
+        """
+        Opens the minimum number of connections and starts the reaper.
+        """
+        self.fill()
+        interval = self.interval()
+        if interval:
+            self.reaper = Thread(target=self.reap_every, args=(interval, ),
+                                 daemon=True)
+            self.reaper.start()
+
+    def make(self):
+        """
+        Makes a connection for a slot that was already reserved, freeing the
+        slot if that fails.
+        """
+        try:
+            return self.factory()
+        except Exception:
+            self.release()
+            raise
+
+    def release(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def fill(self):
+        """
+        Opens connections until there are at least minimum.
+        """
+        while True:
+            with self.condition:
+                if self.stopped.is_set() or self.size >= self.minimum:
+                    return
+                self.size += 1
+            connection = self.make()
+            with self.condition:
+                self.connections.append(connection)
+                self.condition.notify()
+
+    def take(self, deadline):
+        """
+        Takes the most recently used idle connection, or reserves a slot for
+        a new one, in which case it returns None. Must hold the condition.
+        """
+        while not self.connections:
+            if self.size < self.maximum:
+                self.size += 1
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolTimeout(self.timeout)
+            self.condition.wait(remaining)
+        return self.connections.pop()
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.condition:
+                connection = self.take(deadline)
+            if connection is None:
+                return self.make()
+            now = time.monotonic()
+            expired = connection.expired(self.lifetime, now)
+            if not expired and connection.healthy(self.ping, now):
+                return connection
+            self.discard(connection)
+
+    def checkin(self, connection):
+        now = time.monotonic()
+        if connection.broken() or connection.expired(self.lifetime, now):
+            return self.discard(connection)
+        connection.used = now
+        with self.condition:
+            if not self.stopped.is_set():
+                self.connections.append(connection)
+                self.condition.notify()
+                return None
+        return self.discard(connection)
+
+    def discard(self, connection):
+        connection.close()
+        self.release()
+
+    def reap(self):
+        """
+        Closes expired connections and those that have been idle for too
+        long, keeping at least minimum open. Returns how many were closed.
+        """
+        now = time.monotonic()
+        stale = []
+        with self.condition:
+            # NOTE(vesuvium): the least recently used connections are at the
+            # left, so they are the first to go.
+            for connection in list(self.connections):
+                expired = connection.expired(self.lifetime, now)
+                idle = connection.idle(self.idle, now)
+                if expired or (idle and self.size > self.minimum):
+                    self.connections.remove(connection)
+                    self.size -= 1
+                    stale.append(connection)
+            self.condition.notify(len(stale))
+        for connection in stale:
+            connection.close()
+        self.fill()
+        return len(stale)
+
+    def reap_every(self, interval):
+        """
+        Reaps until the pool is closed. Errors, such as failing to reconnect
+        while refilling, are logged so that the reaper keeps running.
+        """
+        while not self.stopped.wait(interval):
+            try:
+                self.reap()
+            except Exception:
+                logger.exception('Reaping the pool failed')
+
+    def stats(self):
+        with self.condition:
+            idle = len(self.connections)
+            return {'size': self.size, 'idle': idle,
+                    'used': self.size - idle}
+
+    def close(self):
+        """
+        Closes the idle connections. Connections that are checked out are
+        closed when they are checked in.
+        """
+        self.stopped.set()
+        with self.condition:
+            connections = list(self.connections)
+            self.connections.clear()
+            self.size -= len(connections)
+            self.condition.notify_all()
+        for connection in connections:
+            connection.close()
+
+    def __repr__(self):
+        return f'<Pool({self.size}/{self.maximum})>'
@@ -0,0 +1,83 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from .Sql import Sql
+from .exceptions import RelationshipError
+
+
+class Prefetch:
+    """
+    Loads the related items of many items with a single query, matching
+    the related column against any of the keys of the items, and sets them
+    on the items as lists.
+    """
+
+    __slots__ = ('related', 'column', 'key')
+
+    def __init__(self, related, column, key):
+        self.related = related
+        self.column = column
+        self.key = key
+
+    @classmethod
+    def make(cls, table, name):
+        """
+        Finds the relationship of a table with the given name, among
+        foreign columns and then among the foreign columns of other tables
+        that reference it.
+        """
+        for related in table.relationships:
+            if related.name == name:
+                for column in table.columns.values():
+                    if column.relationship() == name:
+                        reference = column.options['reference_column']
+                        return cls(related, reference, column.name)
+        for related in table.reverse_relationships:
+            if related.name == name:
+                for column in related.columns.values():
+                    if column.relationship() == table.name:
+                        reference = column.options['reference_column']
+                        return cls(related, column.name, reference)
+        raise RelationshipError(table.name, name)
+
+    @staticmethod
+    def value(item, name):
+        if type(item) == dict:
+            return item[name]
+        return getattr(item, name)
+
+    @staticmethod
+    def assign(item, name, value):
+        if type(item) == dict:
+            item[name] = value
+        else:
+            setattr(item, name, value)
+
+    def keys(self, items):
+        keys = {self.value(item, self.key) for item in items}
+        keys.discard(None)
+        return list(keys)
+
+    def statement(self):
+        """
+        Builds the query for the related items. It has no shape, because
+        prepared statements would send the keys as text[], which postgres
+        refuses to compare with the cast array.
+        """
+        array_type = self.related.columns[self.column].array_type()
+        return Sql.join(Sql.select(self.related),
+                        Sql.any(self.column, array_type))
+
+    def stitch(self, items, related):
+        """
+        Sets the related items on the items they belong to.
+        """
+        groups = {}
+        for item in related:
+            groups.setdefault(self.value(item, self.column), []).append(item)
+        for item in items:
+            group = groups.get(self.value(item, self.key), ())
+            self.assign(item, self.related.name, list(group))
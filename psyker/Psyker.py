@@ -6,6 +6,7 @@
 # -*- coding: utf-8 -*-
 from .Db import Db
 from .ModelFactory import ModelFactory
+from .Session import Session
 
 
 class Psyker:
@@ -31,22 +32,40 @@ class Psyker:
         Creates a model using ModelFactory so that is ready for querying.
         """
         model = ModelFactory.make(name, fields)
-        model.setup(self.db, len(self.models))
+        model.setup(self.db, f't{len(self.models)}')
         self.add_models(model)
-        self.db.cursor.models = self.models
+        self.db.models = self.models
         self.create_tables()
         return model
 
-    def create_tables(self):
+    def create_tables(self, concurrently=False):
+        """
+        Creates the tables of the models and their indexes, optionally
+        building indexes with create index concurrently.
+        """
         for model in self.models.values():
-            model.create_table()
+            model.create_table(concurrently)
 
-    def start(self, url):
-        self.db = Db(url, self.models)
+    def start(self, url, **options):
+        self.db = Db(url, self.models, **options)
         self.db.start()
         self.setup_models(self.db, list(self.models.values()))
         self.create_tables()
 
+    def transaction(self, isolation=None, readonly=False):
+        """
+        Runs a block in a transaction, with 'with' or 'async with'.
+        """
+        return self.db.transaction(isolation, readonly)
+
+    @staticmethod
+    def session():
+        """
+        Opens a session, in which rows that are loaded again give back the
+        same instances, with 'with' or 'async with'.
+        """
+        return Session()
+
     def connect(self):
         """
         Connects to the database.
@@ -4,7 +4,14 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+import base64
+import json
+
+from .Prefetch import Prefetch
 from .Sql import Sql
+from .Table import Table
+from .exceptions import (AggregateError, ColumnError, PaginationError,
+                         RelationshipError)
 
 
 class Query:
@@ -15,19 +22,33 @@ class Query:
     build the correct SQL statement. Joins are the most prominent example.
     """
 
-    __slots__ = ('db', 'query_type', 'targets', 'params', 'conditions',
-                 'order', 'options', '_limit', '_offset')
+    __slots__ = ('db', 'query_type', 'targets', 'conditions', 'order',
+                 'options', '_limit', '_offset', '_returning', 'keyset',
+                 'keyset_values', 'ttl', 'prefetches', 'aggregates', 'group',
+                 '_having')
+
+    writers = ('update', 'delete', 'truncate', 'drop')
+    counters = ('count', 'estimate', 'exists')
+    unprepared = ('estimate', 'truncate', 'drop')
+    functions = ('count', 'sum', 'avg', 'min', 'max')
 
     def __init__(self, db, query_type, table, **kwargs):
         self.db = db
         self.targets = [table]
         self.query_type = query_type
-        self.params = []
         self.conditions = None
         self.order = None
         self.options = kwargs
         self._limit = None
         self._offset = None
+        self._returning = None
+        self.keyset = None
+        self.keyset_values = []
+        self.ttl = False
+        self.prefetches = []
+        self.aggregates = {}
+        self.group = ()
+        self._having = None
 
     @staticmethod
     def parse_condition(condition):
@@ -42,6 +63,8 @@ class Query:
         """
         column = condition[0]
         value = condition[1]
+        if type(value) not in (str, tuple):
+            return (column, '=', value)
         if value[0:2] in ('>=', '<='):
             return (column, value[0:2], value[2:])
         elif value[0] in ('!', '>', '<'):
@@ -56,7 +79,7 @@ class Query:
         Creates the head of an sql statement, according to the query type.
         """
         if query_type == 'select':
-            return Sql.select(targets[0].name, targets[0].columns)
+            return Sql.select(targets[0])
         elif query_type == 'update':
             return Sql.update(targets[0].name, **targets[1])
         elif query_type == 'delete':
@@ -66,10 +89,30 @@ class Query:
         elif query_type == 'drop':
             return Sql.drop_table(targets[0].name, options['cascade'])
         elif query_type == 'count':
-            return Sql.count(targets[0].name)
+            return Sql.count(targets[0])
+        elif query_type == 'estimate':
+            return Sql.estimate(targets[0])
+        elif query_type in ('exists', 'explain'):
+            if len(targets) > 1:
+                return Sql.join_statement(targets, options)
+            return Sql.select_one(targets[0])
         elif query_type == 'join':
             return Sql.join_statement(targets, options)
 
+    @classmethod
+    def fingerprint(cls, value):
+        """
+        Reduces tables, options and values to hashable items that describe
+        only the shape of a query.
+        """
+        if isinstance(value, Table):
+            return (value.name, value.alias, tuple(value.columns))
+        elif type(value) == dict:
+            return tuple((k, cls.fingerprint(v)) for k, v in value.items())
+        elif type(value) in (list, tuple):
+            return tuple(cls.fingerprint(item) for item in value)
+        return value
+
     @staticmethod
     def select(db, table):
         return Query(db, 'select', table)
@@ -78,13 +121,13 @@ class Query:
     def update(db, table, values):
         query = Query(db, 'update', table)
         query.targets = (table, values)
-        query.params = list(values.values())
         return query
 
     @staticmethod
     def delete(db, table, **conditions):
         query = Query(db, 'delete', table)
-        query.params = list(conditions.values())
+        if conditions:
+            query.where(**conditions)
         return query
 
     @staticmethod
@@ -96,20 +139,25 @@ class Query:
         return Query(db, 'drop', table, cascade=cascade)
 
     @staticmethod
-    def count(db, table):
+    def count(db, table, estimate=False):
+        if estimate:
+            return Query(db, 'estimate', table)
         return Query(db, 'count', table)
 
     @staticmethod
-    def on(targets, on):
+    def on(targets, on, columns=None):
         """
         Normalizes on to a (table, column) tuple.
 
         This allows to specify the table of a complex join, without making
-        simple joins harder.
+        simple joins harder. columns are those of the first target before
+        any projection, and default to its current ones.
         """
         if type(on) == tuple:
             return (on[0], on[1], 'id')
-        if on in targets[0].columns:
+        if columns is None:
+            columns = targets[0].columns
+        if on in columns:
             return (targets[0], on, 'id')
         # NOTE(vesuvium): when performing a one_to_many we switch id and on
         # Clearly, if the first target does not have the on column, than the
@@ -121,17 +169,98 @@ class Query:
         """
         Adds a join fragment to the current query.
         """
+        if self.query_type == 'aggregate':
+            raise AggregateError('aggregate', table.name)
         if join_type is None:
             join_type = 'join'
+        # NOTE(vesuvium): the first target may be projected already, so the
+        # direction of the join is found on all of its columns.
+        columns = self.db.get_table(self.targets[0].name).columns
         self.targets.append(table)
         self.query_type = join_type
-        self.options[table.name] = self.on(self.targets, on)
+        self.options[table.name] = self.on(self.targets, on, columns)
+
+    def project(self, names, joined, deferred):
+        """
+        Replaces targets with copies that have fewer columns. Names are
+        columns of the first target, and joined maps the names of joined
+        tables to their columns.
+        """
+        projections = {**joined}
+        if names:
+            projections[self.targets[0].name] = names
+        for index, table in enumerate(self.targets):
+            columns = projections.pop(table.name, None)
+            if columns is None:
+                continue
+            if type(columns) == str:
+                columns = (columns, )
+            if deferred:
+                self.targets[index] = table.defer(columns)
+            else:
+                self.targets[index] = table.project(columns)
+        for name in projections:
+            raise RelationshipError(self.targets[0].name, name)
+        self.prefetch_keys()
+
+    def only(self, *names, **joined):
+        self.project(names, joined, False)
+
+    def defer(self, *names, **joined):
+        self.project(names, joined, True)
 
     def where(self, **conditions):
         self.conditions = [
             self.parse_condition(condition) for condition in conditions.items()
         ]
-        self.params = [condition[2] for condition in self.conditions]
+
+    @classmethod
+    def make_aggregate(cls, table, aggregate):
+        """
+        Normalizes an aggregate to a (function, column) tuple. A function
+        alone, such as 'count', aggregates rows.
+        """
+        if type(aggregate) == str:
+            aggregate = (aggregate, None)
+        function, column = aggregate
+        if function not in cls.functions:
+            raise AggregateError(function)
+        if column is not None and column not in table.columns:
+            raise ColumnError(table.name, column)
+        return (function, column)
+
+    def ungrouped(self, function):
+        """
+        Ensures the query has no joins, since aggregates are computed on the
+        first target only.
+        """
+        if len(self.targets) > 1:
+            raise AggregateError(function, self.targets[1].name)
+
+    def aggregate(self, **aggregates):
+        self.ungrouped('aggregate')
+        table = self.targets[0]
+        for name, aggregate in aggregates.items():
+            self.aggregates[name] = self.make_aggregate(table, aggregate)
+        self.query_type = 'aggregate'
+
+    def group_by(self, *columns):
+        self.ungrouped('group_by')
+        table = self.targets[0]
+        for column in columns:
+            if column not in table.columns:
+                raise ColumnError(table.name, column)
+        self.group = columns
+        self.query_type = 'aggregate'
+
+    def having(self, **conditions):
+        """
+        Filters groups. Conditions can be on aggregates, by their name, or on
+        grouped columns.
+        """
+        self._having = [
+            self.parse_condition(condition) for condition in conditions.items()
+        ]
 
     def order_by(self, **order):
         self.order = order
@@ -143,27 +272,350 @@ class Query:
         # NOTE(vesuvium): limits are passed in parameters, so Sql needs
         # to create only the placeholder
         self._limit = limit
-        self.params.append(limit)
-        if offset:
-            self._offset = offset
+        self._offset = offset
+
+    @staticmethod
+    def encode_token(values):
+        """
+        Encodes the keyset values of a row in an opaque token.
+        """
+        data = json.dumps(values, default=str).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    @staticmethod
+    def decode_token(token):
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+
+    def seek_order(self, keys=()):
+        """
+        Gets the order used for keyset pagination, ordering by the given keys
+        or by id when no order was set. The id is added last when missing,
+        so that rows sharing the other values are not skipped.
+        """
+        if self.order is None:
+            self.order = {key: 'asc' for key in keys} or {'id': 'asc'}
+        if type(self.order) != dict:
+            raise PaginationError(self.order)
+        directions = set(value.lower() for value in self.order.values())
+        if len(directions) != 1:
+            raise PaginationError(self.order)
+        if 'id' not in self.order and 'id' in self.targets[0].columns:
+            self.order = {**self.order, 'id': directions.pop()}
+        return self.order
+
+    def after(self, token=None, **keys):
+        """
+        Seeks past a row, given its order values or the token of a page. All
+        the order columns must have the same direction, so that they can be
+        compared as a row.
+        """
+        order = self.seek_order(keys)
+        columns = tuple(order.keys())
+        if token:
+            values = self.decode_token(token)
+            if len(values) != len(columns):
+                raise PaginationError(order)
+        else:
+            for column in columns:
+                if column not in keys:
+                    raise PaginationError(order, column)
+            values = [keys[column] for column in columns]
+        operator = '>'
+        if list(order.values())[0].lower() == 'desc':
+            operator = '<'
+        self.keyset = (columns, operator)
+        self.keyset_values = values
+
+    def returning(self):
+        self._returning = '*'
+
+    def exists(self):
+        self.query_type = 'exists'
+
+    @staticmethod
+    def estimated(value):
+        """
+        Gets the row estimate from the plan of an explain, or passes counts
+        through.
+        """
+        if type(value) == list:
+            return int(value[0]['Plan']['Plan Rows'])
+        return value
+
+    def cached(self, ttl=None):
+        """
+        Caches the results of the query for ttl seconds, or for the default
+        ttl of the result cache.
+        """
+        self.ttl = ttl
+
+    def prefetch(self, *names):
+        """
+        Loads the given relationships of the results with one more query
+        each, instead of joining them.
+        """
+        table = self.db.get_table(self.targets[0].name)
+        self.prefetches += [Prefetch.make(table, name) for name in names]
+        self.prefetch_keys()
+
+    def prefetch_keys(self):
+        """
+        Adds the keys that relationships are prefetched on to a projected
+        first target, since items are matched on them.
+        """
+        table = self.targets[0]
+        keys = [p.key for p in self.prefetches if p.key not in table.columns]
+        if keys:
+            full = self.db.get_table(table.name)
+            self.targets[0] = full.project((*table.columns, *keys))
+
+    def prefetched(self, result, fetch, mode):
+        """
+        Gets the items that relationships are prefetched for. Only models
+        and dictionaries can hold related items.
+        """
+        if not self.prefetches or not result:
+            return []
+        if mode not in (None, 'dictionaries'):
+            return []
+        if fetch == 'one':
+            return [result]
+        if fetch is True:
+            return result
+        return []
+
+    def load(self, result, fetch, mode):
+        items = self.prefetched(result, fetch, mode)
+        if items:
+            for prefetch in self.prefetches:
+                keys = prefetch.keys(items)
+                related = []
+                if keys:
+                    related = self.db.execute(prefetch.statement(), [keys],
+                                              True, mode, [prefetch.related])
+                prefetch.stitch(items, related)
+        return result
+
+    async def aload(self, result, fetch, mode):
+        items = self.prefetched(result, fetch, mode)
+        if items:
+            for prefetch in self.prefetches:
+                keys = prefetch.keys(items)
+                related = []
+                if keys:
+                    sql = prefetch.statement()
+                    related = await self.db.aexecute(sql, [keys], True, mode,
+                                                     [prefetch.related])
+                prefetch.stitch(items, related)
+        return result
+
+    def cacheable(self, fetch):
+        if self.ttl is False or self.query_type in self.writers:
+            return False
+        return bool(fetch) or self.query_type in self.counters
+
+    def written(self):
+        """
+        Gets the names of the tables that a write changes. Cascading
+        truncates and drops change the tables referencing this one too.
+        """
+        table = self.targets[0]
+        names = [table.name]
+        if self.options.get('cascade'):
+            names += [related.name for related in table.reverse_relationships]
+        return names
+
+    def tables(self):
+        """
+        Gets the tables whose columns the query produces. Updates keep their
+        values among the targets, so they are left out.
+        """
+        if self.query_type == 'update':
+            return self.targets[:1]
+        if self.query_type == 'aggregate':
+            return [self.targets[0].aggregated(self.group, self.aggregates)]
+        return self.targets
+
+    def materialized(self, mode):
+        """
+        Gets the mode that results are made in. Aggregates don't make
+        models, so they default to dictionaries.
+        """
+        if mode is None and self.query_type == 'aggregate':
+            return 'dictionaries'
+        return mode
 
     def build(self):
-        sql = self.head(self.query_type, self.targets, self.options)
+        query_type = self.query_type
+        if query_type == 'estimate' and self.conditions:
+            query_type = 'explain'
+        if query_type == 'aggregate':
+            sql = Sql.aggregate(self.targets[0], self.group, self.aggregates)
+        else:
+            sql = self.head(query_type, self.targets, self.options)
+        if query_type == 'estimate':
+            return sql
         if self.conditions:
             sql = Sql.join(sql, Sql.where(self.conditions))
+        if self.keyset:
+            conjunction = 'and' if self.conditions else 'where'
+            sql = Sql.join(sql, Sql.keyset(*self.keyset, conjunction))
+        if self.group:
+            sql = Sql.join(sql, Sql.group_by(self.group))
+        if self._having:
+            sql = Sql.join(sql, Sql.having(self._having, self.aggregates))
         if self.order == 'random':
             sql = Sql.join(sql, Sql.random())
         elif self.order:
             sql = Sql.join(sql, Sql.order_by(**self.order))
         if self._limit:
             sql = Sql.join(sql, Sql.limit(self._offset))
+        if self._returning:
+            columns = self.targets[0].quoted_columns
+            sql = Sql.join(sql, Sql.returning(columns))
+        if query_type == 'exists':
+            return Sql.exists(sql, self._limit is None)
+        if query_type == 'explain':
+            return Sql.explain(sql)
+        return sql
+
+    @property
+    def params(self):
+        """
+        Gets the parameters of the query, in the order of their placeholders
+        in the sql that build produces.
+        """
+        if self.query_type == 'estimate' and not self.conditions:
+            return []
+        params = []
+        if self.query_type == 'update':
+            params += self.targets[1].values()
+        if self.conditions:
+            params += [condition[2] for condition in self.conditions]
+        if self.keyset:
+            params += self.keyset_values
+        if self._having:
+            params += [condition[2] for condition in self._having]
+        if self._limit:
+            params.append(self._limit)
+            if self._offset:
+                params.append(self._offset)
+        return params
+
+    def shape(self):
+        """
+        Fingerprints the query. Queries with the same shape produce the same
+        sql and differ only in their parameters.
+        """
+        conditions = None
+        if self.conditions:
+            conditions = tuple((c[0], c[1]) for c in self.conditions)
+        targets = self.targets
+        if self.query_type == 'update':
+            targets = (targets[0], tuple(targets[1].keys()))
+        shape = (self.query_type, self.fingerprint(targets),
+                 self.fingerprint(self.options), conditions,
+                 self.fingerprint(self.order), bool(self._limit),
+                 bool(self._offset), self._returning, self.keyset)
+        if self.query_type == 'aggregate':
+            having = None
+            if self._having:
+                having = tuple((c[0], c[1]) for c in self._having)
+            shape += (self.fingerprint(self.aggregates), self.group, having)
+        return shape
+
+    def compile(self, shape):
+        """
+        Produces the rendered sql of the query, reusing the one rendered for
+        a previous query of the same shape when the statement cache is
+        enabled.
+        """
+        cache = self.db.statements
+        if cache is None:
+            return self.build()
+        sql = cache.get(shape)
+        if sql is None:
+            sql = self.db.sql(self.build())
+            cache.set(shape, sql)
+        return sql
+
+    async def acompile(self, shape):
+        """
+        Like compile, rendering on an asynchronous connection.
+        """
+        cache = self.db.statements
+        if cache is None:
+            return self.build()
+        sql = cache.get(shape)
+        if sql is None:
+            sql = await self.db.asql(self.build())
+            cache.set(shape, sql)
         return sql
 
     def sql(self):
         return self.db.sql(self.build())
 
+    def copy(self, format):
+        """
+        Wraps the query in a copy to stdout. Since copy does not take
+        parameters, they are bound client-side.
+        """
+        query = self.db.mogrify(self.compile(self.shape()), self.params)
+        return Sql.copy_to(query, format)
+
+    def copy_to(self, file, format):
+        return self.db.copy_to(self.copy(format), file)
+
+    def copy_chunks(self, format, size):
+        return self.db.copy_chunks(self.copy(format), size)
+
+    def iterate(self, size, mode):
+        """
+        Iterates over the results with a server-side cursor. Prepared
+        statements are not used, since cursors can't be declared for them.
+        """
+        sql = self.compile(self.shape())
+        return self.db.iterate(sql, self.params, self.materialized(mode),
+                               self.tables(), size)
+
     def execute(self, fetch, mode):
-        if self.query_type == 'count':
-            return self.db.count(self.build(), self.params)
-        return self.db.execute(self.build(), self.params, fetch, mode,
-                               self.targets)
+        mode = self.materialized(mode)
+        shape = self.shape()
+        sql = self.compile(shape)
+        if self.query_type in self.unprepared:
+            # NOTE(vesuvium): explain and ddl can't be prepared
+            shape = None
+        if self.cacheable(fetch):
+            if self.query_type in self.counters:
+                fetch = 'count'
+            result = self.db.cached(sql, self.params, fetch, mode,
+                                    self.tables(), shape, self.ttl)
+            if fetch == 'count':
+                return self.estimated(result)
+            return self.load(result, fetch, mode)
+        if self.query_type in self.counters:
+            return self.estimated(self.db.count(sql, self.params, shape))
+        result = self.db.execute(sql, self.params, fetch, mode,
+                                 self.tables(), shape)
+        if self.query_type in self.writers:
+            self.db.invalidate(self.written())
+        return self.load(result, fetch, mode)
+
+    async def aexecute(self, fetch, mode):
+        mode = self.materialized(mode)
+        sql = await self.acompile(self.shape())
+        if self.cacheable(fetch):
+            if self.query_type in self.counters:
+                fetch = 'count'
+            result = await self.db.acached(sql, self.params, fetch, mode,
+                                           self.tables(), self.ttl)
+            if fetch == 'count':
+                return self.estimated(result)
+            return await self.aload(result, fetch, mode)
+        if self.query_type in self.counters:
+            return self.estimated(await self.db.acount(sql, self.params))
+        result = await self.db.aexecute(sql, self.params, fetch, mode,
+                                        self.tables())
+        if self.query_type in self.writers:
+            self.db.invalidate(self.written())
+        return await self.aload(result, fetch, mode)
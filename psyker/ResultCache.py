@@ -0,0 +1,140 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class ResultCache:
+    """
+    A least-recently-used cache of query results, bounded by their estimated
+    size in bytes. Entries expire after their ttl, and are tagged with the
+    tables they were read from so that writes can invalidate them. It can be
+    shared between threads.
+
+    Any object with the same get, set, invalidate and clear methods can be
+    given to Db instead.
+    """
+
+    __slots__ = ('max_bytes', 'ttl', 'items', 'tags', 'bytes', 'hits',
+                 'misses', 'evictions', 'expirations', 'invalidations',
+                 'lock')
+
+    def __init__(self, max_bytes=67108864, ttl=60.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.tags = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def sizeof(value):
+        """
+        Estimates the size of a list of rows, or of a single value.
+        """
+        if type(value) != list:
+            return sys.getsizeof(value)
+        size = sys.getsizeof(value)
+        for row in value:
+            size += sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+        return size
+
+    def remove(self, key):
+        """
+        Removes an entry and its tags. Must hold the lock.
+        """
+        value, expires, size, tags = self.items.pop(key)
+        self.bytes -= size
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def get(self, key):
+        """
+        Gets a value that has not expired, marking it as the most recently
+        used one.
+        """
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] < time.monotonic():
+                self.remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, tags, ttl=None):
+        """
+        Stores a value tagged with tables, evicting the least recently used
+        entries when the cache gets too big. Values bigger than the whole
+        cache are not stored.
+        """
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        with self.lock:
+            if key in self.items:
+                self.remove(key)
+            self.items[key] = (value, time.monotonic() + ttl, size, tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.remove(next(iter(self.items)))
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        """
+        Drops the entries tagged with any of the given tables.
+        """
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self.remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.tags.clear()
+            self.bytes = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def stats(self):
+        return {'size': len(self.items), 'bytes': self.bytes,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hit_rate()}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return f'<ResultCache({self.bytes}/{self.max_bytes})>'
@@ -0,0 +1,88 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from contextvars import ContextVar
+from weakref import WeakValueDictionary
+
+
+class Session:
+    """
+    An identity map of the instances loaded during a block, keyed on model
+    and id, so that a row loaded again gives back the same instance instead
+    of being hydrated anew. Instances are refreshed with the values of the
+    new row, including the columns they were loaded without. They are held
+    weakly. Works both with 'with' and 'async with'.
+    """
+
+    __slots__ = ('instances', 'hits', 'misses', 'token')
+
+    current = ContextVar('session', default=None)
+
+    def __init__(self):
+        self.instances = WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.token = None
+
+    @staticmethod
+    def refresh(instance, columns, row):
+        """
+        Sets the values of a row on an instance, which then has none of its
+        columns deferred.
+        """
+        for index, column in enumerate(columns):
+            setattr(instance, column, row[index])
+        if instance.__deferred__:
+            instance.__deferred__ = instance.__deferred__.difference(columns)
+
+    def hydrator(self, model, hydrate, columns):
+        """
+        Wraps the hydrator of a model so that it reuses the instances of the
+        session. columns are the columns of rows, which include the id.
+        """
+        instances = self.instances
+        key = columns.index('id')
+
+        def make(row):
+            identity = (model, row[key])
+            instance = instances.get(identity)
+            if instance is None:
+                self.misses += 1
+                instance = hydrate(row)
+                instances[identity] = instance
+                return instance
+            self.hits += 1
+            self.refresh(instance, columns, row)
+            return instance
+        return make
+
+    def stats(self):
+        """
+        Gets how many hydrations were avoided, how many were made, and how
+        many instances are still alive in the session.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.instances)}
+
+    def clear(self):
+        self.instances.clear()
+
+    def __enter__(self):
+        self.token = self.current.set(self)
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.current.reset(self.token)
+        self.clear()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, error_type, error, traceback):
+        self.__exit__(error_type, error, traceback)
+
+    def __repr__(self):
+        return f'<Session({len(self.instances)})>'
@@ -4,7 +4,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
-from psycopg2.sql import Identifier, Placeholder, SQL
+from psycopg2.sql import Identifier, Literal, Placeholder, SQL
 
 
 class Sql:
@@ -100,10 +100,10 @@ class Sql:
     @classmethod
     def comparison(cls, conditions):
         """
-        Builds a comparison fragment e.g. col = %s, col2 > %s. Used in WHERE
-        statements.
+        Builds a comparison fragment e.g. col = %s and col2 > %s. Used in
+        WHERE statements.
         """
-        return SQL(', ').join(cls.columns_with_values(conditions))
+        return SQL(' and ').join(cls.columns_with_values(conditions))
 
     @classmethod
     def order(cls, columns):
@@ -118,14 +118,107 @@ class Sql:
     def where(cls, conditions):
         return cls.format('where {}', cls.comparison(conditions))
 
+    @classmethod
+    def keyset(cls, columns, operator, conjunction):
+        """
+        Builds the row comparison used by keyset pagination, e.g.
+        where (col, col2) > (%s, %s)
+        """
+        sql = f'{conjunction} ({{}}) {operator} ({{}})'
+        identifiers = cls.table_columns(cls.identifiers(columns))
+        return cls.format(sql, identifiers, cls.placeholders(columns))
+
+    @classmethod
+    def any(cls, column, array_type):
+        """
+        Builds a comparison with any value of an array, e.g.
+        where col = any(%s::uuid[])
+        """
+        sql = f'where {{}} = any({{}}::{array_type}[])'
+        return cls.format(sql, cls.identifier(column), cls.placeholder())
+
     @classmethod
     def count(cls, table):
-        return cls.format('select count(*) from {}', cls.identifier(table))
+        return cls.format('select count(*) from {}', table.quoted_name)
+
+    @classmethod
+    def estimate(cls, table):
+        """
+        Builds the query for the estimated rows of a table, as kept in the
+        statistics of the planner. Tables that were never analyzed have no
+        estimate and count as empty.
+        """
+        sql = ('select greatest(reltuples, 0)::bigint from pg_class '
+               'where oid = {}::regclass')
+        return cls.format(sql, Literal(table.name))
+
+    @classmethod
+    def explain(cls, query):
+        return cls.format('explain (format json) {}', query)
+
+    @classmethod
+    def exists(cls, query, limit):
+        """
+        Wraps a query in an exists, limiting it to one row.
+        """
+        if limit:
+            return cls.format('select exists({} limit 1)', query)
+        return cls.format('select exists({})', query)
 
     @classmethod
-    def select(cls, table, columns):
-        sql = 'select {} from {}'
-        return cls.format(sql, cls.columns(columns), cls.identifier(table))
+    def select_one(cls, table):
+        return cls.format('select 1 from {}', table.quoted_name)
+
+    @classmethod
+    def aggregate_function(cls, function, column):
+        """
+        Builds an aggregate of a column, e.g. sum("amount"), or count(*)
+        when there is no column.
+        """
+        if column is None:
+            return SQL(f'{function}(*)')
+        return cls.format(f'{function}({{}})', cls.identifier(column))
+
+    @classmethod
+    def aggregate(cls, table, group, aggregates):
+        """
+        Builds the select of grouped columns and named aggregates, e.g.
+        select "user", sum("amount") as "total" from "payments"
+        """
+        columns = cls.identifiers(group)
+        for name, (function, column) in aggregates.items():
+            expression = cls.aggregate_function(function, column)
+            columns.append(cls.format('{} as {}', expression,
+                                      cls.identifier(name)))
+        return cls.format('select {} from {}', cls.table_columns(columns),
+                          table.quoted_name)
+
+    @classmethod
+    def group_by(cls, columns):
+        identifiers = cls.table_columns(cls.identifiers(columns))
+        return cls.format('group by {}', identifiers)
+
+    @classmethod
+    def having(cls, conditions, aggregates):
+        """
+        Builds a having clause. Postgres does not accept the names of
+        aggregates there, so they are repeated.
+        """
+        comparisons = []
+        for condition in conditions:
+            name = condition[0]
+            if name in aggregates:
+                expression = cls.aggregate_function(*aggregates[name])
+            else:
+                expression = cls.identifier(name)
+            comparisons.append(cls.format(f'{{}} {condition[1]} {{}}',
+                                          expression, cls.placeholder()))
+        return cls.format('having {}', SQL(' and ').join(comparisons))
+
+    @classmethod
+    def select(cls, table):
+        return cls.format('select {} from {}', table.quoted_columns,
+                          table.quoted_name)
 
     @classmethod
     def join_table(cls, second_table, first_table, lhs_on, rhs_on='id'):
@@ -136,21 +229,19 @@ class Sql:
         args = (first_table.alias, lhs_on, second_table.alias, rhs_on)
         identifiers = cls.identifiers(args)
         sql = 'join {} on {}.{} = {}.{}'
-        return cls.format(sql, cls.table_name(second_table), *identifiers)
+        return cls.format(sql, second_table.alias_clause, *identifiers)
 
     @classmethod
     def join_columns(cls, tables):
         """
         Produces the list of all columns used in a join.
         """
-        columns = []
-        for table in tables:
-            columns += cls.columns_with_alias(table.columns, table.alias)
+        columns = [table.aliased_columns for table in tables]
         return cls.join(*columns, separator=', ')
 
     @classmethod
     def join_tables(cls, tables, on):
-        join_tables = [cls.table_name(tables[0])]
+        join_tables = [tables[0].alias_clause]
         for i in range(1, len(tables)):
             table = tables[i]
             join_table = cls.join_table(table, *on[table.name])
@@ -180,6 +271,17 @@ class Sql:
                               cls.placeholder())
         return cls.format(' limit {}', cls.placeholder())
 
+    @classmethod
+    def returning(cls, column):
+        """
+        Builds a returning clause for a column, or for the columns of a table
+        given as Table.quoted_columns. Columns are always listed, since rows
+        are read by position and * follows the order of the table on disk.
+        """
+        if type(column) == str:
+            return cls.format('returning {}', cls.identifier(column))
+        return cls.format('returning {}', column)
+
     @classmethod
     def insert(cls, table, returning, **kwargs):
         """
@@ -190,8 +292,24 @@ class Sql:
         sql = 'insert into {} ({}) values ({})'
         args = [sql, cls.identifier(table), columns, placeholders]
         if returning:
-            args[0] = f'{args[0]} returning {{}}'
-            args.append(Sql.identifier(returning))
+            args[0] = f'{args[0]} {{}}'
+            args.append(cls.returning(returning))
+        return cls.format(*args)
+
+    @classmethod
+    def insert_many(cls, table, columns, rows, returning):
+        """
+        Builds a multi-row insert for the given number of rows, e.g.
+        insert into table (a, b) values (%s, %s), (%s, %s)
+        """
+        row = cls.format('({})', cls.placeholders(columns))
+        values = cls.join(*[row] * rows, separator=', ')
+        identifiers = cls.table_columns(cls.identifiers(columns))
+        sql = 'insert into {} ({}) values {}'
+        args = [sql, cls.identifier(table), identifiers, values]
+        if returning:
+            args[0] = f'{args[0]} {{}}'
+            args.append(cls.returning(returning))
         return cls.format(*args)
 
     @classmethod
@@ -222,6 +340,30 @@ class Sql:
             args = (cls.identifier(name), column_type)
         return Sql.format(cls.column_template(sql, default, primary), *args)
 
+    @classmethod
+    def index(cls, name, table, columns, unique, method, include, where,
+              concurrently):
+        """
+        Builds a create index, e.g.
+        create index if not exists name on table using gin (col)
+        """
+        sql = 'create unique index' if unique else 'create index'
+        if concurrently:
+            sql = f'{sql} concurrently'
+        sql = f'{sql} if not exists {{}} on {{}}'
+        if method:
+            sql = f'{sql} using {method}'
+        sql = f'{sql} ({{}})'
+        args = [cls.identifier(name), cls.identifier(table),
+                cls.table_columns(cls.identifiers(columns))]
+        if include:
+            sql = f'{sql} include ({{}})'
+            args.append(cls.table_columns(cls.identifiers(include)))
+        if where:
+            sql = f'{sql} where {{}}'
+            args.append(SQL(where))
+        return cls.format(sql, *args)
+
     @classmethod
     def extension(cls, extension):
         return cls.format(f'create extension "{extension}"')
@@ -245,3 +387,60 @@ class Sql:
         if cascade:
             sql = f'{sql} cascade'
         return cls.format(sql, cls.identifier(table))
+
+    @staticmethod
+    def begin(isolation, readonly):
+        sql = 'begin'
+        if isolation:
+            sql = f'{sql} isolation level {isolation}'
+        if readonly:
+            sql = f'{sql} read only'
+        return SQL(sql)
+
+    @classmethod
+    def savepoint(cls, name):
+        return cls.format('savepoint {}', cls.identifier(name))
+
+    @classmethod
+    def release(cls, name):
+        return cls.format('release savepoint {}', cls.identifier(name))
+
+    @classmethod
+    def rollback_to(cls, name):
+        return cls.format('rollback to savepoint {}', cls.identifier(name))
+
+    @classmethod
+    def copy_from(cls, table, columns, format):
+        sql = f'copy {{}} ({{}}) from stdin with (format {format})'
+        identifiers = cls.table_columns(cls.identifiers(columns))
+        return cls.format(sql, cls.identifier(table), identifiers)
+
+    @classmethod
+    def copy_to(cls, query, format):
+        sql = f'copy ({{}}) to stdout with (format {format})'
+        return cls.format(sql, SQL(query))
+
+    @classmethod
+    def analyze(cls, table):
+        return cls.format('analyze {}', cls.identifier(table))
+
+    @classmethod
+    def prepare(cls, name, statement):
+        """
+        Builds a prepare statement. The statement must already use postgres'
+        positional parameters, e.g. $1, $2
+        """
+        return cls.format('prepare {} as {}', cls.identifier(name),
+                          SQL(statement))
+
+    @classmethod
+    def execute_prepared(cls, name, params):
+        identifier = cls.identifier(name)
+        if params:
+            return cls.format('execute {} ({})', identifier,
+                              cls.placeholders(params))
+        return cls.format('execute {}', identifier)
+
+    @classmethod
+    def deallocate(cls, name):
+        return cls.format('deallocate {}', cls.identifier(name))
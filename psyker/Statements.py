@@ -0,0 +1,81 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import re
+
+from .Cache import Cache
+from .Sql import Sql
+
+
+class Statements:
+    """
+    The registry of the server-side prepared statements of a connection.
+
+    Shapes are counted as they are executed, and prepared once they have been
+    seen threshold times. The least recently used statements are deallocated
+    when the registry is full.
+    """
+
+    __slots__ = ('threshold', 'counts', 'prepared', 'sequence')
+
+    placeholders = re.compile('%%|%s')
+
+    def __init__(self, threshold, size):
+        self.threshold = threshold
+        self.counts = {}
+        self.prepared = Cache(size)
+        self.sequence = 0
+
+    @classmethod
+    def positional(cls, sql):
+        """
+        Converts psycopg2 placeholders to postgres positional parameters,
+        e.g. %s, %s to $1, $2
+        """
+        position = 0
+
+        def replace(match):
+            nonlocal position
+            if match.group() == '%%':
+                return '%'
+            position += 1
+            return f'${position}'
+        return cls.placeholders.sub(replace, sql)
+
+    def name(self):
+        self.sequence += 1
+        return f'psyker_{self.sequence}'
+
+    def prepare(self, cursor, shape, sql, params):
+        """
+        Prepares a statement, deallocating the least recently used one if
+        needed. Returns the rendered sql that executes it.
+        """
+        name = self.name()
+        cursor.execute(Sql.prepare(name, self.positional(sql)))
+        execute = Sql.execute_prepared(name, params).as_string(cursor)
+        evicted = self.prepared.set(shape, (name, execute))
+        if evicted:
+            cursor.execute(Sql.deallocate(evicted[1][0]))
+        return execute
+
+    def statement(self, cursor, shape, sql, params):
+        """
+        Gets the sql to run for a shape: either the given sql or the execute
+        statement of the prepared one.
+        """
+        prepared = self.prepared.get(shape)
+        if prepared:
+            return prepared[1]
+        count = self.counts.get(shape, 0) + 1
+        if count < self.threshold:
+            self.counts[shape] = count
+            return sql
+        self.counts.pop(shape, None)
+        return self.prepare(cursor, shape, sql, params)
+
+    def __repr__(self):
+        return f'<Statements({len(self.prepared)})>'
@@ -4,22 +4,30 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+from copy import copy
+
+from .Index import Index
 from .Sql import Sql
 from .columns import Column
+from .exceptions import ColumnError, IndexNameError
 
 
 class Table:
 
     __slots__ = ('name', 'columns', 'relationships', 'reverse_relationships',
-                 'alias')
+                 'alias', 'indexes', 'quoted_name', 'quoted_columns',
+                 'aliased_columns', 'alias_clause')
 
-    def __init__(self, db, _name, primary_key='uuid', alias=None, **kwargs):
+    def __init__(self, db, _name, primary_key='uuid', alias=None, indexes=(),
+                 **kwargs):
         self.name = _name
         self.columns = self.make_columns(kwargs, primary_key)
+        self.indexes = self.make_indexes(indexes)
         self.relationships = self.make_relationships(db, self.columns)
         self.reverse_relationships = []
         self.alias = alias
         self.make_reverse_relationships(db, self.relationships)
+        self.make_fragments()
 
     @staticmethod
     def make_primary_key(primary_key):
@@ -52,6 +60,31 @@ class Table:
         unique_rels = set([rel for rel in rels if rel is not None])
         return [db.get_table(rel) for rel in unique_rels]
 
+    def make_indexes(self, indexes):
+        """
+        Gets the indexes of the table: one for each column declared with
+        index, foreign columns included, then the given ones. Unique
+        columns and the primary key are indexed by postgres already.
+        """
+        result = []
+        for name, column in self.columns.items():
+            if column.index and not column.unique and not column.primary_key:
+                result.append(Index(name))
+        for index in indexes:
+            for name in index.columns + index.include:
+                if name not in self.columns:
+                    raise ColumnError(self.name, name)
+            result.append(index)
+        # NOTE(vesuvium): indexes are created if not exists, so one with the
+        # name of another would be skipped silently.
+        names = set()
+        for index in result:
+            name = index.index_name(self.name)
+            if name in names:
+                raise IndexNameError(self.name, name)
+            names.add(name)
+        return result
+
     def make_reverse_relationships(self, db, relationships):
         """
         Uses relationships to set reverse relationships on the receiving
@@ -60,10 +93,67 @@ class Table:
         for table in relationships:
             table.reverse_relationships.append(self)
 
+    def make_fragments(self):
+        """
+        Builds the sql fragments that every query on this table needs, so
+        that they are not rebuilt for each query.
+        """
+        self.quoted_name = Sql.identifier(self.name)
+        self.quoted_columns = Sql.columns(self.columns)
+        self.aliased_columns = None
+        if self.alias:
+            aliased = Sql.columns_with_alias(self.columns, self.alias)
+            self.aliased_columns = Sql.join(*aliased, separator=', ')
+        self.alias_clause = Sql.table_name(self)
+
+    def project(self, names):
+        """
+        Makes a copy of the table that has only the given columns, in the
+        order of the table. The id is always kept, so that rows can still
+        be told apart.
+        """
+        for name in names:
+            if name not in self.columns:
+                raise ColumnError(self.name, name)
+        table = copy(self)
+        table.columns = {
+            key: column for key, column in self.columns.items()
+            if key in names or key == 'id'
+        }
+        table.make_fragments()
+        return table
+
+    def defer(self, names):
+        """
+        Makes a copy of the table without the given columns.
+        """
+        for name in names:
+            if name not in self.columns:
+                raise ColumnError(self.name, name)
+        return self.project([key for key in self.columns if key not in names])
+
+    def aggregated(self, group, aggregates):
+        """
+        Makes a copy of the table with the columns of an aggregate query:
+        the grouped columns, then the aggregates.
+        """
+        table = copy(self)
+        table.columns = {name: self.columns[name] for name in group}
+        for name, (function, column) in aggregates.items():
+            field_type = 'bigint'
+            if column:
+                field_type = self.columns[column].aggregate_type(function)
+            table.columns[name] = Column(name, field_type)
+        table.make_fragments()
+        return table
+
     def sql(self):
         columns = [column.sql() for column in self.columns.values()]
         return Sql.table(self.name, columns)
 
+    def indexes_sql(self, concurrently=False):
+        return [index.sql(self.name, concurrently) for index in self.indexes]
+
     def cast(self, values):
         """
         Casts values that are handled by psycopg2.
@@ -73,6 +163,24 @@ class Table:
             casted[key] = self.columns[key].cast(value)
         return casted
 
+    def copy_lines(self, rows, columns, format):
+        """
+        Encodes rows, given as instances, dictionaries or sequences, to the
+        lines expected by copy.
+        """
+        encoders = [self.columns[column].encode for column in columns]
+        separator = ',' if format == 'csv' else '\t'
+        for row in rows:
+            if type(row) == dict:
+                values = [row[column] for column in columns]
+            elif type(row) in (list, tuple):
+                values = row
+            else:
+                values = [getattr(row, column) for column in columns]
+            items = zip(encoders, values)
+            line = separator.join([encode(v, format) for encode, v in items])
+            yield f'{line}\n'
+
     def as_string(self, cursor):
         return self.sql().as_string(cursor)
 
@@ -0,0 +1,153 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import psycopg2
+from psycopg2.extensions import (TRANSACTION_STATUS_INERROR,
+                                 TRANSACTION_STATUS_INTRANS)
+
+from .Sql import Sql
+from .exceptions import IsolationError, TransactionError
+
+
+class Transaction:
+    """
+    Runs the statements of a block in a transaction, on a connection that is
+    held for its duration. Works both with 'with' and 'async with'.
+    Transactions opened inside another one become savepoints.
+    """
+
+    __slots__ = ('db', 'isolation', 'readonly', 'connection', 'savepoint',
+                 'owner', 'token', 'pool')
+
+    levels = ('read committed', 'repeatable read', 'serializable')
+
+    def __init__(self, db, isolation=None, readonly=False):
+        if isolation and isolation.lower() not in self.levels:
+            raise IsolationError(isolation)
+        self.db = db
+        self.isolation = isolation
+        self.readonly = readonly
+        self.connection = None
+        self.savepoint = None
+        self.owner = False
+        self.token = None
+        self.pool = None
+
+    def begin(self, held):
+        """
+        Gets the statement that opens the transaction, or a savepoint when
+        the held connection is in a transaction already.
+        """
+        status = held.conn.get_transaction_status()
+        if status == TRANSACTION_STATUS_INTRANS:
+            self.savepoint = f'psyker_{id(self):x}'
+            return Sql.savepoint(self.savepoint)
+        return Sql.begin(self.isolation, self.readonly)
+
+    def aborted(self, error_type):
+        """
+        Tells whether a statement failed in a block that exited normally,
+        e.g. because its error was caught. Postgres would answer a commit
+        with a silent rollback.
+        """
+        if error_type is not None:
+            return False
+        status = self.connection.conn.get_transaction_status()
+        return status == TRANSACTION_STATUS_INERROR
+
+    def end(self, failed):
+        """
+        Gets the statement that closes the transaction, or the savepoint.
+        """
+        if self.savepoint:
+            if failed:
+                return Sql.rollback_to(self.savepoint)
+            return Sql.release(self.savepoint)
+        if failed:
+            return 'rollback'
+        return 'commit'
+
+    def __enter__(self):
+        held = getattr(self.db.local, 'connection', None)
+        if held is None:
+            # NOTE(vesuvium): the pool is kept, since connect may replace it
+            # before the connection is given back.
+            self.pool = self.db.pool
+            held = self.pool.checkout()
+            held.cursor.models = self.db.models
+            self.db.local.connection = held
+            self.owner = True
+        self.connection = held
+        try:
+            held.cursor.execute(self.begin(held))
+        except psycopg2.Error:
+            self.release()
+            raise
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        aborted = self.aborted(error_type)
+        failed = aborted or error_type is not None
+        try:
+            self.connection.cursor.execute(self.end(failed))
+        except psycopg2.Error:
+            if error_type is None:
+                raise
+        finally:
+            self.release()
+        if aborted:
+            raise TransactionError(self.savepoint)
+
+    def invalidate(self):
+        """
+        Invalidates the cached results of the tables written during the
+        transaction again, now that its changes are visible or gone.
+        """
+        tags = self.connection.tags
+        if tags:
+            self.connection.tags = set()
+            self.db.invalidate(tags)
+
+    def release(self):
+        if self.owner:
+            self.db.local.connection = None
+            self.pool.checkin(self.connection)
+            self.invalidate()
+
+    async def __aenter__(self):
+        held = self.db.held.get()
+        if held is None:
+            held = await self.db.acheckout()
+            self.token = self.db.held.set(held)
+            self.owner = True
+        self.connection = held
+        try:
+            held.cursor.execute(self.begin(held))
+            await held.wait()
+        except psycopg2.Error:
+            self.arelease()
+            raise
+        return self
+
+    async def __aexit__(self, error_type, error, traceback):
+        aborted = self.aborted(error_type)
+        failed = aborted or error_type is not None
+        try:
+            self.connection.cursor.execute(self.end(failed))
+            await self.connection.wait()
+        except psycopg2.Error:
+            if error_type is None:
+                raise
+        finally:
+            self.arelease()
+        if aborted:
+            raise TransactionError(self.savepoint)
+
+    def arelease(self):
+        if self.owner:
+            self.db.held.reset(self.token)
+            self.db.async_pool.checkin(self.connection)
+            self.invalidate()
@@ -5,9 +5,12 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
 from .Db import Db
+from .Index import Index
 from .Model import Model
 from .ModelFactory import ModelFactory
 from .Psyker import Psyker
+from .ResultCache import ResultCache
 from .columns import Column, Foreign
 
-__all__ = ['Column', 'Db', 'Foreign', 'Model', 'ModelFactory', 'Psyker']
+__all__ = ['Column', 'Db', 'Foreign', 'Index', 'Model', 'ModelFactory',
+           'Psyker', 'ResultCache']
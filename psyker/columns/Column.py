@@ -15,16 +15,27 @@ class Column:
     """
 
     __slots__ = ('name', 'field_type', 'nullable', 'unique', 'default',
-                 'primary_key', 'options')
+                 'primary_key', 'index', 'options')
+
+    escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n',
+                             '\r': '\\r'})
+
+    sums = {'int': 'bigint', 'serial': 'bigint', 'float': 'float',
+            'double': 'double'}
+
+    dtypes = {'int': 'int32', 'serial': 'int32', 'bigint': 'int64',
+              'float': 'float32', 'double': 'float64', 'bool': 'bool',
+              'date': 'datetime64[D]', 'datetime': 'datetime64[us]'}
 
     def __init__(self, name, field_type, nullable=True, unique=False,
-                 default=None, primary_key=False, **options):
+                 default=None, primary_key=False, index=False, **options):
         self.name = name
         self.field_type = field_type
         self.nullable = nullable
         self.unique = unique
         self.default = default
         self.primary_key = primary_key
+        self.index = index
         self.options = options
 
     def column_type(self):
@@ -63,6 +74,40 @@ class Column:
             return Sql.foreign_key(self.options['reference'], reference_column)
         raise FieldTypeError(self.field_type)
 
+    def array_type(self):
+        """
+        Gets the type of arrays of values of the column, used to compare the
+        column with many values at once.
+        """
+        if self.field_type == 'foreign':
+            return 'uuid'
+        elif self.field_type == 'serial':
+            return 'integer'
+        return self.column_type()
+
+    def dtype(self):
+        """
+        Gets the NumPy dtype of the column, or None when values should be
+        kept as objects.
+        """
+        return self.dtypes.get(self.field_type)
+
+    def aggregate_type(self, function):
+        """
+        Gets the type of the values of an aggregate of the column, following
+        postgres: sums of integers are bigints, other sums and averages of
+        exact numbers are numeric, and min and max keep the column type.
+        """
+        if function == 'count':
+            return 'bigint'
+        elif function == 'sum':
+            return self.sums.get(self.field_type, 'decimal')
+        elif function == 'avg':
+            if self.field_type in ('float', 'double'):
+                return 'double'
+            return 'decimal'
+        return self.field_type
+
     def relationship(self):
         if self.field_type == 'foreign':
             return self.options['reference']
@@ -99,5 +144,30 @@ class Column:
             return str(value)
         return value
 
+    @staticmethod
+    def quote_csv(string):
+        """
+        Quotes a csv value when needed. Empty strings are always quoted, since
+        postgres reads unquoted empty values as null.
+        """
+        if string == '' or any(char in string for char in ',"\r\n'):
+            return '"' + string.replace('"', '""') + '"'
+        return string
+
+    def encode(self, value, format='text'):
+        """
+        Encodes a value for copy, in either text or csv format.
+        """
+        if value is None:
+            if format == 'csv':
+                return ''
+            return '\\N'
+        if type(value) == bool:
+            value = 't' if value else 'f'
+        string = str(self.cast(value))
+        if format == 'csv':
+            return self.quote_csv(string)
+        return string.translate(self.escapes)
+
     def __repr__(self):
         return f'<Column({self.name}, type: {self.field_type})>'
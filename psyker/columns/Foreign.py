@@ -9,10 +9,12 @@ from .Column import Column
 
 class Foreign(Column):
     """
-    Provides a simpler interface for foreign columns.
+    Provides a simpler interface for foreign columns. They are indexed by
+    default, since postgres doesn't index them and joins need it.
     """
 
     def __init__(self, name, reference, column='id', nullable=True,
-                 unique=False):
+                 unique=False, index=True):
         super().__init__(name, 'foreign', nullable=nullable, unique=unique,
-                         reference=reference, reference_column=column)
+                         index=index, reference=reference,
+                         reference_column=column)
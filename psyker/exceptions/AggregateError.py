@@ -0,0 +1,20 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class AggregateError(ValueError):
+    __slots__ = ('function', 'joined')
+
+    def __init__(self, function, joined=None):
+        self.function = function
+        self.joined = joined
+
+    def __str__(self):
+        if self.joined:
+            return (f'Aggregate error: {self.function} can not be used on a '
+                    f'query joined with {self.joined}')
+        return f'Aggregate error: {self.function} is not a known aggregate'
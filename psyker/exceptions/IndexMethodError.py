@@ -0,0 +1,17 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class IndexMethodError(ValueError):
+    __slots__ = ('method', )
+
+    def __init__(self, method):
+        self.method = method
+
+    def __str__(self):
+        return (f'Index method error: {self.method} is invalid or not '
+                'supported')
@@ -0,0 +1,25 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class PaginationError(ValueError):
+    __slots__ = ('order', 'column', 'mode')
+
+    def __init__(self, order, column=None, mode=None):
+        self.order = order
+        self.column = column
+        self.mode = mode
+
+    def __str__(self):
+        if self.mode:
+            return (f'Pagination error: pages can not be made in {self.mode} '
+                    'mode')
+        if self.column:
+            return (f'Pagination error: order {self.order} needs a value for '
+                    f'{self.column}')
+        return (f'Pagination error: order {self.order} can not be used for '
+                'keyset pagination')
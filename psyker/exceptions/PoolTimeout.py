@@ -0,0 +1,18 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class PoolTimeout(ValueError):
+
+    __slots__ = ('timeout', )
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def __str__(self):
+        return (f'Pool timeout: no connection was available after '
+                f'{self.timeout} seconds')
@@ -0,0 +1,18 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class RelationshipError(ValueError):
+    __slots__ = ('table', 'name')
+
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+
+    def __str__(self):
+        return (f'Relationship error: table {self.table} has no relationship '
+                f'with {self.name}')
@@ -0,0 +1,18 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class RowError(ValueError):
+    __slots__ = ('table', 'columns')
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+
+    def __str__(self):
+        return (f'Row error: rows inserted in {self.table} must all have '
+                f'the columns {self.columns}')
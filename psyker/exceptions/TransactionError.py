@@ -0,0 +1,20 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+
+
+class TransactionError(ValueError):
+    __slots__ = ('savepoint', )
+
+    def __init__(self, savepoint=None):
+        self.savepoint = savepoint
+
+    def __str__(self):
+        if self.savepoint:
+            return (f'Transaction error: a statement failed, so the '
+                    f'transaction was rolled back to {self.savepoint}')
+        return ('Transaction error: a statement failed, so the transaction '
+                'was rolled back')
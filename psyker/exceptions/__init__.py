@@ -4,8 +4,23 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+from .AggregateError import AggregateError
+from .ColumnError import ColumnError
 from .ConnectionError import ConnectionError
 from .FieldTypeError import FieldTypeError
+from .IndexMethodError import IndexMethodError
+from .IndexNameError import IndexNameError
+from .IsolationError import IsolationError
+from .PaginationError import PaginationError
+from .PoolTimeout import PoolTimeout
+from .RelationshipError import RelationshipError
+from .ReturningError import ReturningError
+from .RowError import RowError
+from .TransactionError import TransactionError
 
 
-__all__ = ['ConnectionError', 'FieldTypeError']
+__all__ = ['AggregateError', 'ColumnError', 'ConnectionError',
+           'FieldTypeError', 'IndexMethodError', 'IndexNameError',
+           'IsolationError',
+           'PaginationError', 'PoolTimeout', 'RelationshipError',
+           'ReturningError', 'RowError', 'TransactionError']
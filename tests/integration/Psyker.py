@@ -4,6 +4,17 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+import psycopg2
+
+from psyker.exceptions import TransactionError
+
+from pytest import raises
+
+
+def test_psyker_indexes(psyker):
+    sql = 'select indexname from pg_indexes where tablename = %s'
+    result = psyker.db.execute(sql, ['fruits'], True, 'tuples', None)
+    assert ('fruits_tree_idx', ) in result
 
 
 def test_psyker_insert(psyker, trees):
@@ -37,6 +48,34 @@ def test_psyker_count__conditions(psyker, trees):
     assert trees.count(name='pine').get() == 1
 
 
+def test_psyker_count__estimate(psyker, trees):
+    psyker.db.execute('analyze trees', None, None, None, None)
+    assert trees.count(estimate=True).get() == 2
+
+
+def test_psyker_count__estimate_conditions(psyker, trees):
+    assert trees.count(estimate=True, name='pine').get() == 1
+
+
+def test_psyker_exists(psyker, trees):
+    assert trees.select(name='pine').exists() is True
+    assert trees.select(name='birch').exists() is False
+
+
+def test_psyker_aggregate(psyker, trees):
+    result = trees.aggregate(n='count', tallest=('max', 'max_height')).one()
+    assert result == {'n': 2, 'tallest': 80}
+
+
+def test_psyker_aggregate__group_by(psyker, trees):
+    result = trees.select()\
+        .aggregate(n='count', total=('sum', 'max_height'))\
+        .group_by('name')\
+        .having(total='>50')\
+        .tuples()
+    assert result == [('pine', 1, 80)]
+
+
 def test_psyker_join(psyker, trees, fruits):
     pine = trees.select(name='pine').one()
     pinecone = fruits(name='pinecone', tree=pine.id).save()
@@ -62,7 +101,7 @@ def test_psyker_join__dictionaries(psyker, trees, fruits):
     pine = trees.select(name='pine').dictionary()
     pinecone = fruits.select(tree=pine['id']).dictionary()
     result = fruits.select().join('trees', 'tree').dictionaries()
-    assert result[0] == {**pinecone, 'trees': (pine, )}
+    assert result[0] == {**pinecone, 'trees': [pine]}
     assert result[0]['trees'][0] == pine
 
 
@@ -74,6 +113,154 @@ def test_psyker_join__as_dictionary(psyker, trees, fruits):
     assert result[0].as_dictionary() == expected
 
 
+def test_psyker_join__one_to_many(psyker, trees, fruits):
+    pine = trees.select(name='pine').one()
+    fruits(name='pine nut', tree=pine.id).save()
+    result = trees.select().join('fruits', 'tree').get()
+    assert result == [pine]
+    names = [fruit.name for fruit in result[0].fruits]
+    assert sorted(names) == ['pine nut', 'pinecone']
+
+
+def test_psyker_join__one_to_many_dictionaries(psyker, trees, fruits):
+    result = trees.select().join('fruits', 'tree').dictionaries()
+    assert len(result) == 1
+    assert len(result[0]['fruits']) == 2
+
+
+def test_psyker_prefetch(psyker, trees, fruits):
+    pine = trees.select(name='pine').one()
+    result = fruits.select().prefetch('trees').get()
+    assert len(result) == 2
+    assert result[0].trees == [pine]
+    assert result[1].trees == [pine]
+
+
+def test_psyker_prefetch__reverse(psyker, trees, fruits):
+    result = trees.select().order_by(name='asc').prefetch('fruits').get()
+    assert result[0].name == 'oak'
+    assert result[0].fruits == []
+    names = sorted(fruit.name for fruit in result[1].fruits)
+    assert names == ['pine nut', 'pinecone']
+
+
+def test_psyker_prefetch__dictionaries(psyker, trees, fruits):
+    result = trees.select(name='pine').prefetch('fruits').dictionary()
+    assert len(result['fruits']) == 2
+
+
+def test_psyker_only(psyker, trees):
+    result = trees.select(name='pine').only('name').one()
+    assert result.name == 'pine'
+    assert result.id is not None
+    assert result.max_height == 80
+
+
+def test_psyker_only__prefetch(psyker, trees, fruits):
+    result = fruits.select().prefetch('trees').only('name').get()
+    assert result[0].__deferred__ == frozenset()
+    assert result[0].trees[0].id == result[0].tree
+
+
+def test_psyker_only__no_fallback(psyker, seeds):
+    """
+    Ensures models without a __dict__ can be loaded without some columns.
+    """
+    seeds(name='acorn', size=2).save()
+    result = seeds.select().only('name').one()
+    assert result.__deferred__ == {'size'}
+    assert result.size == 2
+    assert seeds.select().defer('size').one().name == 'acorn'
+    with psyker.session():
+        seed = seeds.select().only('name').one()
+        assert seeds.select().one() is seed
+        assert seed.__deferred__ == frozenset()
+    seeds.delete().execute()
+
+
+def test_psyker_defer__dictionaries(psyker, trees):
+    result = trees.select(name='pine').defer('max_height').dictionary()
+    assert set(result) == {'name', 'id'}
+
+
+def test_psyker_only__join(psyker, trees, fruits):
+    result = fruits.select()\
+        .join('trees', 'tree')\
+        .only('name', trees='name')\
+        .dictionaries()
+    assert set(result[0]) == {'name', 'id', 'trees'}
+    assert set(result[0]['trees'][0]) == {'name', 'id'}
+
+
+def test_psyker_only__before_join(psyker, trees, fruits):
+    """
+    Ensures projecting before joining keeps the direction of the join.
+    """
+    result = fruits.select()\
+        .only('name')\
+        .join('trees', 'tree')\
+        .dictionaries()
+    assert len(result) == 2
+    assert [tree['name'] for tree in result[0]['trees']] == ['pine']
+
+
+def test_psyker_session(psyker, trees, fruits):
+    with psyker.session() as session:
+        result = fruits.select().join('trees', 'tree').get()
+        pine = trees.select(name='pine').one()
+        assert result[0].trees[0] is pine
+        assert result[1].trees[0] is pine
+        assert session.stats()['hits'] == 1
+    assert trees.select(name='pine').one() is not pine
+
+
+def test_psyker_session__deferred(psyker, trees):
+    with psyker.session():
+        pine = trees.select(name='pine').only('name').one()
+        assert trees.select(name='pine').one() is pine
+        assert pine.__deferred__ == frozenset()
+        assert pine.max_height == 80
+
+
+def test_psyker_session__refresh(psyker, trees):
+    with psyker.session():
+        pine = trees.select(name='pine').one()
+        trees.update(max_height=81).where(name='pine').execute()
+        assert trees.select(name='pine').one() is pine
+        assert pine.max_height == 81
+    trees.update(max_height=80).where(name='pine').execute()
+
+
+def test_psyker_cached(psyker, trees):
+    cache = psyker.db.result_cache
+    cache.clear()
+    first = trees.select().cached(ttl=60).get()
+    second = trees.select().cached(ttl=60).get()
+    assert second == first
+    assert second[0] is not first[0]
+    assert trees.count().cached().get() == len(first)
+    hits = cache.hits
+    trees.count().cached().get()
+    assert cache.hits == hits + 1
+
+
+def test_psyker_cached__invalidate(psyker, trees):
+    before = trees.count().cached().get()
+    trees(name='birch', max_height=30).save()
+    assert trees.count().cached().get() == before + 1
+    trees.delete(name='birch').execute()
+    assert trees.count().cached().get() == before
+
+
+def test_psyker_cached__transaction(psyker, trees):
+    before = trees.count().cached().get()
+    with psyker.transaction():
+        trees(name='birch', max_height=30).save()
+        assert trees.count().cached().get() == before + 1
+        trees.delete(name='birch').execute()
+    assert trees.count().cached().get() == before
+
+
 def test_psyker_update(psyker, trees):
     trees.update(max_height=50).execute()
     result = trees.get()
@@ -87,6 +274,45 @@ def test_psyker_make_model(psyker):
     seasons.drop()
 
 
+def test_psyker_transaction(psyker, trees):
+    with psyker.transaction():
+        trees(name='birch', max_height=30).save()
+        try:
+            with psyker.transaction():
+                trees(name='elm', max_height=30).save()
+                raise ValueError
+        except ValueError:
+            pass
+    assert trees.count(name='birch').get() == 1
+    assert trees.count(name='elm').get() == 0
+    trees.delete(name='birch').execute()
+
+
+def test_psyker_transaction__rollback(psyker, trees):
+    try:
+        with psyker.transaction(isolation='serializable'):
+            trees(name='birch', max_height=30).save()
+            raise ValueError
+    except ValueError:
+        pass
+    assert trees.count(name='birch').get() == 0
+
+
+def test_psyker_transaction__aborted(psyker, trees):
+    """
+    Ensures a transaction whose failed statement was caught is rolled back
+    and raises, instead of silently dropping its changes.
+    """
+    with raises(TransactionError):
+        with psyker.transaction():
+            trees(name='birch', max_height=30).save()
+            try:
+                psyker.db.execute('select 1/0', None, True, None, None)
+            except psycopg2.Error:
+                pass
+    assert trees.count(name='birch').get() == 0
+
+
 def test_psyker_delete(psyker, flies):
     flies.delete().execute()
 
@@ -95,7 +321,8 @@ def test_psyker_delete__conditions(psyker, trees):
     trees.delete(name='oak').execute()
 
 
-def test_psyker_drop(trees, fruits, flies):
+def test_psyker_drop(trees, fruits, flies, seeds):
+    seeds.drop()
     flies.drop()
     fruits.drop()
     trees.drop()
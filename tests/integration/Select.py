@@ -4,6 +4,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+import asyncio
+
 from pytest import fixture
 
 
@@ -80,6 +82,25 @@ def test_psyker_select_dictionaries(psyker, trees):
     assert type(result[0]) == dict
 
 
+def test_psyker_select_tuples(psyker, trees):
+    result = trees.tuples()
+    assert type(result[0]) == tuple
+    assert result[0][0] == trees.get()[0].name
+
+
+def test_psyker_select_rows(psyker, trees):
+    result = trees.rows()
+    assert result[0].name == trees.get()[0].name
+    assert type(result[0]) == type(trees.rows()[0])
+
+
+def test_psyker_select_columnar(psyker, trees):
+    names = [tree.name for tree in trees.get()]
+    result = trees.columnar()
+    assert list(result['name']) == names
+    assert len(result['id']) == len(names)
+
+
 def test_psyker_select_dictionary(psyker, trees):
     result = trees.dictionary()
     assert type(result) == dict
@@ -99,3 +120,24 @@ def test_psyker_select_comparison__false(psyker, trees):
     pine = trees.select(name='pine').one()
     oak = trees.select(name='oak').one()
     assert (pine == oak) is False
+
+
+def test_psyker_select_aget(psyker, trees, pine):
+    loop = asyncio.new_event_loop()
+    result = loop.run_until_complete(trees.select(name='pine').aget())
+    loop.close()
+    assert result[0].name == 'pine'
+
+
+def test_psyker_select_aone__gather(psyker, trees, pine, oak):
+    """
+    Ensures queries built before being awaited don't overwrite each other.
+    """
+    async def gather():
+        queries = [trees.select(name='pine').aone(),
+                   trees.select(name='oak').aone()]
+        return await asyncio.gather(*queries)
+    loop = asyncio.new_event_loop()
+    result = loop.run_until_complete(gather())
+    loop.close()
+    assert [tree.name for tree in result] == ['pine', 'oak']
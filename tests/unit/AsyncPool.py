@@ -0,0 +1,187 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from collections import deque
+
+from psyker.AsyncPool import AsyncPool
+from psyker.exceptions import PoolTimeout
+
+from pytest import fixture, raises
+
+
+@fixture
+def connection(magic, coroutine):
+    """
+    A connection that is fresh, healthy and idle.
+    """
+    connection = magic(used=time.monotonic())
+    connection.expired.return_value = False
+    connection.idle.return_value = False
+    connection.broken.return_value = False
+    connection.ahealthy = coroutine(return_value=True)
+    return connection
+
+
+@fixture
+def pool(coroutine, connection):
+    factory = coroutine(return_value=connection)
+    return AsyncPool(factory, minimum=1, maximum=2, timeout=0.01)
+
+
+def test_async_pool_init(pool):
+    assert pool.minimum == 1
+    assert pool.maximum == 2
+    assert pool.lifetime == 3600.0
+    assert pool.idle == 600.0
+    assert pool.ping == 1.0
+    assert pool.connections == deque()
+    assert pool.size == 0
+    assert pool.waiters == deque()
+    assert pool.stopped is False
+
+
+def test_async_pool_interval(pool):
+    assert pool.interval() == 300.0
+
+
+def test_async_pool_open(run, pool, connection):
+    pool.minimum = 2
+    run(pool.open())
+    assert pool.size == 2
+    assert list(pool.connections) == [connection, connection]
+
+
+def test_async_pool_make__error(run, pool):
+    pool.size = 1
+    pool.factory.side_effect = ValueError
+    with raises(ValueError):
+        run(pool.make())
+    assert pool.size == 0
+
+
+def test_async_pool_wake(run, pool):
+    async def wake():
+        loop = asyncio.get_event_loop()
+        done = loop.create_future()
+        done.cancel()
+        waiter = loop.create_future()
+        pool.waiters.extend([done, waiter])
+        pool.wake()
+        return waiter
+    assert run(wake()).done()
+    assert pool.waiters == deque()
+
+
+def test_async_pool_checkout(run, pool, connection):
+    assert run(pool.checkout()) == connection
+    assert pool.size == 1
+
+
+def test_async_pool_checkout__idle(run, pool, connection):
+    pool.connections.append(connection)
+    pool.size = 1
+    assert run(pool.checkout()) == connection
+    assert pool.factory.call_count == 0
+
+
+def test_async_pool_checkout__unhealthy(run, coroutine, magic, pool,
+                                        connection):
+    unhealthy = magic()
+    unhealthy.expired.return_value = False
+    unhealthy.ahealthy = coroutine(return_value=False)
+    pool.connections.append(unhealthy)
+    pool.size = 1
+    assert run(pool.checkout()) == connection
+    assert unhealthy.close.call_count == 1
+    assert pool.size == 1
+
+
+def test_async_pool_checkout__reap(patch, run, pool):
+    patch.object(AsyncPool, 'reap')
+    pool.reaped = 0
+    run(pool.checkout())
+    assert AsyncPool.reap.call_count == 1
+
+
+def test_async_pool_checkout__timeout(run, pool):
+    pool.size = 2
+    with raises(PoolTimeout):
+        run(pool.checkout())
+    assert pool.waiters == deque()
+
+
+def test_async_pool_checkout__wait(run, pool, connection):
+    """
+    Ensures that checkout waits for a connection to be checked in.
+    """
+    async def checkout():
+        pool.timeout = 5
+        pool.size = 2
+        loop = asyncio.get_event_loop()
+        loop.call_soon(pool.checkin, connection)
+        return await pool.checkout()
+    assert run(checkout()) == connection
+    assert pool.factory.call_count == 0
+
+
+def test_async_pool_checkin(pool, connection):
+    pool.size = 1
+    pool.checkin(connection)
+    assert list(pool.connections) == [connection]
+
+
+def test_async_pool_checkin__broken(pool, connection):
+    connection.broken.return_value = True
+    pool.size = 1
+    pool.checkin(connection)
+    assert connection.close.call_count == 1
+    assert pool.size == 0
+
+
+def test_async_pool_checkin__stopped(pool, connection):
+    pool.size = 1
+    pool.stopped = True
+    pool.checkin(connection)
+    assert connection.close.call_count == 1
+
+
+def test_async_pool_reap(magic, pool, connection):
+    idle = magic()
+    idle.expired.return_value = False
+    idle.idle.return_value = True
+    pool.connections.extend([idle, connection])
+    pool.size = 2
+    assert pool.reap() == 1
+    assert idle.close.call_count == 1
+    assert list(pool.connections) == [connection]
+
+
+def test_async_pool_reap__minimum(pool, connection):
+    connection.idle.return_value = True
+    pool.connections.append(connection)
+    pool.size = 1
+    assert pool.reap() == 0
+
+
+def test_async_pool_stats(pool, connection):
+    pool.connections.append(connection)
+    pool.size = 2
+    assert pool.stats() == {'size': 2, 'idle': 1, 'used': 1}
+
+
+def test_async_pool_close(pool, connection):
+    pool.connections.append(connection)
+    pool.size = 1
+    pool.close()
+    assert pool.stopped is True
+    assert connection.close.call_count == 1
+    assert pool.size == 0
+
+
+def test_async_pool_repr(pool):
+    assert repr(pool) == '<AsyncPool(0/2)>'
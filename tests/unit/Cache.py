@@ -0,0 +1,89 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+from psyker.Cache import Cache
+
+from pytest import fixture
+
+
+@fixture
+def cache():
+    return Cache(2)
+
+
+def test_cache_init(cache):
+    assert cache.size == 2
+    assert cache.items == OrderedDict()
+    assert cache.hits == 0
+    assert cache.misses == 0
+    assert cache.evictions == 0
+    assert cache.lock.locked() is False
+
+
+def test_cache_get(cache):
+    cache.items['key'] = 'value'
+    assert cache.get('key') == 'value'
+    assert cache.hits == 1
+
+
+def test_cache_get__recent(cache):
+    cache.items['key'] = 'value'
+    cache.items['other'] = 'value'
+    cache.get('key')
+    assert list(cache.items) == ['other', 'key']
+
+
+def test_cache_get__miss(cache):
+    assert cache.get('key') is None
+    assert cache.misses == 1
+
+
+def test_cache_set(cache):
+    assert cache.set('key', 'value') is None
+    assert cache.items['key'] == 'value'
+
+
+def test_cache_set__eviction(cache):
+    cache.set('one', 1)
+    cache.set('two', 2)
+    assert cache.set('three', 3) == ('one', 1)
+    assert list(cache.items) == ['two', 'three']
+    assert cache.evictions == 1
+
+
+def test_cache_clear(cache):
+    cache.items['key'] = 'value'
+    cache.clear()
+    assert cache.items == OrderedDict()
+
+
+def test_cache_hit_rate(cache):
+    cache.hits = 3
+    cache.misses = 1
+    assert cache.hit_rate() == 0.75
+
+
+def test_cache_hit_rate__no_lookups(cache):
+    assert cache.hit_rate() == 0.0
+
+
+def test_cache_stats(cache):
+    cache.items['key'] = 'value'
+    cache.hits = 1
+    result = cache.stats()
+    assert result == {'size': 1, 'hits': 1, 'misses': 0, 'evictions': 0,
+                      'hit_rate': 1.0}
+
+
+def test_cache_len(cache):
+    cache.items['key'] = 'value'
+    assert len(cache) == 1
+
+
+def test_cache_repr(cache):
+    assert repr(cache) == '<Cache(0/2)>'
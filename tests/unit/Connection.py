@@ -0,0 +1,146 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import socket
+
+import psycopg2
+from psycopg2.extensions import (POLL_OK, POLL_READ, POLL_WRITE,
+                                 TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_INTRANS)
+
+from psyker.Connection import Connection
+
+from pytest import fixture
+
+
+@fixture
+def connection(magic):
+    conn = magic(closed=0)
+    conn.get_transaction_status.return_value = TRANSACTION_STATUS_IDLE
+    return Connection(conn, magic(), 'prepared')
+
+
+def test_connection_init(connection):
+    assert connection.prepared == 'prepared'
+    assert connection.used == connection.created
+    assert connection.tags == set()
+
+
+def test_connection_expired(connection):
+    assert connection.expired(10, connection.created + 11) is True
+    assert connection.expired(10, connection.created + 9) is False
+
+
+def test_connection_expired__no_lifetime(connection):
+    assert connection.expired(None, connection.created + 11) is False
+
+
+def test_connection_idle(connection):
+    assert connection.idle(10, connection.used + 11) is True
+    assert connection.idle(10, connection.used + 9) is False
+
+
+def test_connection_idle__no_timeout(connection):
+    assert connection.idle(None, connection.used + 11) is False
+
+
+def test_connection_broken(connection):
+    assert connection.broken() is False
+
+
+def test_connection_broken__closed(connection):
+    connection.conn.closed = 1
+    assert connection.broken() is True
+
+
+def test_connection_broken__transaction(connection):
+    status = TRANSACTION_STATUS_INTRANS
+    connection.conn.get_transaction_status.return_value = status
+    assert connection.broken() is True
+
+
+def test_connection_healthy(connection):
+    assert connection.healthy(1, connection.used) is True
+    assert connection.cursor.execute.call_count == 0
+
+
+def test_connection_healthy__ping(connection):
+    assert connection.healthy(1, connection.used + 2) is True
+    connection.cursor.execute.assert_called_with('select 1')
+
+
+def test_connection_healthy__no_ping(connection):
+    assert connection.healthy(None, connection.used + 2) is True
+    assert connection.cursor.execute.call_count == 0
+
+
+def test_connection_healthy__ping_error(connection):
+    connection.cursor.execute.side_effect = psycopg2.Error
+    assert connection.healthy(1, connection.used + 2) is False
+
+
+def test_connection_healthy__broken(patch, connection):
+    patch.object(Connection, 'broken', return_value=True)
+    assert connection.healthy(1, connection.used) is False
+
+
+def test_connection_wake(magic):
+    future = magic()
+    future.done.return_value = False
+    Connection.wake(future)
+    future.set_result.assert_called_with(None)
+
+
+def test_connection_wake__done(magic):
+    future = magic()
+    Connection.wake(future)
+    assert future.set_result.call_count == 0
+
+
+def test_connection_wait(run, connection):
+    """
+    Ensures wait polls until the connection is ready, waiting for its socket
+    in between.
+    """
+    ours, theirs = socket.socketpair()
+    theirs.send(b'ready')
+    connection.conn.fileno.return_value = ours.fileno()
+    connection.conn.poll.side_effect = [POLL_WRITE, POLL_READ, POLL_OK]
+    run(connection.wait())
+    assert connection.conn.poll.call_count == 3
+    ours.close()
+    theirs.close()
+
+
+def test_connection_ahealthy(run, connection):
+    assert run(connection.ahealthy(1, connection.used)) is True
+
+
+def test_connection_ahealthy__ping(patch, run, connection):
+    patch.object(Connection, 'wait')
+    assert run(connection.ahealthy(1, connection.used + 2)) is True
+    connection.cursor.execute.assert_called_with('select 1')
+    assert Connection.wait.call_count == 1
+
+
+def test_connection_ahealthy__ping_error(patch, run, connection):
+    patch.object(Connection, 'wait', side_effect=psycopg2.Error)
+    assert run(connection.ahealthy(1, connection.used + 2)) is False
+
+
+def test_connection_ahealthy__broken(patch, run, connection):
+    patch.object(Connection, 'broken', return_value=True)
+    assert run(connection.ahealthy(1, connection.used)) is False
+
+
+def test_connection_close(connection):
+    connection.close()
+    assert connection.conn.close.call_count == 1
+
+
+def test_connection_close__error(connection):
+    connection.conn.close.side_effect = psycopg2.Error
+    connection.close()
@@ -0,0 +1,53 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.CopyReader import CopyReader
+
+from pytest import fixture
+
+
+@fixture
+def reader():
+    return CopyReader(['one\n', 'two\n', 'three\n'])
+
+
+def test_copy_reader_init(reader):
+    assert reader.buffer == ''
+    assert reader.rows == 0
+
+
+def test_copy_reader_fill(reader):
+    reader.fill(5)
+    assert reader.buffer == 'one\ntwo\n'
+    assert reader.rows == 2
+
+
+def test_copy_reader_fill__exhausted(reader):
+    reader.fill(100)
+    assert reader.buffer == 'one\ntwo\nthree\n'
+    assert reader.rows == 3
+
+
+def test_copy_reader_read(reader):
+    assert reader.read(6) == 'one\ntw'
+    assert reader.buffer == 'o\n'
+    assert reader.rows == 2
+
+
+def test_copy_reader_read__buffered(patch, reader):
+    patch.object(CopyReader, 'fill')
+    reader.buffer = 'buffered'
+    assert reader.read(3) == 'buf'
+    assert CopyReader.fill.call_count == 0
+
+
+def test_copy_reader_read__all(reader):
+    assert reader.read(-1) == 'one\ntwo\nthree\n'
+
+
+def test_copy_reader_read__end(reader):
+    reader.read(100)
+    assert reader.read(100) == ''
@@ -0,0 +1,52 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from queue import Queue
+
+from psyker.CopyWriter import CopyWriter
+
+from pytest import fixture
+
+
+@fixture
+def writer():
+    return CopyWriter(2)
+
+
+def test_copy_writer_init(writer):
+    assert isinstance(writer.queue, Queue)
+    assert writer.queue.maxsize == 2
+    assert writer.stopped is False
+
+
+def test_copy_writer_write(writer):
+    writer.write('chunk')
+    assert writer.queue.get_nowait() == 'chunk'
+
+
+def test_copy_writer_write__stopped(writer):
+    writer.stopped = True
+    writer.write('chunk')
+    assert writer.queue.empty()
+
+
+def test_copy_writer_finish(writer):
+    writer.finish()
+    assert writer.queue.get_nowait() is None
+
+
+def test_copy_writer_stop(writer):
+    writer.write('chunk')
+    writer.write('chunk')
+    writer.stop()
+    assert writer.stopped is True
+    assert writer.queue.empty()
+
+
+def test_copy_writer_iter(writer):
+    writer.write('chunk')
+    writer.finish()
+    assert list(writer) == ['chunk']
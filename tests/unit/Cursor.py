@@ -6,7 +6,9 @@
 # -*- coding: utf-8 -*-
 from psycopg2.extras import NamedTupleCursor
 
+from psyker import Cursor as CursorModule
 from psyker.Cursor import Cursor
+from psyker.Session import Session
 
 from pytest import fixture, mark
 
@@ -31,9 +33,9 @@ def test_cursor_rows_dict():
 
 
 @mark.skip
-def test_cursor_fetch_returned(patch, cursor):
-    patch.object(NamedTupleCursor, 'fetchone')
-    assert cursor.fetch_returned() == NamedTupleCursor.fetchone()[0]
+def test_cursor_returned(patch, cursor):
+    # NOTE(vesuvium): it's not possible to patch NamedTupleCursor.fetchall
+    pass
 
 
 @mark.skip
@@ -54,52 +56,283 @@ def test_cursor_fetchone__none(patch, cursor):
     pass
 
 
-def test_cursor_make_related(patch, magic, cursor):
-    patch.object(Cursor, 'make')
-    target = magic(columns={'col': 'col'})
-    cursor.models = {target.name: 'model'}
-    result = cursor.make_related('row', [target])
-    Cursor.make.assert_called_with('model', 'ow', {'col': 'col'}.keys(), [])
-    assert result == Cursor.make()
+def test_cursor_hydrator(magic, cursor, target):
+    model = magic()
+    cursor.models = {'target': model}
+    result = cursor.hydrator(target, ('col', 'id'))
+    model.hydrator.assert_called_with(('col', 'id'))
+    assert result == model.hydrator()
 
 
-def test_cursor_make_related__mode(patch, magic, cursor):
-    patch.object(Cursor, 'make_dicts')
-    target = magic(columns={'col': 'col'})
-    cursor.models = {target.name: 'model'}
-    result = cursor.make_related('row', [target], mode='dictionaries')
-    Cursor.make_dicts.assert_called_with('ow', {'col': 'col'}.keys(), [])
-    assert result == Cursor.make_dicts()
+def test_cursor_hydrator__session(patch, magic, cursor, target):
+    patch.object(Session, 'hydrator')
+    model = magic()
+    cursor.models = {'target': model}
+    with Session() as session:
+        result = cursor.hydrator(target, ('col', 'id'))
+    session.hydrator.assert_called_with(model, model.hydrator(),
+                                        ('col', 'id'))
+    assert result == session.hydrator()
+
+
+def test_cursor_hydrator__session_no_id(magic, cursor, target):
+    model = magic()
+    cursor.models = {'target': model}
+    with Session():
+        result = cursor.hydrator(target, ('col', ))
+    assert result == model.hydrator()
 
 
-def test_cursor_make(magic, cursor):
+def test_cursor_make_dict():
+    assert Cursor.make_dict(('col', ))(('value', 'other')) == {'col': 'value'}
+
+
+def test_cursor_levels(magic, cursor):
+    table = magic(columns={'col': 'col', 'id': 'id'})
+    model = magic()
+    cursor.models = {table.name: model}
+    result = cursor.levels([table, table])
+    model.hydrator.assert_called_with(('col', 'id'))
+    assert result == [(model.hydrator(), 0, 2, 1), (model.hydrator(), 2, 2, 1)]
+
+
+def test_cursor_levels__dictionaries(patch, magic, cursor):
+    patch.object(Cursor, 'make_dict')
+    table = magic(columns={'col': 'col'})
+    result = cursor.levels([table], 'dictionaries')
+    Cursor.make_dict.assert_called_with(('col', ))
+    assert result == [(Cursor.make_dict(), 0, 1, None)]
+
+
+@fixture
+def tables(magic):
+    users = magic(columns={'id': 'id', 'name': 'name'})
+    users.name = 'users'
+    todos = magic(columns={'id': 'id', 'title': 'title'})
+    todos.name = 'todos'
+    return [users, todos]
+
+
+def test_cursor_make_joined(cursor, tables):
+    """
+    Ensures parents are made once, with a list of their related items.
+    """
+    rows = [(1, 'one', 10, 'a'), (1, 'one', 11, 'b'), (2, 'two', 12, 'c')]
+    result = cursor.make_joined(rows, tables, 'dictionaries')
+    assert result == [
+        {'id': 1, 'name': 'one', 'todos': [{'id': 10, 'title': 'a'},
+                                           {'id': 11, 'title': 'b'}]},
+        {'id': 2, 'name': 'two', 'todos': [{'id': 12, 'title': 'c'}]}
+    ]
+
+
+def test_cursor_make_joined__shared(cursor, tables):
+    """
+    Ensures an item related to many parents is made once.
+    """
+    rows = [(1, 'one', 10, 'a'), (2, 'two', 10, 'a'), (1, 'one', 10, 'a')]
+    result = cursor.make_joined(rows, tables, 'dictionaries')
+    assert result[0]['todos'] == [{'id': 10, 'title': 'a'}]
+    assert result[0]['todos'][0] is result[1]['todos'][0]
+
+
+def test_cursor_make_joined__outer(cursor, tables):
+    rows = [(1, 'one', None, None)]
+    result = cursor.make_joined(rows, tables, 'dictionaries')
+    assert result == [{'id': 1, 'name': 'one', 'todos': []}]
+
+
+def test_cursor_make_joined__nested(cursor, tables):
+    rows = [(1, 'one', 10, 'a', 1, 'one'), (1, 'one', 11, 'b', 1, 'one')]
+    result = cursor.make_joined(rows, tables + tables[:1], 'dictionaries')
+    assert len(result) == 1
+    users = result[0]['todos'][0]['users']
+    assert users == [{'id': 1, 'name': 'one'}]
+    assert result[0]['todos'][1]['users'][0] is users[0]
+
+
+def test_cursor_make_joined__no_key(magic, cursor):
+    """
+    Ensures rows are grouped by all their columns when a table has no
+    primary key.
+    """
+    table = magic(columns={'col': 'col'})
+    table.name = 'table'
+    rows = [('a', 'b'), ('a', 'b'), ('a', 'c')]
+    result = cursor.make_joined(rows, [table, table], 'dictionaries')
+    assert result == [{'col': 'a', 'table': [{'col': 'b'}, {'col': 'c'}]}]
+
+
+def test_cursor_make_joined__models(magic, cursor, tables):
     model = magic()
-    result = cursor.make(model, ['value'], ['col'], None)
-    model.assert_called_with(col='value')
-    assert result == model()
+    model.hydrator.return_value = magic
+    cursor.models = {'users': model, 'todos': model}
+    result = cursor.make_joined([(1, 'one', 10, 'a')], tables)
+    assert len(result) == 1
+    assert len(result[0].todos) == 1
+
+
+def test_cursor_array(patch):
+    patch.object(CursorModule, 'numpy')
+    result = Cursor.array((1, 2), 'int32')
+    CursorModule.numpy.array.assert_called_with((1, 2), dtype='int32')
+    assert result == CursorModule.numpy.array()
+
+
+def test_cursor_array__no_numpy(patch):
+    patch.object(CursorModule, 'numpy', None)
+    assert Cursor.array((1, 2), 'int32') == [1, 2]
+
+
+def test_cursor_array__object(patch):
+    patch.object(CursorModule, 'numpy')
+    Cursor.array(('value', ), None)
+    CursorModule.numpy.array.assert_called_with(('value', ), dtype=object)
+
+
+def test_cursor_array__nulls(patch):
+    patch.object(CursorModule, 'numpy')
+    Cursor.array((1, None), 'int32')
+    CursorModule.numpy.array.assert_called_with((1, None), dtype=object)
+
+
+def test_cursor_array__datetime_nulls(patch):
+    """
+    Ensures nulls are kept in datetime arrays, where they become NaT.
+    """
+    patch.object(CursorModule, 'numpy')
+    Cursor.array((None, ), 'datetime64[us]')
+    dtype = 'datetime64[us]'
+    CursorModule.numpy.array.assert_called_with((None, ), dtype=dtype)
+
+
+def test_cursor_names(magic):
+    table = magic(columns={'col': 'column'})
+    table.name = 'table'
+    assert Cursor.names([table, table]) == ['col', 'table.col']
+
+
+def test_cursor_names__separator(magic):
+    table = magic(columns={'col': 'column'})
+    table.name = 'table'
+    assert Cursor.names([table, table], '_') == ['col', 'table_col']
+
+
+def test_cursor_row_type(patch):
+    patch.object(Cursor, 'row_types', {})
+    result = Cursor.row_type(('col', 'id', 'id'))
+    assert result._fields == ('col', 'id', '_2')
+    assert Cursor.row_types[('col', 'id', 'id')] == result
 
 
-def test_cursor_make__related(patch, magic, cursor, target):
-    patch.object(Cursor, 'make_related')
+def test_cursor_row_type__cached(patch):
+    patch.object(Cursor, 'row_types', {('col', ): 'row'})
+    assert Cursor.row_type(('col', )) == 'row'
+
+
+def test_cursor_columnar(patch, magic, cursor):
+    patch.object(Cursor, 'array')
+    column = magic()
+    table = magic(columns={'col': column})
+    table.name = 'table'
+    result = cursor.columnar([(1, 2), (3, 4)], [table, table])
+    Cursor.array.assert_any_call((1, 3), column.dtype())
+    Cursor.array.assert_called_with((2, 4), column.dtype())
+    assert result == {'col': Cursor.array(), 'table.col': Cursor.array()}
+
+
+def test_cursor_columnar__empty(patch, magic, cursor):
+    patch.object(Cursor, 'array')
+    column = magic()
+    table = magic(columns={'col': column})
+    result = cursor.columnar([], [table])
+    Cursor.array.assert_called_with((), column.dtype())
+    assert result == {'col': Cursor.array()}
+
+
+def test_cursor_materialize(magic, cursor):
+    target = magic(columns={'col': 'col'})
     model = magic()
-    result = cursor.make(model, ['value'], ['col'], [target])
-    Cursor.make_related.assert_called_with(['value'], [target])
-    assert result.target == (Cursor.make_related(), )
+    cursor.models = {target.name: model}
+    result = cursor.materialize(['row'], [target])
+    model.hydrator.assert_called_with(('col', ))
+    model.hydrator().assert_called_with('row')
+    assert result == [model.hydrator()()]
 
 
-def test_cursor_make_dicts(cursor):
-    result = cursor.make_dicts(['value'], ['col'], None)
-    assert result == {'col': 'value'}
+def test_cursor_materialize__related(patch, cursor):
+    patch.object(Cursor, 'make_joined')
+    result = cursor.materialize(['row'], ['table', 'target'], 'mode')
+    Cursor.make_joined.assert_called_with(['row'], ['table', 'target'],
+                                          'mode')
+    assert result == Cursor.make_joined()
 
 
-def test_cursor_make_dicts__related(patch, cursor, target):
-    patch.object(Cursor, 'make_related')
-    result = cursor.make_dicts(['value'], ['col'], [target])
-    Cursor.make_related.assert_called_with(['value'], [target], 'dictionaries')
-    assert result['target'] == (Cursor.make_related(), )
+def test_cursor_materialize__dictionaries(magic, cursor):
+    target = magic(columns={'col': 'col'})
+    result = cursor.materialize([('value', )], [target], 'dictionaries')
+    assert result == [{'col': 'value'}]
+
+
+def test_cursor_materialize__tuples(cursor):
+    rows = [('value', )]
+    assert cursor.materialize(rows, ['target'], 'tuples') == rows
+
+
+def test_cursor_materialize__rows(patch, cursor):
+    patch.many(Cursor, ['names', 'row_type'])
+    Cursor.names.return_value = ['col']
+    result = cursor.materialize(['row'], ['target'], 'rows')
+    Cursor.names.assert_called_with(['target'], '_')
+    Cursor.row_type.assert_called_with(('col', ))
+    Cursor.row_type()._make.assert_called_with('row')
+    assert result == [Cursor.row_type()._make()]
+
+
+def test_cursor_materialize__columns(patch, cursor):
+    patch.object(Cursor, 'columnar')
+    result = cursor.materialize(['row'], ['target'], 'columns')
+    Cursor.columnar.assert_called_with(['row'], ['target'])
+    assert result == Cursor.columnar()
+
+
+@mark.skip
+def test_cursor_fetch_rows(patch, cursor):
+    # NOTE(vesuvium): it's not possible to patch NamedTupleCursor.fetchall
+    pass
+
+
+def test_cursor_from_rows(patch, cursor):
+    patch.object(Cursor, 'materialize')
+    rows = ['row']
+    result = cursor.from_rows(rows, True, 'mode', ['target'])
+    assert Cursor.materialize.call_args[0][0] is not rows
+    Cursor.materialize.assert_called_with(['row'], ['target'], 'mode')
+    assert result == Cursor.materialize()
+
+
+def test_cursor_from_rows__one(patch, cursor):
+    patch.object(Cursor, 'materialize', return_value=['item'])
+    result = cursor.from_rows(['row'], 'one', 'mode', ['target', 'other'])
+    Cursor.materialize.assert_called_with(['row'], ['target'], 'mode')
+    assert result == 'item'
+
+
+def test_cursor_from_rows__one_none(cursor):
+    assert cursor.from_rows([], 'one', 'mode', ['target']) is None
+
+
+def test_cursor_from_rows__count(cursor):
+    assert cursor.from_rows([(3, )], 'count', None, ['target']) == 3
 
 
 @mark.skip
 def test_cursor_fetchall(patch, cursor):
     # NOTE(vesuvium): it's not possible to patch NamedTupleCursor.fetchall
     pass
+
+
+@mark.skip
+def test_cursor_iterate(patch, cursor):
+    # NOTE(vesuvium): it's not possible to patch NamedTupleCursor.fetchmany
+    pass
@@ -6,9 +6,19 @@
 # -*- coding: utf-8 -*-
 import psycopg2
 from psycopg2 import OperationalError
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_INTRANS)
 
+from psyker.AsyncPool import AsyncPool
+from psyker.Cache import Cache
+from psyker.Connection import Connection
+from psyker.CopyWriter import CopyWriter
 from psyker.Cursor import Cursor
 from psyker.Db import Db
+from psyker.Pool import Pool
+from psyker.ResultCache import ResultCache
+from psyker.Statements import Statements
+from psyker.Transaction import Transaction
 from psyker.exceptions import ConnectionError
 
 from pytest import fixture, raises
@@ -24,11 +34,82 @@ def conn(magic):
     return magic()
 
 
+@fixture
+def connection(magic, db):
+    """
+    Makes the pool of the db give this connection.
+    """
+    connection = magic(prepared=None)
+    db.pool = magic()
+    db.pool.checkout.return_value = connection
+    return connection
+
+
 def test_db_init(db):
     assert db.url == 'url'
     assert db.models == {'name': 'model'}
-    assert db.conn is None
-    assert db.cursor is None
+    assert db.pool is None
+    assert db.async_pool is None
+    assert db.options == {'minimum': 1, 'maximum': 10, 'timeout': 30.0,
+                          'lifetime': 3600.0, 'idle': 600.0, 'ping': 1.0}
+    assert isinstance(db.statements, Cache)
+    assert db.statements.size == 256
+    assert db.prepare == (None, 64)
+    assert db.local.__dict__ == {}
+    assert db.held.get() is None
+    assert isinstance(db.result_cache, ResultCache)
+    assert db.result_cache.max_bytes == 67108864
+    assert db.result_cache.ttl == 60.0
+
+
+def test_db_init__pool():
+    db = Db('url', {}, pool_min=2, pool_max=4, pool_timeout=1,
+            pool_lifetime=None, pool_idle=None, pool_ping=None)
+    assert db.options == {'minimum': 2, 'maximum': 4, 'timeout': 1,
+                          'lifetime': None, 'idle': None, 'ping': None}
+
+
+def test_db_init__cache_size():
+    assert Db('url', {}, cache_size=10).statements.size == 10
+
+
+def test_db_init__result_cache():
+    assert Db('url', {}, result_cache='cache').result_cache == 'cache'
+
+
+def test_db_init__result_cache_size():
+    db = Db('url', {}, result_cache_size=10, result_cache_ttl=1)
+    assert db.result_cache.max_bytes == 10
+    assert db.result_cache.ttl == 1
+
+
+def test_db_make_result_cache__disabled():
+    assert Db.make_result_cache(0, 60.0) is None
+
+
+def test_db_make_cache(patch):
+    patch.init(Cache)
+    assert isinstance(Db.make_cache(10), Cache)
+    Cache.__init__.assert_called_with(10)
+
+
+def test_db_make_cache__disabled():
+    assert Db.make_cache(0) is None
+
+
+def test_db_init__prepare_threshold():
+    db = Db('url', {}, prepare_threshold=5, prepare_size=10)
+    assert db.prepare == (5, 10)
+
+
+def test_db_make_statements(patch):
+    patch.init(Statements)
+    assert isinstance(Db.make_statements(5, 10), Statements)
+    Statements.__init__.assert_called_with(5, 10)
+
+
+def test_db_make_statements__disabled():
+    assert Db.make_statements(None, 10) is None
 
 
 def test_db_setup_cursor(patch, conn):
@@ -38,76 +119,596 @@ def test_db_setup_cursor(patch, conn):
     assert result.models == 'models'
 
 
+def test_db_setup_cursor__name(patch, conn):
+    result = Db.setup_cursor(conn, 'models', name='name')
+    conn.cursor.assert_called_with('name', cursor_factory=Cursor,
+                                   withhold=False)
+    assert result == conn.cursor()
+
+
+def test_db_setup_cursor__hold(patch, conn):
+    Db.setup_cursor(conn, 'models', name='name', hold=True)
+    conn.cursor.assert_called_with('name', cursor_factory=Cursor,
+                                   withhold=True)
+
+
 def test_db_get_table(magic, db):
     db.models = {'table_name': magic(__table__='table')}
     result = db.get_table('table_name')
     assert result == db.models['table_name'].__table__
 
 
-def test_db_connect(patch, db):
+def test_db_make_connection(patch, db):
     patch.object(psycopg2, 'connect')
-    db.connect()
+    patch.many(Db, ['setup_cursor', 'make_statements'])
+    patch.init(Connection)
+    result = db.make_connection()
     psycopg2.connect.assert_called_with('url')
     psycopg2.connect().set_session.assert_called_with(autocommit=True)
-    assert db.conn == psycopg2.connect()
+    Db.setup_cursor.assert_called_with(psycopg2.connect(), db.models)
+    Db.make_statements.assert_called_with(None, 64)
+    Connection.__init__.assert_called_with(psycopg2.connect(),
+                                           Db.setup_cursor(),
+                                           Db.make_statements())
+    assert isinstance(result, Connection)
 
 
-def test_db_connect__connection_error(patch, db):
+def test_db_make_connection__connection_error(patch, db):
     patch.object(psycopg2, 'connect', side_effect=OperationalError)
+    with raises(ConnectionError):
+        db.make_connection()
+
+
+def test_db_make_async_connection(patch, run, db):
+    patch.object(psycopg2, 'connect')
     patch.object(Db, 'setup_cursor')
+    patch.object(Connection, 'wait')
+    result = run(db.make_async_connection())
+    psycopg2.connect.assert_called_with('url', async_=1)
+    assert Connection.wait.call_count == 1
+    Db.setup_cursor.assert_called_with(psycopg2.connect(), db.models)
+    assert result.conn == psycopg2.connect()
+    assert result.cursor == Db.setup_cursor()
+    assert result.prepared is None
+
+
+def test_db_make_async_connection__error(patch, run, db):
+    patch.object(psycopg2, 'connect')
+    patch.object(Connection, 'wait', side_effect=OperationalError)
     with raises(ConnectionError):
-        db.connect()
+        run(db.make_async_connection())
+
+
+def test_db_connect(patch, db):
+    patch.init(Pool)
+    patch.object(Pool, 'open')
+    db.connect()
+    Pool.__init__.assert_called_with(db.make_connection, **db.options)
+    assert Pool.open.call_count == 1
+    assert isinstance(db.pool, Pool)
+
+
+def test_db_connect__reconnect(patch, magic, db):
+    patch.init(Pool)
+    patch.object(Pool, 'open')
+    pool = magic()
+    db.pool = pool
+    db.connect()
+    assert pool.close.call_count == 1
 
 
 def test_db_start(patch, db):
-    patch.many(Db, ['connect', 'setup_cursor'])
+    patch.object(Db, 'connect')
     db.start()
     assert Db.connect.call_count == 1
-    Db.setup_cursor.assert_called_with(db.conn, db.models)
-    assert db.cursor == Db.setup_cursor()
 
 
-def test_db_execute(magic, db):
-    db.cursor = magic()
-    db.execute('query', 'params', 'fetch', 'mode', 'targets')
-    db.cursor.execute.assert_called_with('query', 'params')
+def test_db_connection(db, connection):
+    with db.connection() as result:
+        assert result == connection
+        assert db.pool.checkin.call_count == 0
+    assert connection.cursor.models == db.models
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_connection__error(db, connection):
+    with raises(ValueError):
+        with db.connection():
+            raise ValueError
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_connection__reconnect(magic, db, connection):
+    """
+    Ensures connections go back to their pool after the pool was replaced.
+    """
+    pool = db.pool
+    with db.connection():
+        db.pool = magic()
+    pool.checkin.assert_called_with(connection)
+    assert db.pool.checkin.call_count == 0
+
+
+def test_db_connection__held(magic, db, connection):
+    db.local.connection = 'held'
+    with db.connection() as result:
+        assert result == 'held'
+    assert db.pool.checkout.call_count == 0
+
+
+@fixture
+def async_connection(coroutine, magic, db):
+    """
+    Makes the async pool of the db give this connection.
+    """
+    connection = magic()
+    connection.wait = coroutine()
+    db.async_pool = magic()
+    db.async_pool.checkout = coroutine(return_value=connection)
+    return connection
+
+
+def test_db_acheckout(run, db, async_connection):
+    result = run(db.acheckout())
+    assert result == async_connection
+    assert async_connection.cursor.models == db.models
+
+
+def test_db_acheckout__held(run, db, async_connection):
+    db.held.set('held')
+    assert run(db.acheckout()) == 'held'
+    assert db.async_pool.checkout.call_count == 0
+
+
+def test_db_acheckin(magic, db):
+    db.async_pool = magic()
+    db.acheckin('connection')
+    db.async_pool.checkin.assert_called_with('connection')
+
+
+def test_db_acheckin__held(magic, db):
+    db.async_pool = magic()
+    db.held.set('held')
+    db.acheckin('held')
+    assert db.async_pool.checkin.call_count == 0
+
+
+def test_db_transaction(patch, db):
+    patch.init(Transaction)
+    result = db.transaction('serializable', True)
+    Transaction.__init__.assert_called_with(db, 'serializable', True)
+    assert isinstance(result, Transaction)
 
 
-def test_db_execute__fetch(magic, db):
-    db.cursor = magic()
+def test_db_acheckout__open(patch, run, db):
+    patch.init(AsyncPool)
+    patch.many(AsyncPool, ['open', 'checkout'])
+    run(db.acheckout())
+    AsyncPool.__init__.assert_called_with(db.make_async_connection,
+                                          **db.options)
+    assert AsyncPool.open.call_count == 1
+    assert isinstance(db.async_pool, AsyncPool)
+
+
+def test_db_statement(db, connection):
+    assert db.statement(connection, 'query', 'params', 'shape') == 'query'
+
+
+def test_db_statement__prepared(magic, db, connection):
+    connection.prepared = magic()
+    result = db.statement(connection, 'query', 'params', 'shape')
+    connection.prepared.statement.assert_called_with(connection.cursor,
+                                                     'shape', 'query',
+                                                     'params')
+    assert result == connection.prepared.statement()
+
+
+def test_db_statement__composed(magic, db, connection):
+    connection.prepared = magic()
+    query = magic()
+    db.statement(connection, query, 'params', 'shape')
+    query.as_string.assert_called_with(connection.cursor)
+    args = connection.prepared.statement.call_args[0]
+    assert args[2] == query.as_string()
+
+
+def test_db_statement__no_shape(magic, db, connection):
+    connection.prepared = magic()
+    assert db.statement(connection, 'query', 'params', None) == 'query'
+
+
+def test_db_execute(patch, db, connection):
+    patch.object(Db, 'statement')
+    db.execute('query', 'params', 'fetch', 'mode', 'targets', 'shape')
+    Db.statement.assert_called_with(connection, 'query', 'params', 'shape')
+    connection.cursor.execute.assert_called_with(Db.statement(), 'params')
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_execute__fetch(db, connection):
     result = db.execute('query', 'params', True, 'mode', 'targets')
-    db.cursor.fetchall.assert_called_with('targets', mode='mode')
-    assert result == db.cursor.fetchall()
+    connection.cursor.fetchall.assert_called_with('targets', mode='mode')
+    assert result == connection.cursor.fetchall()
 
 
-def test_db_execute__fetchone(magic, db):
-    db.cursor = magic()
+def test_db_execute__fetchone(db, connection):
     result = db.execute('query', 'params', 'one', 'mode', 'targets')
-    db.cursor.fetchone.assert_called_with('targets', mode='mode')
-    assert result == db.cursor.fetchone()
+    connection.cursor.fetchone.assert_called_with('targets', mode='mode')
+    assert result == connection.cursor.fetchone()
+
+
+def test_db_execute__returned(db, connection):
+    result = db.execute('query', 'params', 'returned', 'mode', 'targets')
+    assert result == connection.cursor.returned()
+
+
+def test_db_results(magic):
+    cursor = magic()
+    result = Db.results(cursor, True, 'mode', 'targets')
+    cursor.fetchall.assert_called_with('targets', mode='mode')
+    assert result == cursor.fetchall()
+
+
+def test_db_results__count(magic):
+    cursor = magic()
+    assert Db.results(cursor, 'count', 'mode', 'targets') == cursor.count()
+
+
+def test_db_results__none(magic):
+    cursor = magic()
+    assert Db.results(cursor, None, 'mode', 'targets') is None
+
+
+def test_db_cache_key():
+    result = Db.cache_key('query', ['param'], 'fetch')
+    assert result == ('query', 'fetch', ('param', ))
+
+
+def test_db_cache_key__no_params():
+    assert Db.cache_key('query', None, 'fetch') == ('query', 'fetch', ())
+
+
+def test_db_cache_key__unhashable():
+    assert Db.cache_key('query', [['param']], 'fetch') is None
+
+
+@fixture
+def cache(magic, db):
+    db.result_cache = magic()
+    return db.result_cache
+
 
+def test_db_lookup(patch, db, connection, cache):
+    patch.object(Db, 'cache_key')
+    status = TRANSACTION_STATUS_IDLE
+    connection.conn.get_transaction_status.return_value = status
+    result = db.lookup(connection, 'query', 'params', 'fetch')
+    Db.cache_key.assert_called_with('query', 'params', 'fetch')
+    cache.get.assert_called_with(Db.cache_key())
+    assert result == (Db.cache_key(), cache.get())
 
-def test_db_count(magic, db):
-    db.cursor = magic()
+
+def test_db_lookup__composed(patch, magic, db, connection, cache):
+    patch.object(Db, 'cache_key')
+    status = TRANSACTION_STATUS_IDLE
+    connection.conn.get_transaction_status.return_value = status
+    query = magic()
+    db.lookup(connection, query, 'params', 'fetch')
+    query.as_string.assert_called_with(connection.cursor)
+    Db.cache_key.assert_called_with(query.as_string(), 'params', 'fetch')
+
+
+def test_db_lookup__no_cache(db, connection):
+    db.result_cache = None
+    assert db.lookup(connection, 'query', [], 'fetch') == (None, None)
+
+
+def test_db_lookup__transaction(db, connection, cache):
+    status = TRANSACTION_STATUS_INTRANS
+    connection.conn.get_transaction_status.return_value = status
+    assert db.lookup(connection, 'query', [], 'fetch') == (None, None)
+
+
+def test_db_lookup__no_key(patch, db, connection, cache):
+    patch.object(Db, 'cache_key', return_value=None)
+    status = TRANSACTION_STATUS_IDLE
+    connection.conn.get_transaction_status.return_value = status
+    assert db.lookup(connection, 'query', [], 'fetch') == (None, None)
+
+
+def test_db_cached(patch, magic, db, connection, cache):
+    patch.many(Db, ['lookup', 'statement'])
+    Db.lookup.return_value = ('key', None)
+    target = magic()
+    result = db.cached('query', 'params', 'fetch', 'mode', [target],
+                       'shape', 'ttl')
+    cursor = connection.cursor
+    Db.lookup.assert_called_with(connection, 'query', 'params', 'fetch')
+    Db.statement.assert_called_with(connection, 'query', 'params', 'shape')
+    cursor.execute.assert_called_with(Db.statement(), 'params')
+    cursor.fetch_rows.assert_called_with('fetch')
+    cache.set.assert_called_with('key', cursor.fetch_rows(), [target.name],
+                                 'ttl')
+    cursor.from_rows.assert_called_with(cursor.fetch_rows(), 'fetch', 'mode',
+                                        [target])
+    db.pool.checkin.assert_called_with(connection)
+    assert result == cursor.from_rows()
+
+
+def test_db_cached__hit(patch, db, connection, cache):
+    patch.object(Db, 'lookup', return_value=('key', 'rows'))
+    result = db.cached('query', 'params', 'fetch', 'mode', 'targets',
+                       'shape', 'ttl')
+    cursor = connection.cursor
+    assert cursor.execute.call_count == 0
+    cursor.from_rows.assert_called_with('rows', 'fetch', 'mode', 'targets')
+    assert result == cursor.from_rows()
+
+
+def test_db_cached__no_key(patch, db, connection, cache):
+    patch.many(Db, ['lookup', 'statement', 'results'])
+    Db.lookup.return_value = (None, None)
+    result = db.cached('query', 'params', 'fetch', 'mode', 'targets',
+                       'shape', 'ttl')
+    Db.results.assert_called_with(connection.cursor, 'fetch', 'mode',
+                                  'targets')
+    assert cache.set.call_count == 0
+    assert result == Db.results()
+
+
+def test_db_acached(patch, magic, run, db, async_connection, cache):
+    patch.object(Db, 'lookup', return_value=('key', None))
+    target = magic()
+    result = run(db.acached('query', 'params', 'fetch', 'mode', [target],
+                            'ttl'))
+    cursor = async_connection.cursor
+    cursor.execute.assert_called_with('query', 'params')
+    assert async_connection.wait.call_count == 1
+    cache.set.assert_called_with('key', cursor.fetch_rows(), [target.name],
+                                 'ttl')
+    db.async_pool.checkin.assert_called_with(async_connection)
+    assert result == cursor.from_rows()
+
+
+def test_db_acached__hit(patch, run, db, async_connection, cache):
+    patch.object(Db, 'lookup', return_value=('key', 'rows'))
+    result = run(db.acached('query', 'params', 'fetch', 'mode', 'targets',
+                            'ttl'))
+    cursor = async_connection.cursor
+    assert cursor.execute.call_count == 0
+    cursor.from_rows.assert_called_with('rows', 'fetch', 'mode', 'targets')
+    assert result == cursor.from_rows()
+
+
+def test_db_acached__no_key(patch, run, db, async_connection, cache):
+    patch.many(Db, ['lookup', 'results'])
+    Db.lookup.return_value = (None, None)
+    result = run(db.acached('query', 'params', 'fetch', 'mode', 'targets',
+                            'ttl'))
+    Db.results.assert_called_with(async_connection.cursor, 'fetch', 'mode',
+                                  'targets')
+    assert result == Db.results()
+
+
+def test_db_invalidate(db, cache):
+    db.invalidate(['table'])
+    cache.invalidate.assert_called_with(['table'])
+
+
+def test_db_invalidate__no_cache(db):
+    db.result_cache = None
+    db.invalidate(['table'])
+
+
+def test_db_invalidate__transaction(magic, db, cache):
+    """
+    Ensures writes made in a transaction are remembered on its connection.
+    """
+    connection = magic(tags=set())
+    status = TRANSACTION_STATUS_INTRANS
+    connection.conn.get_transaction_status.return_value = status
+    db.local.connection = connection
+    db.invalidate(['table'])
+    cache.invalidate.assert_called_with(['table'])
+    assert connection.tags == {'table'}
+
+
+def test_db_invalidate__held(magic, db, cache):
+    connection = magic(tags=set())
+    status = TRANSACTION_STATUS_IDLE
+    connection.conn.get_transaction_status.return_value = status
+    db.held.set(connection)
+    db.invalidate(['table'])
+    assert connection.tags == set()
+
+
+def test_db_aexecute(patch, run, db, async_connection):
+    patch.object(Db, 'results')
+    result = run(db.aexecute('query', 'params', 'fetch', 'mode', 'targets'))
+    cursor = async_connection.cursor
+    cursor.execute.assert_called_with('query', 'params')
+    assert async_connection.wait.call_count == 1
+    Db.results.assert_called_with(cursor, 'fetch', 'mode', 'targets')
+    db.async_pool.checkin.assert_called_with(async_connection)
+    assert result == Db.results()
+
+
+def test_db_aexecute__error(run, db, async_connection):
+    async_connection.wait.side_effect = psycopg2.Error
+    with raises(psycopg2.Error):
+        run(db.aexecute('query', 'params', 'fetch', 'mode', 'targets'))
+    db.async_pool.checkin.assert_called_with(async_connection)
+
+
+def test_db_acount(run, db, async_connection):
+    result = run(db.acount('query', 'params'))
+    async_connection.cursor.execute.assert_called_with('query', 'params')
+    assert async_connection.wait.call_count == 1
+    db.async_pool.checkin.assert_called_with(async_connection)
+    assert result == async_connection.cursor.count()
+
+
+def test_db_asql(magic, run, db, async_connection):
+    query = magic()
+    result = run(db.asql(query))
+    query.as_string.assert_called_with(async_connection.cursor)
+    db.async_pool.checkin.assert_called_with(async_connection)
+    assert result == query.as_string()
+
+
+def test_db_iterate(patch, db, connection):
+    patch.object(Db, 'setup_cursor')
+    cursor = Db.setup_cursor()
+    cursor.iterate.return_value = iter(['result'])
+    connection.conn.get_transaction_status.return_value = \
+        TRANSACTION_STATUS_IDLE
+    result = list(db.iterate('query', 'params', 'mode', 'targets', 10))
+    assert Db.setup_cursor.call_args[0] == (connection.conn, db.models)
+    assert Db.setup_cursor.call_args[1]['name'].startswith('psyker_')
+    assert Db.setup_cursor.call_args[1]['hold'] is False
+    assert cursor.itersize == 10
+    cursor.execute.assert_called_with('query', 'params')
+    cursor.iterate.assert_called_with('targets', 10, mode='mode')
+    assert cursor.close.call_count == 1
+    assert connection.conn.commit.call_count == 1
+    assert connection.conn.autocommit is True
+    db.pool.checkin.assert_called_with(connection)
+    assert result == ['result']
+
+
+def test_db_iterate__transaction(patch, db, connection):
+    """
+    Ensures the cursor is declared in the transaction in progress, where
+    it is closed before the transaction ends.
+    """
+    patch.object(Db, 'setup_cursor')
+    Db.setup_cursor().iterate.return_value = iter(['result'])
+    connection.conn.get_transaction_status.return_value = \
+        TRANSACTION_STATUS_INTRANS
+    list(db.iterate('query', 'params', 'mode', 'targets', 10))
+    assert Db.setup_cursor.call_args[1]['hold'] is True
+    assert connection.conn.commit.call_count == 0
+
+
+def test_db_iterate__error(patch, db, connection):
+    patch.object(Db, 'setup_cursor')
+    cursor = Db.setup_cursor()
+    cursor.execute.side_effect = psycopg2.Error
+    connection.conn.get_transaction_status.return_value = \
+        TRANSACTION_STATUS_IDLE
+    with raises(psycopg2.Error):
+        list(db.iterate('query', 'params', 'mode', 'targets', 10))
+    assert cursor.close.call_count == 1
+    assert connection.conn.autocommit is True
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_iterate__early_stop(patch, db, connection):
+    patch.object(Db, 'setup_cursor')
+    cursor = Db.setup_cursor()
+    cursor.iterate.return_value = iter(['one', 'two'])
+    connection.conn.get_transaction_status.return_value = \
+        TRANSACTION_STATUS_IDLE
+    results = db.iterate('query', 'params', 'mode', 'targets', 10)
+    next(results)
+    results.close()
+    assert cursor.close.call_count == 1
+    assert connection.conn.commit.call_count == 1
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_count(db, connection):
     result = db.count('query')
-    db.cursor.execute.assert_called_with('query', None)
-    assert result == db.cursor.count()
+    connection.cursor.execute.assert_called_with('query', None)
+    assert result == connection.cursor.count()
 
 
-def test_db_count__params(magic, db):
-    db.cursor = magic()
+def test_db_count__params(db, connection):
     db.count('query', 'params')
-    db.cursor.execute.assert_called_with('query', 'params')
+    connection.cursor.execute.assert_called_with('query', 'params')
+
+
+def test_db_count__shape(patch, db, connection):
+    patch.object(Db, 'statement')
+    db.count('query', 'params', 'shape')
+    Db.statement.assert_called_with(connection, 'query', 'params', 'shape')
+    connection.cursor.execute.assert_called_with(Db.statement(), 'params')
+
+
+def test_db_copy_from(db, connection):
+    db.copy_from('query', 'reader', 100)
+    connection.cursor.copy_expert.assert_called_with('query', 'reader', 100)
 
 
-def test_db_sql(magic, db):
+def test_db_copy_to(db, connection):
+    db.copy_to('query', 'file')
+    connection.cursor.copy_expert.assert_called_with('query', 'file')
+
+
+def test_db_copy_chunks(db, connection):
+    def copy_expert(query, writer):
+        writer.write('chunk')
+    connection.cursor.copy_expert = copy_expert
+    assert list(db.copy_chunks('query', 1)) == ['chunk']
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_copy_chunks__error(db, connection):
+    connection.cursor.copy_expert.side_effect = psycopg2.Error
+    with raises(psycopg2.Error):
+        list(db.copy_chunks('query', 1))
+
+
+def test_db_copy_chunks__other_error(db, connection):
+    """
+    Ensures errors that are not from postgres are raised too, instead of
+    leaving the consumer waiting.
+    """
+    connection.cursor.copy_expert.side_effect = ValueError
+    with raises(ValueError):
+        list(db.copy_chunks('query', 1))
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_copy_chunks__stop(patch, db, connection):
+    def copy_expert(query, writer):
+        while writer.stopped is False:
+            writer.write('chunk')
+    patch.object(CopyWriter, 'stop', autospec=True,
+                 side_effect=CopyWriter.stop)
+    connection.cursor.copy_expert = copy_expert
+    chunks = db.copy_chunks('query', 1)
+    assert next(chunks) == 'chunk'
+    chunks.close()
+    assert CopyWriter.stop.call_count == 1
+    assert connection.conn.cancel.call_count == 1
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_db_mogrify(db, connection):
+    connection.conn.encoding = 'UTF8'
+    cursor = connection.cursor
+    result = db.mogrify('query', 'params')
+    cursor.mogrify.assert_called_with('query', 'params')
+    cursor.mogrify().decode.assert_called_with('utf_8')
+    assert result == cursor.mogrify().decode()
+
+
+def test_db_sql(magic, db, connection):
     query = magic()
     result = db.sql(query)
-    query.as_string.assert_called_with(db.cursor)
+    query.as_string.assert_called_with(connection.cursor)
     assert result == query.as_string()
 
 
 def test_db_close(magic, db):
-    db.conn = magic()
+    db.pool = magic()
+    db.close()
+    assert db.pool.close.call_count == 1
+
+
+def test_db_close__async(magic, db):
+    db.pool = magic()
+    db.async_pool = magic()
     db.close()
-    assert db.conn.close.call_count == 1
+    assert db.async_pool.close.call_count == 1
@@ -0,0 +1,92 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.Index import Index
+from psyker.Sql import Sql
+from psyker.exceptions import IndexMethodError
+
+from pytest import fixture, raises
+
+
+@fixture
+def index():
+    return Index('user', 'done')
+
+
+def test_index_init(index):
+    assert index.columns == ('user', 'done')
+    assert index.name is None
+    assert index.unique is False
+    assert index.method is None
+    assert index.include == ()
+    assert index.where is None
+
+
+def test_index_init__options():
+    index = Index('tags', name='tags', unique=True, method='gin',
+                  include=['id'], where='done = false')
+    assert index.name == 'tags'
+    assert index.unique is True
+    assert index.method == 'gin'
+    assert index.include == ('id', )
+    assert index.where == 'done = false'
+
+
+def test_index_init__method():
+    with raises(IndexMethodError):
+        Index('tags', method='rtree')
+
+
+def test_index_methods():
+    methods = ('btree', 'hash', 'gist', 'spgist', 'gin', 'brin')
+    assert Index.methods == methods
+
+
+def test_index_index_name(index):
+    assert index.index_name('todos') == 'todos_user_done_idx'
+
+
+def test_index_index_name__options():
+    index = Index('tags', method='gin', include=('id', ))
+    assert index.index_name('todos') == 'todos_tags_gin_include_id_idx'
+
+
+def test_index_index_name__btree():
+    index = Index('user', method='btree')
+    assert index.index_name('todos') == 'todos_user_idx'
+
+
+def test_index_index_name__unique():
+    assert Index('user', unique=True).index_name('todos') == 'todos_user_key'
+
+
+def test_index_index_name__where():
+    """
+    Ensures partial indexes are named after their predicate.
+    """
+    done = Index('user', where='done').index_name('todos')
+    undone = Index('user', where='not done').index_name('todos')
+    assert done.startswith('todos_user_')
+    assert done != undone
+    assert done == Index('user', where='done').index_name('todos')
+
+
+def test_index_index_name__name(index):
+    index.name = 'name'
+    assert index.index_name('todos') == 'name'
+
+
+def test_index_sql(patch, index):
+    patch.object(Sql, 'index')
+    result = index.sql('todos', True)
+    Sql.index.assert_called_with('todos_user_done_idx', 'todos',
+                                 ('user', 'done'), False, None, (), None,
+                                 True)
+    assert result == Sql.index()
+
+
+def test_index_repr(index):
+    assert repr(index) == '<Index(user, done)>'
@@ -4,10 +4,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+from collections import namedtuple
+from contextvars import ContextVar
+from threading import Thread
+
+from psyker.CopyReader import CopyReader
 from psyker.Model import Model
 from psyker.Query import Query
 from psyker.Sql import Sql
 from psyker.Table import Table
+from psyker.exceptions import PaginationError, ReturningError, RowError
 
 from pytest import fixture, mark, raises
 
@@ -31,7 +37,9 @@ def model(patch):
 def test_model():
     assert Model.__db__ is None
     assert Model.__table__ is None
-    assert Model.__query__ is None
+    assert isinstance(Model.__query__, ContextVar)
+    assert Model.__query__.get() is None
+    assert Model.__hydrators__ is None
 
 
 def test_model_init():
@@ -46,14 +54,110 @@ def test_model_columns():
         Model.columns()
 
 
+def test_model_indexes():
+    assert Model.indexes() == []
+
+
 def test_model_setup(patch):
     patch.init(Table)
-    patch.object(Model, 'columns')
+    patch.many(Model, ['columns', 'indexes'])
     Model.setup('db', 'alias')
     assert Model.__db__ == 'db'
     Table.__init__.assert_called_with('db', 'model', **Model.columns(),
-                                      alias='alias')
+                                      alias='alias', indexes=Model.indexes())
     assert isinstance(Model.__table__, Table)
+    assert Model.__query__.name == 'Model_query'
+    assert Model.__hydrators__ == {}
+
+
+def test_model_query__threads(patch):
+    """
+    Ensures that queries built in different threads don't overwrite each
+    other.
+    """
+    patch.object(Query, 'select')
+    Model.select()
+    queries = []
+    thread = Thread(target=lambda: queries.append(Model.__query__.get()))
+    thread.start()
+    thread.join()
+    assert queries == [None]
+    assert Model.__query__.get() == Query.select()
+
+
+def test_model_make_hydrator():
+    class Users(Model):
+        __table__ = None
+        __slots__ = ('name', 'id')
+    hydrate = Users.make_hydrator(('name', 'id'))
+    result = hydrate(('user', 1, 'extra'))
+    assert isinstance(result, Users)
+    assert result.name == 'user'
+    assert result.id == 1
+
+
+def test_model_make_hydrator__names():
+    """
+    Ensures columns that are not valid attribute names are set too.
+    """
+    class Users(Model):
+        __table__ = None
+    result = Users.make_hydrator(('from', 'first name'))(('a', 'b'))
+    assert getattr(result, 'from') == 'a'
+    assert getattr(result, 'first name') == 'b'
+
+
+def test_model_make_hydrator__init():
+    class Users(Model):
+        __table__ = None
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.initialized = True
+    result = Users.make_hydrator(('name', ))(('user', ))
+    assert result.name == 'user'
+    assert result.initialized is True
+
+
+def test_model_make_hydrator__deferred(magic):
+    class Users(Model):
+        __table__ = magic(columns={'name': 'column', 'id': 'column'})
+    result = Users.make_hydrator(('id', ))((1, ))
+    assert result.id == 1
+    assert result.__deferred__ == {'name'}
+
+
+def test_model_make_hydrator__not_deferred(magic):
+    class Users(Model):
+        __table__ = magic(columns={'id': 'column'})
+    result = Users.make_hydrator(('id', ))((1, ))
+    assert '__deferred__' not in vars(result)
+
+
+def test_model_make_hydrator__init_deferred(magic):
+    class Users(Model):
+        __table__ = magic(columns={'name': 'column', 'id': 'column'})
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+    result = Users.make_hydrator(('id', ))((1, ))
+    assert result.__deferred__ == {'name'}
+
+
+def test_model_hydrator(patch):
+    patch.object(Model, 'make_hydrator')
+    Model.__hydrators__ = {}
+    result = Model.hydrator(('col', ))
+    Model.make_hydrator.assert_called_with(('col', ))
+    assert Model.__hydrators__ == {('col', ): result}
+    assert result == Model.make_hydrator()
+
+
+def test_model_hydrator__cached(patch):
+    patch.object(Model, 'make_hydrator')
+    Model.__hydrators__ = {('col', ): 'hydrate'}
+    assert Model.hydrator(('col', )) == 'hydrate'
+    assert Model.make_hydrator.call_count == 0
 
 
 def test_create_table(magic):
@@ -62,34 +166,45 @@ def test_create_table(magic):
     Model.create_table()
     Model.__db__.execute.assert_called_with(Model.__table__.sql(), None, None,
                                             None, None)
+    Model.__table__.indexes_sql.assert_called_with(False)
+
+
+def test_create_table__indexes(magic):
+    Model.__table__ = magic()
+    Model.__table__.indexes_sql.return_value = ['index']
+    Model.__db__ = magic()
+    Model.create_table(concurrently=True)
+    Model.__table__.indexes_sql.assert_called_with(True)
+    Model.__db__.execute.assert_called_with('index', None, None, None, None)
+    assert Model.__db__.execute.call_count == 2
 
 
 def test_model_execute(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     result = Model.execute()
     query.execute.assert_called_with(None, None)
     assert result == query.execute()
-    assert Model.__query__ is None
+    assert Model.__query__.get() is None
 
 
 def test_model_execute__fetch(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     Model.execute(fetch=True)
     query.execute.assert_called_with(True, None)
 
 
 def test_model_execute_mode(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     Model.execute(mode='mode')
     query.execute.assert_called_with(None, 'mode')
 
 
-def test_model_related_as_dictionary(magic, model, table):
+def test_model_related_as_dictionary(patch, magic, model, table):
     table.relationships = [magic()]
     table.relationships[0].name = 'rel'
     Model.__table__ = table
     item = magic()
-    Model.rel = [item]
+    patch.object(Model, 'rel', [item], create=True)
     assert model.related_as_dictionary({}) == {'rel': [item.as_dictionary()]}
 
 
@@ -102,7 +217,7 @@ def test_model_as_dictionary(patch, model, table):
     patch.object(Model, 'related_as_dictionary')
     table.columns = {'col': 'value'}
     Model.__table__ = table
-    Model.col = 'value'
+    patch.object(Model, 'col', 'value', create=True)
     result = model.as_dictionary()
     Model.related_as_dictionary.assert_called_with({'col': 'value'})
     assert result == Model.related_as_dictionary()
@@ -112,33 +227,261 @@ def test_model_as_dictionary__id(patch, model, table):
     patch.object(Model, 'related_as_dictionary')
     table.columns = {'col': 'value', 'id': 'id'}
     Model.__table__ = table
-    Model.col = 'value'
-    Model.id = 'id'
+    patch.object(Model, 'col', 'value', create=True)
+    patch.object(Model, 'id', 'id', create=True)
     result = model.as_dictionary()
     Model.related_as_dictionary.assert_called_with({'col': 'value',
                                                     'id': 'id'})
     assert result == Model.related_as_dictionary()
 
 
-def test_model_save(patch, model, table, db):
+def test_model_insert_statement(patch, model, table):
     patch.object(Model, 'as_dictionary')
     patch.object(Sql, 'insert')
     Model.__table__ = table
-    Model.__db__ = db
-    model.save(fetch=None)
+    result = model.insert_statement(None)
     table.cast.assert_called_with(Model.as_dictionary())
     Sql.insert.assert_called_with(table.name, None, **table.cast())
-    Model.__db__.execute.assert_called_with(Sql.insert(), [], None, None, None)
+    shape = ('insert', table.name, (), False)
+    assert result == (Sql.insert(), [], None, None, [table], shape)
 
 
-def test_model_save__fetch(patch, model, table, db):
-    patch.many(Model, ['as_dictionary', 'select'])
+def test_model_insert_statement__fetch(patch, model, table):
+    patch.object(Model, 'as_dictionary')
     patch.object(Sql, 'insert')
     Model.__table__ = table
+    result = model.insert_statement(True)
+    Sql.insert.assert_called_with(table.name, table.quoted_columns,
+                                  **table.cast())
+    shape = ('insert', table.name, (), True)
+    assert result == (Sql.insert(), [], 'one', None, [table], shape)
+
+
+def test_model_load_deferred(patch, model, db, table):
+    patch.many(Sql, ['select', 'where', 'join'])
+    patch.object(Model, 'id', 'id', create=True)
+    Model.__db__ = db
+    Model.__table__ = table
+    result = model.load_deferred('col')
+    table.project.assert_called_with(('col', ))
+    Sql.select.assert_called_with(table.project())
+    Sql.where.assert_called_with([('id', '=')])
+    Sql.join.assert_called_with(Sql.select(), Sql.where())
+    db.execute.assert_called_with(Sql.join(), ['id'], 'one', 'dictionaries',
+                                  [table.project()])
+    assert result == db.execute()['col']
+
+
+def test_model_load_deferred__gone(patch, model, db, table):
+    patch.many(Sql, ['select', 'where', 'join'])
+    patch.object(Model, 'id', 'id', create=True)
+    db.execute.return_value = None
+    Model.__db__ = db
+    Model.__table__ = table
+    with raises(AttributeError):
+        model.load_deferred('col')
+
+
+def test_model_getattr(patch):
+    class Users(Model):
+        pass
+    patch.object(Users, 'load_deferred')
+    model = Users()
+    model.__deferred__ = frozenset(('col', 'other'))
+    result = model.col
+    Users.load_deferred.assert_called_with('col')
+    assert result == Users.load_deferred.return_value
+    assert model.col == result
+    assert model.__deferred__ == {'other'}
+    assert Users.load_deferred.call_count == 1
+
+
+def test_model_getattr__deferred_unset(model):
+    """
+    Ensures models with slots get no deferred columns when the slot is not
+    set, rather than recursing.
+    """
+    assert model.__getattr__('__deferred__') == frozenset()
+
+
+@mark.parametrize('name', ['id', 'col', 'other'])
+def test_model_getattr__not_deferred(patch, model, name):
+    """
+    Ensures that only deferred columns are loaded, and not any unset one.
+    """
+    patch.object(Model, 'load_deferred')
+    with raises(AttributeError):
+        model.__getattr__(name)
+    assert Model.load_deferred.call_count == 0
+
+
+def test_model_save(patch, model, db, table):
+    patch.object(Model, 'insert_statement', return_value=('sql', 'shape'))
+    Model.__db__ = db
+    Model.__table__ = table
+    result = model.save(fetch=None)
+    Model.insert_statement.assert_called_with(None)
+    db.execute.assert_called_with('sql', 'shape')
+    db.invalidate.assert_called_with([table.name])
+    assert result == db.execute()
+
+
+def test_model_save__fetch(patch, model, db):
+    patch.object(Model, 'insert_statement')
+    Model.__db__ = db
+    model.save()
+    Model.insert_statement.assert_called_with(True)
+
+
+def test_model_asave(patch, coroutine, run, model, db, table):
+    patch.object(Model, 'insert_statement', return_value=('sql', 'shape'))
+    Model.__db__ = db
+    Model.__table__ = table
+    db.aexecute = coroutine()
+    result = run(model.asave())
+    Model.insert_statement.assert_called_with(True)
+    db.aexecute.assert_called_with('sql')
+    db.invalidate.assert_called_with([table.name])
+    assert result == db.aexecute.return_value
+
+
+def test_model_row_values():
+    assert Model.row_values({'col': 'value'}) == {'col': 'value'}
+
+
+def test_model_row_values__instance(magic):
+    row = magic()
+    assert Model.row_values(row) == row.as_dictionary()
+
+
+def test_model_insert_many(patch, table, db):
+    patch.object(Sql, 'insert_many')
+    table.cast.return_value = {'col': 'value'}
+    Model.__table__ = table
+    Model.__db__ = db
+    result = Model.insert_many([{'col': 'value'}, {'col': 'value'}])
+    table.cast.assert_called_with({'col': 'value'})
+    Sql.insert_many.assert_called_with(table.name, ['col'], 2, None)
+    db.sql.assert_called_with(Sql.insert_many())
+    shape = ('insert_many', table.name, ('col', ), 2, None)
+    db.execute.assert_called_with(db.sql(), ['value', 'value'], None, None,
+                                  [table], shape)
+    db.invalidate.assert_called_with([table.name])
+    assert result is None
+
+
+def test_model_insert_many__pages(patch, table, db):
+    patch.object(Sql, 'insert_many')
+    table.cast.return_value = {'col': 'value'}
+    Model.__table__ = table
+    Model.__db__ = db
+    Model.insert_many([{}, {}, {}], page_size=2)
+    assert db.execute.call_count == 2
+    assert Sql.insert_many.call_args_list[1][0][2] == 1
+
+
+def test_model_insert_many__page_statement(patch, table, db):
+    """
+    Ensures that pages of the same size reuse the same statement.
+    """
+    patch.object(Sql, 'insert_many')
+    table.cast.return_value = {'col': 'value'}
+    Model.__table__ = table
+    Model.__db__ = db
+    Model.insert_many([{}, {}, {}, {}], page_size=2)
+    assert Sql.insert_many.call_count == 1
+
+
+def test_model_insert_many__returning(patch, table, db):
+    patch.object(Sql, 'insert_many')
+    table.cast.return_value = {'col': 'value'}
+    db.execute.return_value = ['id']
+    Model.__table__ = table
+    Model.__db__ = db
+    result = Model.insert_many([{}], returning='id')
+    assert db.execute.call_args[0][2] == 'returned'
+    assert result == ['id']
+
+
+def test_model_insert_many__returning_all(patch, table, db):
+    patch.object(Sql, 'insert_many')
+    table.cast.return_value = {'col': 'value'}
+    db.execute.return_value = ['instance']
+    Model.__table__ = table
+    Model.__db__ = db
+    result = Model.insert_many([{}], returning='*')
+    Sql.insert_many.assert_called_with(table.name, ['col'], 1,
+                                       table.quoted_columns)
+    assert db.execute.call_args[0][2] is True
+    assert result == ['instance']
+
+
+def test_model_insert_many__returning_other(db):
+    Model.__db__ = db
+    with raises(ReturningError):
+        Model.insert_many([{'col': 'value'}], returning='col')
+    assert db.execute.call_count == 0
+
+
+def test_model_insert_many__columns(table, db):
+    """
+    Ensures rows that don't have the same columns are refused, rather than
+    inserted with the columns of the first row.
+    """
+    table.cast.side_effect = lambda row: row
+    Model.__table__ = table
     Model.__db__ = db
-    result = model.save()
-    Model.select().where.assert_called_with(id=db.cursor.fetch_returned())
-    assert result == Model.select().where().one()
+    with raises(RowError):
+        Model.insert_many([{'col': 'value'}, {'other': 'value'}])
+    assert db.execute.call_count == 0
+
+
+def test_model_insert_many__empty(db):
+    Model.__db__ = db
+    assert Model.insert_many([]) is None
+    assert Model.insert_many([], returning='id') == []
+    assert db.execute.call_count == 0
+
+
+def test_model_copy_from(patch, table, db):
+    patch.init(CopyReader)
+    patch.object(CopyReader, 'rows', 10)
+    patch.object(Sql, 'copy_from')
+    table.columns = {'col': 'column', 'id': 'column'}
+    Model.__table__ = table
+    Model.__db__ = db
+    result = Model.copy_from('rows')
+    table.copy_lines.assert_called_with('rows', ['col'], 'text')
+    CopyReader.__init__.assert_called_with(table.copy_lines())
+    Sql.copy_from.assert_called_with(table.name, ['col'], 'text')
+    reader = db.copy_from.call_args[0][1]
+    db.copy_from.assert_called_with(Sql.copy_from(), reader, 65536)
+    db.invalidate.assert_called_with([table.name])
+    assert result['rows'] == 10
+    assert 'seconds' in result
+    assert 'rows_per_second' in result
+
+
+def test_model_copy_from__columns(patch, table, db):
+    patch.init(CopyReader)
+    patch.object(CopyReader, 'rows', 10)
+    patch.object(Sql, 'copy_from')
+    Model.__table__ = table
+    Model.__db__ = db
+    Model.copy_from('rows', columns=['id'], format='csv')
+    table.copy_lines.assert_called_with('rows', ['id'], 'csv')
+
+
+def test_model_copy_from__analyze(patch, table, db):
+    patch.init(CopyReader)
+    patch.object(CopyReader, 'rows', 10)
+    patch.many(Sql, ['copy_from', 'analyze'])
+    table.columns = {}
+    Model.__table__ = table
+    Model.__db__ = db
+    Model.copy_from('rows', analyze=True)
+    Sql.analyze.assert_called_with(table.name)
+    db.execute.assert_called_with(Sql.analyze(), None, None, None, None)
 
 
 def test_model_update(patch):
@@ -149,15 +492,22 @@ def test_model_update(patch):
     assert result == Model
 
 
+def test_model_returning(query):
+    Model.__query__.set(query)
+    result = Model.returning()
+    assert query.returning.call_count == 1
+    assert result == Model
+
+
 def test_model_where(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     result = Model.where(col='value')
     query.where.assert_called_with(col='value')
     assert result == Model
 
 
 def test_model_join(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     result = Model.join('table_name', 'on')
     Model.__db__.get_table.assert_called_with('table_name')
     query.join.assert_called_with(Model.__db__.get_table(), 'on', None)
@@ -165,7 +515,7 @@ def test_model_join(query):
 
 
 def test_model_join__tuple(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     Model.join('table_name', ('table', 'column'))
     Model.__db__.get_table.assert_called_with('table_name')
     query.join.assert_called_with(Model.__db__.get_table(),
@@ -173,7 +523,7 @@ def test_model_join__tuple(query):
 
 
 def test_model_join__join_type(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     Model.join('table_name', 'on', 'outer')
     query.join.assert_called_with(Model.__db__.get_table(), 'on', 'outer')
 
@@ -182,10 +532,18 @@ def test_model_select(patch):
     patch.object(Query, 'select')
     result = Model.select()
     Query.select.assert_called_with(Model.__db__, Model.__table__)
-    assert Model.__query__ == Query.select()
+    assert Model.__query__.get() == Query.select()
+    assert Query.select().ttl is False
     assert result == Model
 
 
+def test_model_select__ttl(patch):
+    patch.object(Query, 'select')
+    patch.object(Model, '__ttl__', 10)
+    Model.select()
+    assert Query.select().ttl == 10
+
+
 def test_model_select__conditions(patch):
     patch.object(Query, 'select')
     Model.select(col='value')
@@ -195,8 +553,9 @@ def test_model_select__conditions(patch):
 def test_model_count(patch):
     patch.object(Query, 'count')
     result = Model.count()
-    Query.count.assert_called_with(Model.__db__, Model.__table__)
-    assert Model.__query__ == Query.count()
+    Query.count.assert_called_with(Model.__db__, Model.__table__, False)
+    assert Model.__query__.get() == Query.count()
+    assert Query.count().ttl is False
     assert result == Model
 
 
@@ -206,6 +565,31 @@ def test_model_count__conditions(patch):
     Query.count().where.assert_called_with(col='value')
 
 
+def test_model_count__estimate(patch):
+    patch.object(Query, 'count')
+    Model.count(estimate=True)
+    Query.count.assert_called_with(Model.__db__, Model.__table__, True)
+
+
+def test_model_exists(patch, query):
+    patch.object(Model, 'execute')
+    Model.__query__.set(query)
+    result = Model.exists()
+    assert query.exists.call_count == 1
+    Model.execute.assert_called_with()
+    assert result == Model.execute()
+
+
+def test_model_exists__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    patch.object(Model, 'execute')
+    Model.__query__.set(None)
+    Model.exists()
+    assert Model.select.call_count == 1
+
+
 def test_model_get(patch):
     patch.object(Model, 'execute')
     result = Model.get()
@@ -215,7 +599,7 @@ def test_model_get(patch):
 
 def test_model_get__no_query(patch):
     patch.many(Model, ['execute', 'select'])
-    Model.__query__ = None
+    Model.__query__.set(None)
     Model.get()
     assert Model.select.call_count == 1
 
@@ -229,11 +613,53 @@ def test_model_dictionaries(patch):
 
 def test_model_dictionaries__no_query(patch):
     patch.many(Model, ['execute', 'select'])
-    Model.__query__ = None
+    Model.__query__.set(None)
     Model.dictionaries()
     assert Model.select.call_count == 1
 
 
+def test_model_tuples(patch):
+    patch.object(Model, 'execute')
+    result = Model.tuples()
+    Model.execute.assert_called_with(fetch=True, mode='tuples')
+    assert result == Model.execute()
+
+
+def test_model_tuples__no_query(patch):
+    patch.many(Model, ['execute', 'select'])
+    Model.__query__.set(None)
+    Model.tuples()
+    assert Model.select.call_count == 1
+
+
+def test_model_rows(patch):
+    patch.object(Model, 'execute')
+    result = Model.rows()
+    Model.execute.assert_called_with(fetch=True, mode='rows')
+    assert result == Model.execute()
+
+
+def test_model_rows__no_query(patch):
+    patch.many(Model, ['execute', 'select'])
+    Model.__query__.set(None)
+    Model.rows()
+    assert Model.select.call_count == 1
+
+
+def test_model_columnar(patch):
+    patch.object(Model, 'execute')
+    result = Model.columnar()
+    Model.execute.assert_called_with(fetch=True, mode='columns')
+    assert result == Model.execute()
+
+
+def test_model_columnar__no_query(patch):
+    patch.many(Model, ['execute', 'select'])
+    Model.__query__.set(None)
+    Model.columnar()
+    assert Model.select.call_count == 1
+
+
 def test_model_dictionary(patch):
     patch.object(Model, 'execute')
     result = Model.dictionary()
@@ -243,7 +669,7 @@ def test_model_dictionary(patch):
 
 def test_model_dictionary__no_query(patch):
     patch.many(Model, ['execute', 'select'])
-    Model.__query__ = None
+    Model.__query__.set(None)
     Model.dictionary()
     assert Model.select.call_count == 1
 
@@ -257,34 +683,210 @@ def test_model_one(patch):
 
 def test_model_one__no_query(patch):
     patch.many(Model, ['execute', 'select'])
-    Model.__query__ = None
+    Model.__query__.set(None)
     Model.one()
     Model.select.call_count == 1
 
 
+def test_model_aget(patch):
+    patch.object(Model, 'pop_query')
+    result = Model.aget()
+    Model.pop_query().aexecute.assert_called_with(True, None)
+    assert result == Model.pop_query().aexecute()
+
+
+def test_model_aone(patch):
+    patch.object(Model, 'pop_query')
+    result = Model.aone()
+    Model.pop_query().aexecute.assert_called_with('one', None)
+    assert result == Model.pop_query().aexecute()
+
+
+def test_model_acount(patch):
+    patch.many(Model, ['count', 'pop_query'])
+    result = Model.acount(col='value')
+    Model.count.assert_called_with(False, col='value')
+    Model.pop_query().aexecute.assert_called_with(None, None)
+    assert result == Model.pop_query().aexecute()
+
+
+def test_model_aexists(patch):
+    patch.object(Model, 'pop_query')
+    result = Model.aexists()
+    assert Model.pop_query().exists.call_count == 1
+    Model.pop_query().aexecute.assert_called_with(None, None)
+    assert result == Model.pop_query().aexecute()
+
+
+def test_model_pop_query(query):
+    Model.__query__.set(query)
+    assert Model.pop_query() == query
+    assert Model.__query__.get() is None
+
+
+def test_model_pop_query__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    assert Model.pop_query() == query
+    assert Model.select.call_count == 1
+
+
+def test_model_copy_to(patch):
+    patch.object(Model, 'pop_query')
+    result = Model.copy_to('file')
+    Model.pop_query().copy_to.assert_called_with('file', 'csv')
+    assert result == Model.pop_query().copy_to()
+
+
+def test_model_copy_chunks(patch):
+    patch.object(Model, 'pop_query')
+    result = Model.copy_chunks(format='binary')
+    Model.pop_query().copy_chunks.assert_called_with('binary', 16)
+    assert result == Model.pop_query().copy_chunks()
+
+
+def test_model_iterate(patch):
+    patch.object(Model, 'pop_query')
+    result = Model.iterate()
+    Model.pop_query().iterate.assert_called_with(2000, None)
+    assert result == Model.pop_query().iterate()
+
+
+def test_model_iterate__mode(patch):
+    patch.object(Model, 'pop_query')
+    Model.iterate(itersize=10, mode='dictionaries')
+    Model.pop_query().iterate.assert_called_with(10, 'dictionaries')
+
+
+def test_model_prefetch(query):
+    Model.__query__.set(query)
+    result = Model.prefetch('one', 'two')
+    query.prefetch.assert_called_with('one', 'two')
+    assert result == Model
+
+
+def test_model_prefetch__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    Model.prefetch('one')
+    assert Model.select.call_count == 1
+
+
+def test_model_only(query):
+    Model.__query__.set(query)
+    result = Model.only('one', trees='two')
+    query.only.assert_called_with('one', trees='two')
+    assert result == Model
+
+
+def test_model_only__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    Model.only('one')
+    assert Model.select.call_count == 1
+
+
+def test_model_defer(query):
+    Model.__query__.set(query)
+    result = Model.defer('one', trees='two')
+    query.defer.assert_called_with('one', trees='two')
+    assert result == Model
+
+
+def test_model_defer__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    Model.defer('one')
+    assert Model.select.call_count == 1
+
+
+def test_model_cached(query):
+    Model.__query__.set(query)
+    result = Model.cached(10)
+    query.cached.assert_called_with(10)
+    assert result == Model
+
+
+def test_model_cached__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    Model.cached()
+    assert Model.select.call_count == 1
+    query.cached.assert_called_with(None)
+
+
+def test_model_aggregate(query):
+    Model.__query__.set(query)
+    result = Model.aggregate(n='count')
+    query.aggregate.assert_called_with(n='count')
+    assert result == Model
+
+
+def test_model_aggregate__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    Model.aggregate(n='count')
+    assert Model.select.call_count == 1
+
+
+def test_model_group_by(query):
+    Model.__query__.set(query)
+    result = Model.group_by('user')
+    query.group_by.assert_called_with('user')
+    assert result == Model
+
+
+def test_model_group_by__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    Model.group_by('user')
+    assert Model.select.call_count == 1
+
+
+def test_model_having(query):
+    Model.__query__.set(query)
+    result = Model.having(n='>5')
+    query.having.assert_called_with(n='>5')
+    assert result == Model
+
+
 def test_model_order_by(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     result = Model.order_by(col='asc')
     query.order_by.assert_called_with(col='asc')
     assert result == Model
 
 
 def test_model_random(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     result = Model.random()
     assert query.random.call_count == 1
     assert result == Model
 
 
 def test_model_limit(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     result = Model.limit(1)
     query.limit.assert_called_with(1, None)
     assert result == Model
 
 
 def test_model_limit__offset(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     Model.limit(1, 2)
     query.limit.assert_called_with(1, 2)
 
@@ -296,11 +898,71 @@ def test_model_paginate(patch):
     assert result == Model.limit()
 
 
+def test_model_after(query):
+    Model.__query__.set(query)
+    result = Model.after('token', id=1)
+    query.after.assert_called_with('token', id=1)
+    assert result == Model
+
+
+def test_model_after__no_query(patch, query):
+    def select():
+        Model.__query__.set(query)
+    patch.object(Model, 'select', side_effect=select)
+    Model.__query__.set(None)
+    Model.after(id=1)
+    assert Model.select.call_count == 1
+    query.after.assert_called_with(None, id=1)
+
+
+def test_model_page(patch, magic, query):
+    patch.object(Model, 'pop_query', return_value=query)
+    query.seek_order.return_value = {'id': 'asc'}
+    query.execute.return_value = [magic(id=1), magic(id=2)]
+    items, token = Model.page()
+    query.execute.assert_called_with(True, None)
+    query.encode_token.assert_called_with([2])
+    assert items == query.execute()
+    assert token == query.encode_token()
+
+
+def test_model_page__dictionaries(patch, query):
+    patch.object(Model, 'pop_query', return_value=query)
+    query.seek_order.return_value = {'name': 'asc', 'id': 'asc'}
+    query.execute.return_value = [{'id': 1, 'name': 'a'}]
+    Model.page(mode='dictionaries')
+    query.execute.assert_called_with(True, 'dictionaries')
+    query.encode_token.assert_called_with(['a', 1])
+
+
+def test_model_page__rows(patch, query):
+    patch.object(Model, 'pop_query', return_value=query)
+    query.seek_order.return_value = {'id': 'asc'}
+    query.execute.return_value = [namedtuple('Row', ['id'])(3)]
+    Model.page(mode='rows')
+    query.execute.assert_called_with(True, 'rows')
+    query.encode_token.assert_called_with([3])
+
+
+@mark.parametrize('mode', ['tuples', 'columns'])
+def test_model_page__mode(patch, query, mode):
+    patch.object(Model, 'pop_query', return_value=query)
+    with raises(PaginationError):
+        Model.page(mode=mode)
+    assert query.execute.call_count == 0
+
+
+def test_model_page__empty(patch, query):
+    patch.object(Model, 'pop_query', return_value=query)
+    query.execute.return_value = []
+    assert Model.page() == ([], None)
+
+
 def test_model_delete(patch):
     patch.object(Query, 'delete')
     result = Model.delete()
     Query.delete.assert_called_with(Model.__db__, Model.__table__)
-    assert Model.__query__ == Query.delete()
+    assert Model.__query__.get() == Query.delete()
     assert result == Model
 
 
@@ -315,7 +977,7 @@ def test_model_truncate(patch):
     patch.object(Model, 'execute')
     result = Model.truncate()
     Query.truncate.assert_called_with(Model.__db__, Model.__table__, None)
-    assert Model.__query__ == Query.truncate()
+    assert Model.__query__.get() == Query.truncate()
     assert result == Model.execute()
 
 
@@ -331,7 +993,7 @@ def test_model_drop(patch):
     patch.object(Model, 'execute')
     result = Model.drop()
     Query.drop.assert_called_with(Model.__db__, Model.__table__, None)
-    assert Model.__query__ == Query.drop()
+    assert Model.__query__.get() == Query.drop()
     assert result == Model.execute()
 
 
@@ -343,11 +1005,12 @@ def test_model_drop__cascade(patch):
 
 
 def test_model_sql(query):
-    Model.__query__ = query
+    Model.__query__.set(query)
     assert Model.sql() == query.sql()
 
 
 def test_model_eq(patch, model):
+    patch.object(Model, 'id', 'id', create=True)
     assert model == Model(col='value')
 
 
@@ -359,6 +1022,7 @@ def test_model_eq__not(patch):
     assert Model(id=1) == Model(id=2)
 
 
-def test_model_repr(model):
+def test_model_repr(patch, model):
+    patch.object(Model, 'id', 'id', create=True)
     model.__table__.name = 'table'
     assert str(model) == '<Table(id)>'
@@ -0,0 +1,119 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import weakref
+
+from psyker import Foreign, Model, ModelFactory
+from psyker.ModelMeta import ModelMeta
+
+
+def test_model_meta():
+    assert type(Model) == ModelMeta
+    assert Model.__slots__ == ()
+
+
+def test_model_meta_new():
+    class Users(Model):
+        @classmethod
+        def columns(cls):
+            return {'name': 'str', 'team': Foreign('team', 'teams')}
+    slots = ('name', 'team', 'id', 'teams', '__deferred__', '__weakref__',
+             '__dict__')
+    assert Users.__slots__ == slots
+
+
+def test_model_meta_new__instances():
+    """
+    Ensures instances don't allocate a __dict__ unless an attribute that is
+    not a column is set.
+    """
+    class Users(Model):
+        @classmethod
+        def columns(cls):
+            return {'name': 'str'}
+    user = Users(name='user', id=1)
+    assert 'name' not in user.__dict__
+    user.extra = 'extra'
+    assert user.__dict__ == {'extra': 'extra'}
+    assert weakref.ref(user)() == user
+
+
+def test_model_meta_new__no_fallback():
+    class Users(Model, fallback=False):
+        @classmethod
+        def columns(cls):
+            return {'name': 'str'}
+    assert Users.__slots__ == ('name', 'id', '__deferred__', '__weakref__')
+
+
+def test_model_meta_new__slots():
+    class Users(Model):
+        __slots__ = ('name', )
+
+        @classmethod
+        def columns(cls):
+            return {'name': 'str'}
+    assert Users.__slots__ == ('name', )
+
+
+def test_model_meta_new__abstract():
+    class Base(Model):
+        pass
+    assert Base.__slots__ == ('__weakref__', '__dict__')
+
+
+def test_model_meta_new__columns_error():
+    class Users(Model):
+        @classmethod
+        def columns(cls):
+            raise ValueError()
+    assert '__slots__' not in Users.__dict__
+
+
+def test_model_meta_new__factory():
+    model = ModelFactory.make('users', {'name': 'str'})
+    assert model.__slots__ == ('name', 'id', '__deferred__', '__weakref__',
+                               '__dict__')
+
+
+def test_model_meta_names():
+    columns = {'name': 'str', 'team': Foreign('team', 'teams')}
+    assert ModelMeta.names(columns) == ['name', 'team', 'id', 'teams']
+
+
+def test_model_meta_slots():
+    result = ModelMeta.slots((Model, ), {}, {'name': 'str'})
+    assert result == ('name', 'id', '__deferred__', '__weakref__', '__dict__')
+
+
+def test_model_meta_slots__no_fallback():
+    result = ModelMeta.slots((Model, ), {}, {'name': 'str'}, False)
+    assert result == ('name', 'id', '__deferred__', '__weakref__')
+
+
+def test_model_meta_slots__deferred():
+    """
+    Ensures the slot of deferred columns is not added again to models that
+    inherit it.
+    """
+    class Users(Model):
+        @classmethod
+        def columns(cls):
+            return {'name': 'str'}
+    result = ModelMeta.slots((Users, ), {}, {'name': 'str', 'age': 'int'})
+    assert result == ('age', )
+
+
+def test_model_meta_slots__names():
+    """
+    Ensures names that can't be slots, or are taken, are skipped.
+    """
+    class Base(Model):
+        __slots__ = ('taken', '__weakref__', '__dict__')
+    columns = {'first name': 'str', 'from': 'str', 'taken': 'str',
+               'columns': 'str'}
+    result = ModelMeta.slots((Base, ), {'columns': None}, columns)
+    assert result == ('id', '__deferred__')
@@ -0,0 +1,272 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+from threading import Thread
+
+from psyker.Pool import Pool
+from psyker.exceptions import PoolTimeout
+
+from pytest import fixture, raises
+
+
+@fixture
+def connection(magic):
+    """
+    A connection that is fresh, healthy and idle.
+    """
+    connection = magic(used=time.monotonic())
+    connection.expired.return_value = False
+    connection.idle.return_value = False
+    connection.healthy.return_value = True
+    connection.broken.return_value = False
+    return connection
+
+
+@fixture
+def pool(magic, connection):
+    return Pool(magic(return_value=connection), minimum=1, maximum=2,
+                timeout=0.01)
+
+
+def test_pool_init(pool):
+    assert pool.minimum == 1
+    assert pool.maximum == 2
+    assert pool.timeout == 0.01
+    assert pool.lifetime == 3600.0
+    assert pool.idle == 600.0
+    assert pool.ping == 1.0
+    assert pool.connections == deque()
+    assert pool.size == 0
+    assert pool.stopped.is_set() is False
+    assert pool.reaper is None
+
+
+def test_pool_init__maximum(magic):
+    assert Pool(magic(), minimum=4, maximum=2).maximum == 4
+
+
+def test_pool_interval(pool):
+    assert pool.interval() == 300.0
+
+
+def test_pool_interval__none(pool):
+    pool.idle = None
+    pool.lifetime = None
+    assert pool.interval() is None
+
+
+def test_pool_open(patch, pool):
+    patch.object(Pool, 'fill')
+    pool.open()
+    assert Pool.fill.call_count == 1
+    assert pool.reaper.daemon is True
+    assert pool.reaper.is_alive()
+    pool.close()
+
+
+def test_pool_open__no_reaper(patch, pool):
+    patch.object(Pool, 'fill')
+    patch.object(Pool, 'interval', return_value=None)
+    pool.open()
+    assert pool.reaper is None
+
+
+def test_pool_make(pool, connection):
+    assert pool.make() == connection
+
+
+def test_pool_make__error(pool):
+    pool.size = 1
+    pool.factory.side_effect = ValueError
+    with raises(ValueError):
+        pool.make()
+    assert pool.size == 0
+
+
+def test_pool_fill(pool, connection):
+    pool.minimum = 2
+    pool.fill()
+    assert pool.size == 2
+    assert list(pool.connections) == [connection, connection]
+
+
+def test_pool_fill__stopped(pool):
+    pool.stopped.set()
+    pool.fill()
+    assert pool.size == 0
+
+
+def test_pool_checkout(pool, connection):
+    assert pool.checkout() == connection
+    assert pool.size == 1
+
+
+def test_pool_checkout__idle(pool, connection):
+    pool.connections.append(connection)
+    pool.size = 1
+    assert pool.checkout() == connection
+    assert pool.factory.call_count == 0
+    assert connection.healthy.call_args[0][0] == pool.ping
+
+
+def test_pool_checkout__lifo(pool, connection):
+    pool.connections.extend(['old', connection])
+    pool.size = 2
+    assert pool.checkout() == connection
+
+
+def test_pool_checkout__unhealthy(magic, pool, connection):
+    unhealthy = magic()
+    unhealthy.expired.return_value = False
+    unhealthy.healthy.return_value = False
+    pool.connections.append(unhealthy)
+    pool.size = 1
+    assert pool.checkout() == connection
+    assert unhealthy.close.call_count == 1
+    assert pool.size == 1
+
+
+def test_pool_checkout__expired(magic, pool, connection):
+    expired = magic()
+    expired.expired.return_value = True
+    pool.connections.append(expired)
+    pool.size = 1
+    pool.checkout()
+    assert expired.close.call_count == 1
+
+
+def test_pool_checkout__timeout(pool):
+    pool.size = 2
+    with raises(PoolTimeout):
+        pool.checkout()
+
+
+def test_pool_checkout__wait(pool, connection):
+    """
+    Ensures that checkout waits for a connection to be checked in.
+    """
+    pool.timeout = 5
+    pool.size = 2
+    thread = Thread(target=pool.checkin, args=(connection, ))
+    thread.start()
+    assert pool.checkout() == connection
+    thread.join()
+    assert pool.factory.call_count == 0
+
+
+def test_pool_checkin(pool, connection):
+    pool.size = 1
+    pool.checkin(connection)
+    assert list(pool.connections) == [connection]
+    assert pool.size == 1
+
+
+def test_pool_checkin__broken(pool, connection):
+    connection.broken.return_value = True
+    pool.size = 1
+    pool.checkin(connection)
+    assert connection.close.call_count == 1
+    assert pool.size == 0
+
+
+def test_pool_checkin__expired(pool, connection):
+    connection.expired.return_value = True
+    pool.size = 1
+    pool.checkin(connection)
+    assert connection.close.call_count == 1
+
+
+def test_pool_checkin__stopped(pool, connection):
+    pool.size = 1
+    pool.stopped.set()
+    pool.checkin(connection)
+    assert connection.close.call_count == 1
+    assert len(pool.connections) == 0
+
+
+def test_pool_discard(pool, connection):
+    pool.size = 1
+    pool.discard(connection)
+    assert connection.close.call_count == 1
+    assert pool.size == 0
+
+
+def test_pool_reap(magic, pool, connection):
+    idle = magic()
+    idle.expired.return_value = False
+    idle.idle.return_value = True
+    pool.connections.extend([idle, connection])
+    pool.size = 2
+    assert pool.reap() == 1
+    assert idle.close.call_count == 1
+    assert list(pool.connections) == [connection]
+
+
+def test_pool_reap__minimum(pool, connection):
+    connection.idle.return_value = True
+    pool.connections.append(connection)
+    pool.size = 1
+    assert pool.reap() == 0
+    assert list(pool.connections) == [connection]
+
+
+def test_pool_reap__expired(magic, pool, connection):
+    """
+    Ensures expired connections are reaped even under the minimum, and
+    replaced.
+    """
+    expired = magic()
+    expired.expired.return_value = True
+    pool.connections.append(expired)
+    pool.size = 1
+    assert pool.reap() == 1
+    assert list(pool.connections) == [connection]
+    assert pool.size == 1
+
+
+def test_pool_reap_every(patch, magic, pool):
+    patch.object(Pool, 'reap')
+    pool.stopped = magic()
+    pool.stopped.wait.side_effect = [False, False, True]
+    pool.reap_every(1)
+    pool.stopped.wait.assert_called_with(1)
+    assert Pool.reap.call_count == 2
+
+
+def test_pool_reap_every__error(patch, magic, pool):
+    """
+    Ensures the reaper keeps running when reaping fails, e.g. because the
+    database is down.
+    """
+    logger = patch('psyker.Pool.logger')
+    patch.object(Pool, 'reap', side_effect=ValueError)
+    pool.stopped = magic()
+    pool.stopped.wait.side_effect = [False, False, True]
+    pool.reap_every(1)
+    assert Pool.reap.call_count == 2
+    logger.exception.assert_called_with('Reaping the pool failed')
+    assert logger.exception.call_count == 2
+
+
+def test_pool_stats(pool, connection):
+    pool.connections.append(connection)
+    pool.size = 2
+    assert pool.stats() == {'size': 2, 'idle': 1, 'used': 1}
+
+
+def test_pool_close(pool, connection):
+    pool.connections.append(connection)
+    pool.size = 1
+    pool.close()
+    assert pool.stopped.is_set()
+    assert connection.close.call_count == 1
+    assert pool.size == 0
+
+
+def test_pool_repr(pool):
+    assert repr(pool) == '<Pool(0/2)>'
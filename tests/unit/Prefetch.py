@@ -0,0 +1,97 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.Prefetch import Prefetch
+from psyker.Sql import Sql
+from psyker.columns import Column, Foreign
+from psyker.exceptions import RelationshipError
+
+from pytest import fixture, raises
+
+
+@fixture
+def tables(magic):
+    """
+    Makes users and todos tables, where todos reference users.
+    """
+    users = magic(columns={'name': Column('name', 'str')},
+                  reverse_relationships=[], relationships=[])
+    users.name = 'users'
+    todos = magic(columns={'owner': Foreign('owner', 'users')},
+                  reverse_relationships=[], relationships=[users])
+    todos.name = 'todos'
+    users.reverse_relationships = [todos]
+    return users, todos
+
+
+@fixture
+def prefetch(tables):
+    return Prefetch(tables[1], 'owner', 'id')
+
+
+def test_prefetch_init(tables, prefetch):
+    assert prefetch.related == tables[1]
+    assert prefetch.column == 'owner'
+    assert prefetch.key == 'id'
+
+
+def test_prefetch_make(tables):
+    users, todos = tables
+    result = Prefetch.make(todos, 'users')
+    assert result.related == users
+    assert result.column == 'id'
+    assert result.key == 'owner'
+
+
+def test_prefetch_make__reverse(tables):
+    users, todos = tables
+    result = Prefetch.make(users, 'todos')
+    assert result.related == todos
+    assert result.column == 'owner'
+    assert result.key == 'id'
+
+
+def test_prefetch_make__error(tables):
+    with raises(RelationshipError):
+        Prefetch.make(tables[0], 'bees')
+
+
+def test_prefetch_value(magic):
+    assert Prefetch.value({'id': 1}, 'id') == 1
+    assert Prefetch.value(magic(id=1), 'id') == 1
+
+
+def test_prefetch_assign(magic):
+    item = {}
+    Prefetch.assign(item, 'todos', [])
+    assert item == {'todos': []}
+    item = magic()
+    Prefetch.assign(item, 'todos', [])
+    assert item.todos == []
+
+
+def test_prefetch_keys(prefetch):
+    items = [{'id': 1}, {'id': 2}, {'id': 1}, {'id': None}]
+    assert sorted(prefetch.keys(items)) == [1, 2]
+
+
+def test_prefetch_statement(patch, magic, prefetch):
+    patch.many(Sql, ['join', 'select', 'any'])
+    column = magic()
+    prefetch.related.columns = {'owner': column}
+    result = prefetch.statement()
+    Sql.select.assert_called_with(prefetch.related)
+    Sql.any.assert_called_with('owner', column.array_type())
+    Sql.join.assert_called_with(Sql.select(), Sql.any())
+    assert result == Sql.join()
+
+
+def test_prefetch_stitch(prefetch):
+    items = [{'id': 1}, {'id': 2}]
+    related = [{'owner': 1}, {'owner': 1}, {'owner': 3}]
+    prefetch.stitch(items, related)
+    assert items[0]['todos'] == [{'owner': 1}, {'owner': 1}]
+    assert items[1]['todos'] == []
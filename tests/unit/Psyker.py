@@ -5,6 +5,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
 from psyker import Db, ModelFactory, Psyker
+from psyker.Session import Session
 
 from pytest import fixture
 
@@ -44,8 +45,8 @@ def test_psyker_make_model(patch, psyker):
     patch.many(Psyker, ['add_models', 'create_tables'])
     result = psyker.make_model('name', 'fields')
     Psyker.add_models.assert_called_with(result)
-    result.setup.assert_called_with(psyker.db, len(psyker.models))
-    assert psyker.db.cursor.models == psyker.models
+    result.setup.assert_called_with(psyker.db, f't{len(psyker.models)}')
+    assert psyker.db.models == psyker.models
     assert Psyker.create_tables.call_count == 1
     assert result == ModelFactory.make()
 
@@ -53,7 +54,13 @@ def test_psyker_make_model(patch, psyker):
 def test_psyker_create_tables(magic, psyker):
     psyker.models = {'model': magic()}
     psyker.create_tables()
-    assert psyker.models['model'].create_table.call_count == 1
+    psyker.models['model'].create_table.assert_called_with(False)
+
+
+def test_psyker_create_tables__concurrently(magic, psyker):
+    psyker.models = {'model': magic()}
+    psyker.create_tables(concurrently=True)
+    psyker.models['model'].create_table.assert_called_with(True)
 
 
 def test_psyker_start(patch, psyker):
@@ -69,6 +76,24 @@ def test_psyker_start(patch, psyker):
     assert Psyker.create_tables.call_count == 1
 
 
+def test_psyker_start__options(patch, psyker):
+    patch.init(Db)
+    patch.object(Db, 'start')
+    patch.many(Psyker, ['create_tables', 'setup_models'])
+    psyker.start('url', cache_size=0)
+    Db.__init__.assert_called_with('url', psyker.models, cache_size=0)
+
+
+def test_psyker_transaction(psyker):
+    result = psyker.transaction('serializable', True)
+    psyker.db.transaction.assert_called_with('serializable', True)
+    assert result == psyker.db.transaction()
+
+
+def test_psyker_session():
+    assert type(Psyker.session()) == Session
+
+
 def test_psyker_connect(psyker):
     psyker.connect()
     assert psyker.db.connect.call_count == 1
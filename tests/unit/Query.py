@@ -4,10 +4,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+from datetime import date
+
+from psyker.Prefetch import Prefetch
 from psyker.Query import Query
 from psyker.Sql import Sql
+from psyker.Table import Table
+from psyker.exceptions import (AggregateError, ColumnError, PaginationError,
+                               RelationshipError)
 
-from pytest import fixture, mark
+from pytest import fixture, mark, raises
 
 
 @fixture
@@ -25,6 +31,25 @@ def test_query_init(query):
     assert query.options == {}
     assert query._limit is None
     assert query._offset is None
+    assert query._returning is None
+    assert query.keyset is None
+    assert query.ttl is False
+    assert query.prefetches == []
+    assert query.aggregates == {}
+    assert query.group == ()
+    assert query._having is None
+
+
+def test_query_writers():
+    assert Query.writers == ('update', 'delete', 'truncate', 'drop')
+
+
+def test_query_counters():
+    assert Query.counters == ('count', 'estimate', 'exists')
+
+
+def test_query_functions():
+    assert Query.functions == ('count', 'sum', 'avg', 'min', 'max')
 
 
 def test_query_init__options():
@@ -50,10 +75,14 @@ def test_query_parse_condition__tuple(value):
     assert result == ('col', value[0], (value[1], ))
 
 
+def test_query_parse_condition__value():
+    assert Query.parse_condition(('col', 5)) == ('col', '=', 5)
+
+
 def test_query_head(patch, table):
     patch.object(Sql, 'select')
     result = Query.head('select', [table], 'options')
-    Sql.select.assert_called_with(table.name, table.columns)
+    Sql.select.assert_called_with(table)
     assert result == Sql.select()
 
 
@@ -88,10 +117,32 @@ def test_query_head__drop(patch, table):
 def test_query_head__count(patch, table):
     patch.object(Sql, 'count')
     result = Query.head('count', [table], 'options')
-    Sql.count.assert_called_with(table.name)
+    Sql.count.assert_called_with(table)
     assert result == Sql.count()
 
 
+def test_query_head__estimate(patch, table):
+    patch.object(Sql, 'estimate')
+    result = Query.head('estimate', [table], 'options')
+    Sql.estimate.assert_called_with(table)
+    assert result == Sql.estimate()
+
+
+@mark.parametrize('query_type', ['exists', 'explain'])
+def test_query_head__exists(patch, table, query_type):
+    patch.object(Sql, 'select_one')
+    result = Query.head(query_type, [table], 'options')
+    Sql.select_one.assert_called_with(table)
+    assert result == Sql.select_one()
+
+
+def test_query_head__exists_join(patch, table):
+    patch.object(Sql, 'join_statement')
+    result = Query.head('exists', [table, table], 'options')
+    Sql.join_statement.assert_called_with([table, table], 'options')
+    assert result == Sql.join_statement()
+
+
 def test_query_head__join(patch, table):
     patch.object(Sql, 'join_statement')
     result = Query.head('join', [table], 'options')
@@ -99,6 +150,23 @@ def test_query_head__join(patch, table):
     assert result == Sql.join_statement()
 
 
+def test_query_fingerprint(patch, magic):
+    patch.init(Table)
+    table = Table()
+    table.name = 'name'
+    table.alias = 't0'
+    table.columns = {'col': 'column'}
+    assert Query.fingerprint(table) == ('name', 't0', ('col', ))
+
+
+def test_query_fingerprint__dict():
+    assert Query.fingerprint({'key': ['value']}) == (('key', ('value', )), )
+
+
+def test_query_fingerprint__value():
+    assert Query.fingerprint('value') == 'value'
+
+
 def test_query_select(patch):
     patch.init(Query)
     result = Query.select('db', 'table')
@@ -112,21 +180,22 @@ def test_query_update(patch):
     Query.__init__.assert_called_with('db', 'update', 'table')
     assert isinstance(result, Query)
     assert result.targets == ('table', {'col': 'value'})
-    assert result.params == ['value']
 
 
 def test_query_delete(patch):
     patch.init(Query)
+    patch.object(Query, 'where')
     result = Query.delete('db', 'table')
     Query.__init__.assert_called_with('db', 'delete', 'table')
     assert isinstance(result, Query)
-    assert result.params == []
+    assert Query.where.call_count == 0
 
 
 def test_query_delete__conditions(patch):
     patch.init(Query)
-    result = Query.delete('db', 'table', col='value')
-    assert result.params == ['value']
+    patch.object(Query, 'where')
+    Query.delete('db', 'table', col='value')
+    Query.where.assert_called_with(col='value')
 
 
 def test_query_truncate(patch):
@@ -151,6 +220,12 @@ def test_query_count(patch):
     assert isinstance(result, Query)
 
 
+def test_query_count__estimate(patch):
+    patch.init(Query)
+    Query.count('db', 'table', estimate=True)
+    Query.__init__.assert_called_with('db', 'estimate', 'table')
+
+
 def test_query_on(magic):
     target = magic(columns=['on'])
     assert Query.on([target], 'on') == (target, 'on', 'id')
@@ -166,21 +241,43 @@ def test_query_on__one_to_many(magic):
     assert Query.on([target], 'on') == (target, 'id', 'on')
 
 
-def test_query_join(patch, query, table):
+def test_query_on__columns(magic):
+    """
+    Ensures the direction of a join is found on the given columns, which
+    the first target may not have after a projection.
+    """
+    target = magic(columns=[])
+    assert Query.on([target], 'on', ['on']) == (target, 'on', 'id')
+
+
+def test_query_join(patch, magic, query, table):
     patch.object(Query, 'on')
+    query.db = magic()
+    target = magic()
+    query.targets = [target]
     query.join(table, 'on')
-    Query.on.assert_called_with(query.targets, 'on')
-    assert query.targets == ['table', table]
+    query.db.get_table.assert_called_with(target.name)
+    columns = query.db.get_table().columns
+    Query.on.assert_called_with(query.targets, 'on', columns)
+    assert query.targets == [target, table]
     assert query.query_type == 'join'
     assert query.options[table.name] == Query.on()
 
 
-def test_query_join__type(patch, query, table):
+def test_query_join__type(patch, magic, query, table):
     patch.object(Query, 'on')
+    query.db = magic()
+    query.targets = [magic()]
     query.join(table, 'on', 'outer')
     assert query.query_type == 'outer'
 
 
+def test_query_join__aggregate(query, table):
+    query.query_type = 'aggregate'
+    with raises(AggregateError):
+        query.join(table, 'on')
+
+
 def test_query_where(patch, query):
     patch.object(Query, 'parse_condition', return_value=[0, 1, 2])
     query.where(col='value')
@@ -189,6 +286,26 @@ def test_query_where(patch, query):
     assert query.params == [2]
 
 
+def test_query_where__update(patch):
+    """
+    Ensures that conditions are added after the values of an update.
+    """
+    query = Query.update('db', 'table', {'col': 'value'})
+    query.where(col='other')
+    assert query.params == ['value', 'other']
+
+
+def test_query_where__replaces(query):
+    """
+    Ensures that where replaces the conditions given earlier, such as the
+    ones of select, together with their params.
+    """
+    query.where(name='a')
+    query.where(age='3')
+    assert query.conditions == [('age', '=', '3')]
+    assert query.params == ['3']
+
+
 def test_query_order_by(query):
     query.order_by(col='desc')
     assert query.order == {'col': 'desc'}
@@ -208,6 +325,204 @@ def test_query_limit(query):
 def test_query_limit__offset(query):
     query.limit(1, 2)
     assert query._offset == 2
+    assert query.params == [1, 2]
+
+
+def test_query_encode_token():
+    assert Query.decode_token(Query.encode_token([1, 'a'])) == [1, 'a']
+
+
+def test_query_encode_token__default():
+    """
+    Ensures values that are not json-serializable are stored as strings.
+    """
+    token = Query.encode_token([date(2019, 1, 1)])
+    assert Query.decode_token(token) == ['2019-01-01']
+
+
+def test_query_seek_order(query):
+    assert query.seek_order() == {'id': 'asc'}
+    assert query.order == {'id': 'asc'}
+
+
+def test_query_seek_order__keys(query):
+    assert query.seek_order(('name', 'id')) == {'name': 'asc', 'id': 'asc'}
+
+
+def test_query_seek_order__order(query):
+    query.order = {'name': 'desc', 'id': 'desc'}
+    assert query.seek_order(('id', )) == {'name': 'desc', 'id': 'desc'}
+
+
+def test_query_seek_order__tie_breaker(magic, query):
+    """
+    Ensures that the id is appended to the order, so that rows with the same
+    values are not skipped between pages.
+    """
+    query.targets = [magic(columns={'id': 'column'})]
+    query.order = {'name': 'desc'}
+    assert query.seek_order() == {'name': 'desc', 'id': 'desc'}
+    assert query.order == {'name': 'desc', 'id': 'desc'}
+
+
+def test_query_seek_order__no_id(magic, query):
+    query.targets = [magic(columns={})]
+    query.order = {'name': 'desc'}
+    assert query.seek_order() == {'name': 'desc'}
+
+
+@mark.parametrize('order', ['random', {'name': 'asc', 'id': 'desc'}])
+def test_query_seek_order__error(query, order):
+    query.order = order
+    with raises(PaginationError):
+        query.seek_order()
+
+
+def test_query_after(patch, query):
+    patch.object(Query, 'seek_order', return_value={'id': 'asc'})
+    query.after(id=1)
+    Query.seek_order.assert_called_with({'id': 1})
+    assert query.keyset == (('id', ), '>')
+    assert query.params == [1]
+
+
+def test_query_after__desc(patch, query):
+    order = {'name': 'desc', 'id': 'desc'}
+    patch.object(Query, 'seek_order', return_value=order)
+    query.after(id=1, name='a')
+    assert query.keyset == (('name', 'id'), '<')
+    assert query.params == ['a', 1]
+
+
+def test_query_after__token(patch, query):
+    patch.object(Query, 'seek_order', return_value={'id': 'asc'})
+    patch.object(Query, 'decode_token', return_value=[1])
+    query.after('token')
+    Query.decode_token.assert_called_with('token')
+    assert query.params == [1]
+
+
+def test_query_after__token_columns(patch, query):
+    order = {'name': 'asc', 'id': 'asc'}
+    patch.object(Query, 'seek_order', return_value=order)
+    patch.object(Query, 'decode_token', return_value=[1])
+    with raises(PaginationError):
+        query.after('token')
+
+
+def test_query_after__missing(patch, query):
+    order = {'name': 'asc', 'id': 'asc'}
+    patch.object(Query, 'seek_order', return_value=order)
+    with raises(PaginationError) as error:
+        query.after(name='a')
+    assert error.value.column == 'id'
+
+
+def test_query_make_aggregate(magic):
+    table = magic(columns={'amount': 'column'})
+    result = Query.make_aggregate(table, ('sum', 'amount'))
+    assert result == ('sum', 'amount')
+
+
+def test_query_make_aggregate__rows(magic):
+    assert Query.make_aggregate(magic(), 'count') == ('count', None)
+
+
+def test_query_make_aggregate__function(magic):
+    with raises(AggregateError):
+        Query.make_aggregate(magic(), 'median')
+
+
+def test_query_make_aggregate__column(magic):
+    table = magic(columns={})
+    with raises(ColumnError):
+        Query.make_aggregate(table, ('sum', 'amount'))
+
+
+def test_query_aggregate(patch, query):
+    patch.object(Query, 'make_aggregate')
+    query.aggregate(n='count')
+    Query.make_aggregate.assert_called_with('table', 'count')
+    assert query.aggregates == {'n': Query.make_aggregate()}
+    assert query.query_type == 'aggregate'
+
+
+def test_query_ungrouped(query):
+    assert query.ungrouped('aggregate') is None
+
+
+def test_query_ungrouped__joined(magic, query):
+    query.targets = ['table', magic()]
+    with raises(AggregateError):
+        query.ungrouped('aggregate')
+
+
+def test_query_aggregate__joined(patch, query):
+    patch.object(Query, 'ungrouped', side_effect=AggregateError('aggregate'))
+    with raises(AggregateError):
+        query.aggregate(n='count')
+
+
+def test_query_group_by(magic, query):
+    query.targets = [magic(columns={'user': 'column'})]
+    query.group_by('user')
+    assert query.group == ('user', )
+    assert query.query_type == 'aggregate'
+
+
+def test_query_group_by__column(magic, query):
+    query.targets = [magic(columns={})]
+    with raises(ColumnError):
+        query.group_by('user')
+
+
+def test_query_group_by__joined(patch, query):
+    patch.object(Query, 'ungrouped', side_effect=AggregateError('group_by'))
+    with raises(AggregateError):
+        query.group_by('user')
+
+
+def test_query_having(query):
+    query.having(n='>5')
+    assert query._having == [('n', '>', '5')]
+    assert query.params == ['5']
+
+
+def test_query_returning(query):
+    query.returning()
+    assert query._returning == '*'
+
+
+def test_query_tables(query):
+    assert query.tables() == ['table']
+
+
+def test_query_tables__update(query):
+    query.query_type = 'update'
+    query.targets = ('table', {'col': 'value'})
+    assert query.tables() == ('table', )
+
+
+def test_query_tables__aggregate(magic, query):
+    table = magic()
+    query.targets = [table]
+    query.query_type = 'aggregate'
+    query.group = ('user', )
+    query.aggregates = {'n': ('count', None)}
+    result = query.tables()
+    table.aggregated.assert_called_with(('user', ), query.aggregates)
+    assert result == [table.aggregated()]
+
+
+def test_query_materialized(query):
+    assert query.materialized(None) is None
+    assert query.materialized('tuples') == 'tuples'
+
+
+def test_query_materialized__aggregate(query):
+    query.query_type = 'aggregate'
+    assert query.materialized(None) == 'dictionaries'
+    assert query.materialized('tuples') == 'tuples'
 
 
 def test_query_build(patch, query):
@@ -218,6 +533,74 @@ def test_query_build(patch, query):
     assert result == Query.head()
 
 
+def test_query_build__estimate(patch, query):
+    patch.object(Query, 'head')
+    query.query_type = 'estimate'
+    query.order = {'col': 'desc'}
+    result = query.build()
+    Query.head.assert_called_with('estimate', query.targets, query.options)
+    assert result == Query.head()
+
+
+def test_query_build__estimate_conditions(patch, query):
+    patch.many(Sql, ['join', 'where', 'explain'])
+    patch.object(Query, 'head')
+    query.query_type = 'estimate'
+    query.conditions = {'col': 'value'}
+    result = query.build()
+    Query.head.assert_called_with('explain', query.targets, query.options)
+    Sql.explain.assert_called_with(Sql.join())
+    assert result == Sql.explain()
+
+
+def test_query_build__exists(patch, query):
+    patch.object(Sql, 'exists')
+    patch.object(Query, 'head')
+    query.query_type = 'exists'
+    result = query.build()
+    Sql.exists.assert_called_with(Query.head(), True)
+    assert result == Sql.exists()
+
+
+def test_query_build__exists_limit(patch, query):
+    patch.many(Sql, ['join', 'limit', 'exists'])
+    patch.object(Query, 'head')
+    query.query_type = 'exists'
+    query._limit = 2
+    query.build()
+    Sql.exists.assert_called_with(Sql.join(), False)
+
+
+def test_query_build__aggregate(patch, query):
+    patch.object(Sql, 'aggregate')
+    patch.object(Query, 'head')
+    query.query_type = 'aggregate'
+    result = query.build()
+    Sql.aggregate.assert_called_with('table', (), {})
+    assert Query.head.call_count == 0
+    assert result == Sql.aggregate()
+
+
+def test_query_build__group(patch, query):
+    patch.many(Sql, ['join', 'group_by'])
+    patch.object(Query, 'head')
+    query.group = ('user', )
+    result = query.build()
+    Sql.group_by.assert_called_with(('user', ))
+    Sql.join.assert_called_with(Query.head(), Sql.group_by())
+    assert result == Sql.join()
+
+
+def test_query_build__having(patch, query):
+    patch.many(Sql, ['join', 'having'])
+    patch.object(Query, 'head')
+    query._having = [('n', '>', '5')]
+    result = query.build()
+    Sql.having.assert_called_with(query._having, query.aggregates)
+    Sql.join.assert_called_with(Query.head(), Sql.having())
+    assert result == Sql.join()
+
+
 def test_query_build__conditions(patch, query):
     patch.many(Sql, ['join', 'where'])
     patch.object(Query, 'head')
@@ -228,6 +611,25 @@ def test_query_build__conditions(patch, query):
     assert result == Sql.join()
 
 
+def test_query_build__keyset(patch, query):
+    patch.many(Sql, ['join', 'keyset'])
+    patch.object(Query, 'head')
+    query.keyset = (('id', ), '>')
+    result = query.build()
+    Sql.keyset.assert_called_with(('id', ), '>', 'where')
+    Sql.join.assert_called_with(Query.head(), Sql.keyset())
+    assert result == Sql.join()
+
+
+def test_query_build__keyset_conditions(patch, query):
+    patch.many(Sql, ['join', 'where', 'keyset'])
+    patch.object(Query, 'head')
+    query.conditions = {'col': 'value'}
+    query.keyset = (('id', ), '>')
+    query.build()
+    Sql.keyset.assert_called_with(('id', ), '>', 'and')
+
+
 def test_query_build__order(patch, query):
     patch.many(Sql, ['join', 'order_by'])
     patch.object(Query, 'head')
@@ -257,6 +659,139 @@ def test_query_build__limit(patch, query):
     assert result == Sql.join()
 
 
+def test_query_params(query):
+    assert query.params == []
+
+
+def test_query_params__order():
+    """
+    Ensures that params follow the placeholders of the sql, whatever the
+    order of the calls.
+    """
+    query = Query('db', 'select', 'table')
+    query.limit(10, 20)
+    query.having(n='>5')
+    query.after(id=1)
+    query.where(age='3')
+    assert query.params == ['3', 1, '5', 10, 20]
+
+
+def test_query_params__update():
+    query = Query.update('db', 'table', {'col': 'value'})
+    query.where(id='1')
+    assert query.params == ['value', '1']
+
+
+def test_query_params__estimate(query):
+    query.query_type = 'estimate'
+    query.limit(10)
+    assert query.params == []
+
+
+def test_query_params__estimate_conditions(query):
+    query.query_type = 'estimate'
+    query.where(age='3')
+    query.limit(10)
+    assert query.params == ['3', 10]
+
+
+def test_query_shape(query):
+    query.conditions = [('col', '>', 'value')]
+    query.order = {'col': 'desc'}
+    query._limit = 10
+    result = query.shape()
+    assert result == ('type', ('table', ), (), (('col', '>'), ),
+                      (('col', 'desc'), ), True, False, None, None)
+
+
+def test_query_shape__params(query):
+    """
+    Ensures that queries differing only in their parameters have the same
+    shape.
+    """
+    other = Query('db', 'type', 'table')
+    query.where(col='value')
+    other.where(col='other')
+    assert query.shape() == other.shape()
+
+
+def test_query_shape__update(query):
+    query.query_type = 'update'
+    query.targets = ('table', {'col': 'value'})
+    assert query.shape()[1] == ('table', ('col', ))
+
+
+def test_query_shape__aggregate(query):
+    query.query_type = 'aggregate'
+    query.aggregates = {'n': ('count', None)}
+    query.group = ('user', )
+    query._having = [('n', '>', '5')]
+    result = query.shape()
+    assert result[-3:] == ((('n', ('count', None)), ), ('user', ),
+                           (('n', '>'), ))
+
+
+def test_query_compile(patch, magic, query):
+    patch.many(Query, ['build', 'shape'])
+    query.db = magic()
+    query.db.statements.get.return_value = None
+    result = query.compile('shape')
+    query.db.statements.get.assert_called_with('shape')
+    query.db.sql.assert_called_with(Query.build())
+    query.db.statements.set.assert_called_with('shape', query.db.sql())
+    assert result == query.db.sql()
+
+
+def test_query_compile__cached(patch, magic, query):
+    patch.many(Query, ['build', 'shape'])
+    query.db = magic()
+    result = query.compile('shape')
+    assert Query.build.call_count == 0
+    assert result == query.db.statements.get()
+
+
+def test_query_compile__disabled(patch, magic, query):
+    patch.object(Query, 'build')
+    query.db = magic(statements=None)
+    assert query.compile('shape') == Query.build()
+
+
+def test_query_acompile(patch, coroutine, magic, run, query):
+    patch.object(Query, 'build')
+    query.db = magic()
+    query.db.statements.get.return_value = None
+    query.db.asql = coroutine()
+    result = run(query.acompile('shape'))
+    query.db.asql.assert_called_with(Query.build())
+    query.db.statements.set.assert_called_with('shape', result)
+    assert result == query.db.asql.return_value
+
+
+def test_query_acompile__cached(patch, magic, run, query):
+    patch.object(Query, 'build')
+    query.db = magic()
+    result = run(query.acompile('shape'))
+    assert Query.build.call_count == 0
+    assert result == query.db.statements.get()
+
+
+def test_query_acompile__disabled(patch, magic, run, query):
+    patch.object(Query, 'build')
+    query.db = magic(statements=None)
+    assert run(query.acompile('shape')) == Query.build()
+
+
+def test_query_build__returning(patch, magic, query):
+    patch.many(Sql, ['join', 'returning'])
+    patch.object(Query, 'head')
+    query._returning = '*'
+    query.targets = [magic()]
+    result = query.build()
+    Sql.returning.assert_called_with(query.targets[0].quoted_columns)
+    Sql.join.assert_called_with(Query.head(), Sql.returning())
+    assert result == Sql.join()
+
+
 def test_query_sql(patch, magic, query):
     patch.object(Query, 'build')
     query.db = magic()
@@ -265,19 +800,424 @@ def test_query_sql(patch, magic, query):
     assert result == query.db.sql()
 
 
+def test_query_copy(patch, magic, query):
+    patch.many(Query, ['compile', 'shape'])
+    patch.object(Sql, 'copy_to')
+    query.db = magic()
+    result = query.copy('csv')
+    Query.compile.assert_called_with(Query.shape())
+    query.db.mogrify.assert_called_with(Query.compile(), query.params)
+    Sql.copy_to.assert_called_with(query.db.mogrify(), 'csv')
+    assert result == Sql.copy_to()
+
+
+def test_query_copy_to(patch, magic, query):
+    patch.object(Query, 'copy')
+    query.db = magic()
+    result = query.copy_to('file', 'csv')
+    Query.copy.assert_called_with('csv')
+    query.db.copy_to.assert_called_with(Query.copy(), 'file')
+    assert result == query.db.copy_to()
+
+
+def test_query_copy_chunks(patch, magic, query):
+    patch.object(Query, 'copy')
+    query.db = magic()
+    result = query.copy_chunks('csv', 16)
+    Query.copy.assert_called_with('csv')
+    query.db.copy_chunks.assert_called_with(Query.copy(), 16)
+    assert result == query.db.copy_chunks()
+
+
+def test_query_iterate(patch, magic, query):
+    patch.many(Query, ['compile', 'shape', 'tables'])
+    query.db = magic()
+    result = query.iterate(10, 'mode')
+    Query.compile.assert_called_with(Query.shape())
+    query.db.iterate.assert_called_with(Query.compile(), [], 'mode',
+                                        Query.tables(), 10)
+    assert result == query.db.iterate()
+
+
 def test_query_execute(patch, magic, query):
-    patch.object(Query, 'build')
+    patch.many(Query, ['compile', 'shape'])
     query.db = magic()
     result = query.execute('fetch', 'mode')
-    query.db.execute.assert_called_with(Query.build(), [], 'fetch', 'mode',
-                                        ['table'])
+    Query.compile.assert_called_with(Query.shape())
+    query.db.execute.assert_called_with(Query.compile(), [], 'fetch', 'mode',
+                                        ['table'], Query.shape())
     assert result == query.db.execute()
 
 
+def test_query_execute__update(patch, magic, query):
+    patch.many(Query, ['compile', 'shape'])
+    query.db = magic()
+    query.query_type = 'update'
+    table = magic()
+    query.targets = (table, {'col': 'value'})
+    query.execute('fetch', 'mode')
+    assert query.db.execute.call_args[0][4] == (table, )
+    query.db.invalidate.assert_called_with([table.name])
+
+
 def test_query_execute__count(patch, magic, query):
-    patch.object(Query, 'build')
+    patch.many(Query, ['compile', 'shape'])
     query.db = magic()
     query.query_type = 'count'
     result = query.execute('fetch', 'mode')
-    query.db.count.assert_called_with(Query.build(), [])
+    query.db.count.assert_called_with(Query.compile(), [], Query.shape())
     assert result == query.db.count()
+
+
+def test_query_execute__estimate(patch, magic, query):
+    patch.many(Query, ['compile', 'shape', 'estimated'])
+    query.db = magic()
+    query.query_type = 'estimate'
+    result = query.execute(True, None)
+    query.db.count.assert_called_with(Query.compile(), [], None)
+    Query.estimated.assert_called_with(query.db.count())
+    assert result == Query.estimated()
+
+
+@mark.parametrize('query_type', ['truncate', 'drop'])
+def test_query_execute__unprepared(patch, magic, query, query_type):
+    patch.many(Query, ['compile', 'shape'])
+    query.db = magic()
+    query.query_type = query_type
+    query.targets = [magic()]
+    query.execute(None, None)
+    assert query.db.execute.call_args[0][5] is None
+
+
+def test_query_execute__exists(patch, magic, query):
+    patch.many(Query, ['compile', 'shape'])
+    query.db = magic()
+    query.query_type = 'exists'
+    result = query.execute(None, None)
+    query.db.count.assert_called_with(Query.compile(), [], Query.shape())
+    assert result == query.db.count()
+
+
+def test_query_execute__aggregate(patch, magic, query):
+    patch.many(Query, ['compile', 'shape', 'tables'])
+    query.db = magic()
+    query.query_type = 'aggregate'
+    query.execute(True, None)
+    query.db.execute.assert_called_with(Query.compile(), [], True,
+                                        'dictionaries', Query.tables(),
+                                        Query.shape())
+
+
+def test_query_project(magic, query):
+    table = magic()
+    table.name = 'trees'
+    query.targets = [table]
+    query.project(('a', ), {}, False)
+    table.project.assert_called_with(('a', ))
+    assert query.targets == [table.project()]
+
+
+def test_query_project__deferred(magic, query):
+    table = magic()
+    table.name = 'trees'
+    query.targets = [table]
+    query.project(('a', ), {}, True)
+    table.defer.assert_called_with(('a', ))
+    assert query.targets == [table.defer()]
+
+
+def test_query_project__joined(magic, query):
+    table = magic()
+    joined = magic()
+    joined.name = 'fruits'
+    query.targets = [table, joined]
+    query.project((), {'fruits': 'name'}, False)
+    assert table.project.call_count == 0
+    joined.project.assert_called_with(('name', ))
+    assert query.targets == [table, joined.project()]
+
+
+def test_query_project__unknown(magic, query):
+    table = magic()
+    table.name = 'trees'
+    query.targets = [table]
+    with raises(RelationshipError):
+        query.project((), {'fruits': 'name'}, False)
+
+
+def test_query_only(patch, query):
+    patch.object(Query, 'project')
+    query.only('a', fruits='name')
+    Query.project.assert_called_with(('a', ), {'fruits': 'name'}, False)
+
+
+def test_query_defer(patch, query):
+    patch.object(Query, 'project')
+    query.defer('a', fruits='name')
+    Query.project.assert_called_with(('a', ), {'fruits': 'name'}, True)
+
+
+def test_query_prefetch(patch, magic, query):
+    patch.object(Prefetch, 'make')
+    patch.object(Query, 'prefetch_keys')
+    query.db = magic()
+    query.targets = [magic()]
+    query.prefetch('one', 'two')
+    query.db.get_table.assert_called_with(query.targets[0].name)
+    Prefetch.make.assert_called_with(query.db.get_table(), 'two')
+    assert query.prefetches == [Prefetch.make(), Prefetch.make()]
+    assert Query.prefetch_keys.call_count == 1
+
+
+def test_query_prefetch_keys(magic, query):
+    table = magic(columns={'id': 'column'})
+    query.db = magic()
+    query.targets = [table]
+    query.prefetches = [magic(key='id'), magic(key='owner')]
+    query.prefetch_keys()
+    query.db.get_table.assert_called_with(table.name)
+    query.db.get_table().project.assert_called_with(('id', 'owner'))
+    assert query.targets == [query.db.get_table().project()]
+
+
+def test_query_prefetch_keys__selected(magic, query):
+    table = magic(columns={'id': 'column', 'owner': 'column'})
+    query.db = magic()
+    query.targets = [table]
+    query.prefetches = [magic(key='owner')]
+    query.prefetch_keys()
+    assert query.targets == [table]
+
+
+def test_query_prefetched(query):
+    query.prefetches = ['prefetch']
+    assert query.prefetched(['item'], True, None) == ['item']
+
+
+def test_query_prefetched__one(query):
+    query.prefetches = ['prefetch']
+    assert query.prefetched('item', 'one', 'dictionaries') == ['item']
+
+
+def test_query_prefetched__none(query):
+    assert query.prefetched(['item'], True, None) == []
+    query.prefetches = ['prefetch']
+    assert query.prefetched([], True, None) == []
+    assert query.prefetched(None, 'one', None) == []
+    assert query.prefetched(['item'], True, 'tuples') == []
+    assert query.prefetched(['item'], 'returned', None) == []
+
+
+def test_query_load(patch, magic, query):
+    patch.object(Query, 'prefetched', return_value=['item'])
+    prefetch = magic()
+    query.prefetches = [prefetch]
+    query.db = magic()
+    result = query.load('result', 'fetch', 'mode')
+    Query.prefetched.assert_called_with('result', 'fetch', 'mode')
+    prefetch.keys.assert_called_with(['item'])
+    query.db.execute.assert_called_with(prefetch.statement(),
+                                        [prefetch.keys()], True, 'mode',
+                                        [prefetch.related])
+    prefetch.stitch.assert_called_with(['item'], query.db.execute())
+    assert result == 'result'
+
+
+def test_query_load__no_keys(patch, magic, query):
+    patch.object(Query, 'prefetched', return_value=['item'])
+    prefetch = magic()
+    prefetch.keys.return_value = []
+    query.prefetches = [prefetch]
+    query.db = magic()
+    query.load('result', 'fetch', 'mode')
+    assert query.db.execute.call_count == 0
+    prefetch.stitch.assert_called_with(['item'], [])
+
+
+def test_query_load__no_items(patch, magic, query):
+    patch.object(Query, 'prefetched', return_value=[])
+    prefetch = magic()
+    query.prefetches = [prefetch]
+    assert query.load('result', 'fetch', 'mode') == 'result'
+    assert prefetch.keys.call_count == 0
+
+
+def test_query_aload(patch, coroutine, magic, run, query):
+    patch.object(Query, 'prefetched', return_value=['item'])
+    prefetch = magic()
+    query.prefetches = [prefetch]
+    query.db = magic()
+    query.db.aexecute = coroutine()
+    result = run(query.aload('result', 'fetch', 'mode'))
+    query.db.aexecute.assert_called_with(prefetch.statement(),
+                                         [prefetch.keys()], True, 'mode',
+                                         [prefetch.related])
+    related = query.db.aexecute.return_value
+    prefetch.stitch.assert_called_with(['item'], related)
+    assert result == 'result'
+
+
+def test_query_execute__load(patch, magic, query):
+    patch.many(Query, ['compile', 'shape', 'load'])
+    query.db = magic()
+    result = query.execute('fetch', 'mode')
+    Query.load.assert_called_with(query.db.execute(), 'fetch', 'mode')
+    assert result == Query.load()
+
+
+def test_query_aexecute__load(patch, coroutine, magic, run, query):
+    patch.many(Query, ['acompile', 'shape'])
+    patch.object(Query, 'aload', coroutine())
+    query.db = magic()
+    query.db.aexecute = coroutine()
+    result = run(query.aexecute('fetch', 'mode'))
+    related = query.db.aexecute.return_value
+    Query.aload.assert_called_with(related, 'fetch', 'mode')
+    assert result == Query.aload.return_value
+
+
+def test_query_exists(query):
+    query.exists()
+    assert query.query_type == 'exists'
+
+
+def test_query_estimated():
+    plan = [{'Plan': {'Plan Rows': 12.0}}]
+    assert Query.estimated(plan) == 12
+
+
+def test_query_estimated__count():
+    assert Query.estimated(12) == 12
+
+
+def test_query_cached(query):
+    query.cached(10)
+    assert query.ttl == 10
+
+
+def test_query_cached__default(query):
+    query.cached()
+    assert query.ttl is None
+
+
+def test_query_cacheable(query):
+    query.ttl = None
+    assert query.cacheable(True) is True
+
+
+def test_query_cacheable__not_cached(query):
+    assert query.cacheable(True) is False
+
+
+def test_query_cacheable__writer(query):
+    query.ttl = None
+    query.query_type = 'update'
+    assert query.cacheable(True) is False
+
+
+def test_query_cacheable__no_fetch(query):
+    query.ttl = None
+    assert query.cacheable(None) is False
+
+
+def test_query_cacheable__count(query):
+    query.ttl = None
+    query.query_type = 'count'
+    assert query.cacheable(None) is True
+
+
+def test_query_written(magic, query):
+    table = magic()
+    query.targets = [table]
+    assert query.written() == [table.name]
+
+
+def test_query_written__cascade(magic, query):
+    related = magic()
+    table = magic(reverse_relationships=[related])
+    query.targets = [table]
+    query.options = {'cascade': True}
+    assert query.written() == [table.name, related.name]
+
+
+def test_query_execute__cached(patch, magic, query):
+    patch.many(Query, ['compile', 'shape'])
+    query.db = magic()
+    query.ttl = 10
+    result = query.execute('fetch', 'mode')
+    query.db.cached.assert_called_with(Query.compile(), [], 'fetch', 'mode',
+                                       ['table'], Query.shape(), 10)
+    assert result == query.db.cached()
+
+
+def test_query_execute__cached_count(patch, magic, query):
+    patch.many(Query, ['compile', 'shape'])
+    query.db = magic()
+    query.ttl = 10
+    query.query_type = 'count'
+    query.execute(None, None)
+    query.db.cached.assert_called_with(Query.compile(), [], 'count', None,
+                                       ['table'], Query.shape(), 10)
+
+
+def test_query_execute__cached_estimate(patch, magic, query):
+    patch.many(Query, ['compile', 'shape', 'estimated'])
+    query.db = magic()
+    query.ttl = 10
+    query.query_type = 'estimate'
+    result = query.execute(None, None)
+    query.db.cached.assert_called_with(Query.compile(), [], 'count', None,
+                                       ['table'], None, 10)
+    Query.estimated.assert_called_with(query.db.cached())
+    assert result == Query.estimated()
+
+
+def test_query_aexecute__cached(patch, coroutine, magic, run, query):
+    patch.many(Query, ['acompile', 'shape'])
+    query.db = magic()
+    query.db.acached = coroutine()
+    query.ttl = 10
+    result = run(query.aexecute('fetch', 'mode'))
+    query.db.acached.assert_called_with(Query.acompile.return_value, [],
+                                        'fetch', 'mode', ['table'], 10)
+    assert result == query.db.acached.return_value
+
+
+def test_query_aexecute__writer(patch, coroutine, magic, run, query):
+    patch.many(Query, ['acompile', 'shape', 'written'])
+    query.db = magic()
+    query.db.aexecute = coroutine()
+    query.query_type = 'delete'
+    run(query.aexecute('fetch', 'mode'))
+    query.db.invalidate.assert_called_with(Query.written())
+
+
+def test_query_aexecute(patch, coroutine, magic, run, query):
+    patch.many(Query, ['acompile', 'shape'])
+    query.db = magic()
+    query.db.aexecute = coroutine()
+    result = run(query.aexecute('fetch', 'mode'))
+    Query.acompile.assert_called_with(Query.shape())
+    query.db.aexecute.assert_called_with(Query.acompile.return_value, [],
+                                         'fetch', 'mode', ['table'])
+    assert result == query.db.aexecute.return_value
+
+
+def test_query_aexecute__count(patch, coroutine, magic, run, query):
+    patch.many(Query, ['acompile', 'shape'])
+    query.db = magic()
+    query.db.acount = coroutine()
+    query.query_type = 'count'
+    result = run(query.aexecute('fetch', 'mode'))
+    query.db.acount.assert_called_with(Query.acompile.return_value, [])
+    assert result == query.db.acount.return_value
+
+
+def test_query_aexecute__estimate(patch, coroutine, magic, run, query):
+    patch.many(Query, ['acompile', 'shape', 'estimated'])
+    query.db = magic()
+    query.db.acount = coroutine()
+    query.query_type = 'estimate'
+    result = run(query.aexecute(None, None))
+    Query.estimated.assert_called_with(query.db.acount.return_value)
+    assert result == Query.estimated()
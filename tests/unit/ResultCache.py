@@ -0,0 +1,151 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+import sys
+import time
+from collections import OrderedDict
+
+from psyker.ResultCache import ResultCache
+
+from pytest import fixture
+
+
+@fixture
+def cache():
+    return ResultCache(1000, 10)
+
+
+def test_result_cache_init(cache):
+    assert cache.max_bytes == 1000
+    assert cache.ttl == 10
+    assert cache.items == OrderedDict()
+    assert cache.tags == {}
+    assert cache.bytes == 0
+    assert cache.hits == 0
+    assert cache.misses == 0
+    assert cache.evictions == 0
+    assert cache.expirations == 0
+    assert cache.invalidations == 0
+
+
+def test_result_cache_init__defaults():
+    cache = ResultCache()
+    assert cache.max_bytes == 67108864
+    assert cache.ttl == 60.0
+
+
+def test_result_cache_sizeof():
+    rows = [(1, 'value')]
+    expected = sys.getsizeof(rows) + sys.getsizeof(rows[0]) + \
+        sys.getsizeof(1) + sys.getsizeof('value')
+    assert ResultCache.sizeof(rows) == expected
+
+
+def test_result_cache_sizeof__value():
+    assert ResultCache.sizeof(1) == sys.getsizeof(1)
+
+
+def test_result_cache_set(patch, cache):
+    patch.object(ResultCache, 'sizeof', return_value=10)
+    patch.object(time, 'monotonic', return_value=100)
+    cache.set('key', 'value', ['table'])
+    assert cache.items['key'] == ('value', 110, 10, ['table'])
+    assert cache.tags == {'table': {'key'}}
+    assert cache.bytes == 10
+
+
+def test_result_cache_set__ttl(patch, cache):
+    patch.object(time, 'monotonic', return_value=100)
+    cache.set('key', 'value', [], ttl=5)
+    assert cache.items['key'][1] == 105
+
+
+def test_result_cache_set__replace(patch, cache):
+    patch.object(ResultCache, 'sizeof', return_value=10)
+    cache.set('key', 'value', ['table'])
+    cache.set('key', 'other', ['other'])
+    assert cache.items['key'][0] == 'other'
+    assert cache.tags == {'other': {'key'}}
+    assert cache.bytes == 10
+
+
+def test_result_cache_set__too_big(patch, cache):
+    patch.object(ResultCache, 'sizeof', return_value=1001)
+    cache.set('key', 'value', ['table'])
+    assert len(cache) == 0
+
+
+def test_result_cache_set__evict(patch, cache):
+    patch.object(ResultCache, 'sizeof', return_value=400)
+    cache.set('one', 'value', ['table'])
+    cache.set('two', 'value', ['table'])
+    cache.get('one')
+    cache.set('three', 'value', ['table'])
+    assert list(cache.items) == ['one', 'three']
+    assert cache.tags == {'table': {'one', 'three'}}
+    assert cache.bytes == 800
+    assert cache.evictions == 1
+
+
+def test_result_cache_get(cache):
+    cache.set('key', 'value', [])
+    assert cache.get('key') == 'value'
+    assert cache.hits == 1
+
+
+def test_result_cache_get__miss(cache):
+    assert cache.get('key') is None
+    assert cache.misses == 1
+
+
+def test_result_cache_get__expired(patch, cache):
+    cache.set('key', 'value', ['table'])
+    patch.object(time, 'monotonic', return_value=time.monotonic() + 11)
+    assert cache.get('key') is None
+    assert len(cache) == 0
+    assert cache.tags == {}
+    assert cache.expirations == 1
+    assert cache.misses == 1
+
+
+def test_result_cache_invalidate(cache):
+    cache.set('one', 'value', ['table', 'other'])
+    cache.set('two', 'value', ['other'])
+    cache.set('three', 'value', ['third'])
+    cache.invalidate(['table', 'missing'])
+    assert list(cache.items) == ['two', 'three']
+    assert cache.tags == {'other': {'two'}, 'third': {'three'}}
+    assert cache.invalidations == 1
+
+
+def test_result_cache_clear(cache):
+    cache.set('key', 'value', ['table'])
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.tags == {}
+    assert cache.bytes == 0
+
+
+def test_result_cache_hit_rate(cache):
+    cache.hits = 3
+    cache.misses = 1
+    assert cache.hit_rate() == 0.75
+
+
+def test_result_cache_hit_rate__empty(cache):
+    assert cache.hit_rate() == 0.0
+
+
+def test_result_cache_stats(patch, cache):
+    patch.object(ResultCache, 'hit_rate')
+    result = cache.stats()
+    assert result == {'size': 0, 'bytes': 0, 'hits': 0, 'misses': 0,
+                      'evictions': 0, 'expirations': 0, 'invalidations': 0,
+                      'hit_rate': ResultCache.hit_rate()}
+
+
+def test_result_cache_repr(cache):
+    assert repr(cache) == '<ResultCache(0/1000)>'
@@ -0,0 +1,122 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from contextvars import ContextVar
+from weakref import WeakValueDictionary
+
+from psyker.Session import Session
+
+from pytest import fixture
+
+
+class Item:
+
+    __deferred__ = frozenset()
+
+    def __init__(self, row):
+        self.id = row[0]
+
+
+@fixture
+def session():
+    return Session()
+
+
+def test_session():
+    assert type(Session.current) == ContextVar
+    assert Session.current.get() is None
+
+
+def test_session_init(session):
+    assert type(session.instances) == WeakValueDictionary
+    assert session.hits == 0
+    assert session.misses == 0
+    assert session.token is None
+
+
+def test_session_refresh():
+    item = Item((1, ))
+    item.col = 'old'
+    Session.refresh(item, ('id', 'col'), (1, 'value', 'extra'))
+    assert item.col == 'value'
+    assert item.__deferred__ == frozenset()
+
+
+def test_session_refresh__deferred():
+    item = Item((1, ))
+    item.__deferred__ = frozenset(('col', 'other'))
+    Session.refresh(item, ('id', 'col'), (1, 'value'))
+    assert item.col == 'value'
+    assert item.__deferred__ == {'other'}
+
+
+def test_session_hydrator(session):
+    make = session.hydrator('model', Item, ('id', ))
+    result = make((1, 'value'))
+    assert type(result) == Item
+    assert session.instances[('model', 1)] == result
+    assert session.misses == 1
+
+
+def test_session_hydrator__hit(patch, magic, session):
+    patch.object(Session, 'refresh')
+    hydrate = magic()
+    item = Item((1, ))
+    session.instances[('model', 1)] = item
+    result = session.hydrator('model', hydrate, ('id', ))((1, 'value'))
+    Session.refresh.assert_called_with(item, ('id', ), (1, 'value'))
+    assert hydrate.call_count == 0
+    assert result == item
+    assert session.hits == 1
+
+
+def test_session_hydrator__weak(session):
+    """
+    Ensures instances are dropped from the session when they are no longer
+    used elsewhere.
+    """
+    session.hydrator('model', Item, ('id', ))((1, ))
+    assert len(session.instances) == 0
+
+
+def test_session_stats(session):
+    session.hits = 2
+    session.misses = 1
+    assert session.stats() == {'hits': 2, 'misses': 1, 'size': 0}
+
+
+def test_session_clear(session):
+    item = Item((1, ))
+    session.instances[('model', 1)] = item
+    session.clear()
+    assert len(session.instances) == 0
+
+
+def test_session_enter(session):
+    with session as result:
+        assert Session.current.get() == session
+    assert result == session
+    assert Session.current.get() is None
+
+
+def test_session_exit(patch, session):
+    patch.object(Session, 'clear')
+    with session:
+        pass
+    assert Session.clear.call_count == 1
+
+
+def test_session_aenter(run, session):
+    async def block():
+        async with session as result:
+            assert Session.current.get() == session
+        return result
+    assert run(block()) == session
+    assert Session.current.get() is None
+
+
+def test_session_repr(session):
+    assert repr(session) == '<Session(0)>'
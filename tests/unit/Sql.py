@@ -4,11 +4,11 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
-from psycopg2.sql import Identifier, Placeholder, SQL
+from psycopg2.sql import Identifier, Literal, Placeholder, SQL
 
 from psyker.Sql import Sql
 
-from pytest import fixture
+from pytest import fixture, mark
 
 
 @fixture
@@ -159,6 +159,7 @@ def test_sql_comparison(patch, sql):
     patch.object(Sql, 'columns_with_values')
     result = Sql.comparison({'col': 'value'})
     Sql.columns_with_values.assert_called_with({'col': 'value'})
+    SQL.__init__.assert_called_with(' and ')
     SQL.join.assert_called_with(Sql.columns_with_values())
     assert result == SQL().join()
 
@@ -182,36 +183,132 @@ def test_sql_where(patch):
     assert result == Sql.format()
 
 
-def test_sql_count(patch):
-    patch.many(Sql, ['format', 'identifier'])
-    result = Sql.count('hello')
-    Sql.identifier.assert_called_with('hello')
-    Sql.format.assert_called_with('select count(*) from {}', Sql.identifier())
+def test_sql_keyset(patch):
+    patch.many(Sql, ['format', 'identifiers', 'table_columns',
+                     'placeholders'])
+    result = Sql.keyset(('name', 'id'), '>', 'where')
+    Sql.identifiers.assert_called_with(('name', 'id'))
+    Sql.table_columns.assert_called_with(Sql.identifiers())
+    Sql.placeholders.assert_called_with(('name', 'id'))
+    Sql.format.assert_called_with('where ({}) > ({})', Sql.table_columns(),
+                                  Sql.placeholders())
     assert result == Sql.format()
 
 
-def test_sql_select(patch):
-    patch.many(Sql, ['format', 'columns', 'identifier'])
-    result = Sql.select('hello', {'col': 'value'})
-    Sql.identifier.assert_called_with('hello')
-    Sql.format.assert_called_with('select {} from {}', Sql.columns(),
-                                  Sql.identifier())
+def test_sql_count(patch, table):
+    patch.object(Sql, 'format')
+    result = Sql.count(table)
+    Sql.format.assert_called_with('select count(*) from {}',
+                                  table.quoted_name)
+    assert result == Sql.format()
+
+
+def test_sql_any(patch):
+    patch.many(Sql, ['format', 'identifier', 'placeholder'])
+    result = Sql.any('col', 'uuid')
+    Sql.identifier.assert_called_with('col')
+    Sql.format.assert_called_with('where {} = any({}::uuid[])',
+                                  Sql.identifier(), Sql.placeholder())
+    assert result == Sql.format()
+
+
+def test_sql_estimate(patch, table):
+    patch.object(Sql, 'format')
+    result = Sql.estimate(table)
+    sql = ('select greatest(reltuples, 0)::bigint from pg_class '
+           'where oid = {}::regclass')
+    Sql.format.assert_called_with(sql, Literal(table.name))
+    assert result == Sql.format()
+
+
+def test_sql_explain(patch):
+    patch.object(Sql, 'format')
+    result = Sql.explain('query')
+    Sql.format.assert_called_with('explain (format json) {}', 'query')
+    assert result == Sql.format()
+
+
+def test_sql_exists(patch):
+    patch.object(Sql, 'format')
+    result = Sql.exists('query', True)
+    Sql.format.assert_called_with('select exists({} limit 1)', 'query')
+    assert result == Sql.format()
+
+
+def test_sql_exists__no_limit(patch):
+    patch.object(Sql, 'format')
+    Sql.exists('query', False)
+    Sql.format.assert_called_with('select exists({})', 'query')
+
+
+def test_sql_select_one(patch, table):
+    patch.object(Sql, 'format')
+    result = Sql.select_one(table)
+    Sql.format.assert_called_with('select 1 from {}', table.quoted_name)
+    assert result == Sql.format()
+
+
+def test_sql_aggregate_function():
+    result = Sql.aggregate_function('sum', 'amount')
+    assert result == SQL('sum({})').format(Identifier('amount'))
+
+
+def test_sql_aggregate_function__rows():
+    assert Sql.aggregate_function('count', None) == SQL('count(*)')
+
+
+def test_sql_aggregate(patch, table):
+    patch.many(Sql, ['format', 'aggregate_function', 'table_columns'])
+    aggregates = {'total': ('sum', 'amount')}
+    result = Sql.aggregate(table, ('user', ), aggregates)
+    Sql.aggregate_function.assert_called_with('sum', 'amount')
+    columns = [Identifier('user'), Sql.format.return_value]
+    Sql.table_columns.assert_called_with(columns)
+    Sql.format.assert_called_with('select {} from {}', Sql.table_columns(),
+                                  table.quoted_name)
+    assert result == Sql.format()
+
+
+def test_sql_group_by(patch):
+    patch.many(Sql, ['format', 'table_columns'])
+    result = Sql.group_by(('user', ))
+    Sql.table_columns.assert_called_with([Identifier('user')])
+    Sql.format.assert_called_with('group by {}', Sql.table_columns())
+    assert result == Sql.format()
+
+
+def test_sql_having():
+    conditions = [('n', '>', 5), ('user', '=', 'me')]
+    result = Sql.having(conditions, {'n': ('count', None)})
+    comparisons = [
+        SQL('{} > {}').format(SQL('count(*)'), Placeholder()),
+        SQL('{} = {}').format(Identifier('user'), Placeholder())
+    ]
+    expected = SQL('having {}').format(SQL(' and ').join(comparisons))
+    assert result == expected
+
+
+def test_sql_select(patch, table):
+    patch.object(Sql, 'format')
+    result = Sql.select(table)
+    Sql.format.assert_called_with('select {} from {}', table.quoted_columns,
+                                  table.quoted_name)
     assert result == Sql.format()
 
 
 def test_sql_join_table(patch, magic, table):
-    patch.many(Sql, ['identifiers', 'table_name', 'format'])
+    patch.many(Sql, ['identifiers', 'format'])
     first_table = magic()
     result = Sql.join_table(table, first_table, 'col')
     args = (first_table.alias, 'col', table.alias, 'id')
     Sql.identifiers.assert_called_with(args)
-    Sql.format.assert_called_with('join {} on {}.{} = {}.{}', Sql.table_name(),
-                                  *Sql.identifiers())
+    Sql.format.assert_called_with('join {} on {}.{} = {}.{}',
+                                  table.alias_clause, *Sql.identifiers())
     assert result == Sql.format()
 
 
 def test_sql_join_table__rhs(patch, magic, table):
-    patch.many(Sql, ['identifiers', 'table_name', 'format'])
+    patch.many(Sql, ['identifiers', 'format'])
     first_table = magic()
     Sql.join_table(table, first_table, 'col', 'fk')
     args = (first_table.alias, 'col', table.alias, 'fk')
@@ -219,22 +316,19 @@ def test_sql_join_table__rhs(patch, magic, table):
 
 
 def test_sql_join_columns(patch, table):
-    patch.many(Sql, ['columns_with_alias', 'join'])
+    patch.object(Sql, 'join')
     result = Sql.join_columns([table])
-    Sql.columns_with_alias.assert_called_with(table.columns, table.alias)
-    Sql.join.assert_called_with(*[] + Sql.columns_with_alias(),
-                                separator=', ')
+    Sql.join.assert_called_with(table.aliased_columns, separator=', ')
     assert result == Sql.join()
 
 
 def test_sql_join_tables(patch, magic, table):
-    patch.many(Sql, ['join', 'table_name', 'join_table'])
+    patch.many(Sql, ['join', 'join_table'])
     second_table = magic()
     result = Sql.join_tables([table, second_table],
                              {second_table.name: (table, 'col', 'rhs')})
-    Sql.table_name.assert_called_with(table)
     Sql.join_table.assert_called_with(second_table, table, 'col', 'rhs')
-    Sql.join.assert_called_with(Sql.table_name(), Sql.join_table())
+    Sql.join.assert_called_with(table.alias_clause, Sql.join_table())
     assert result == Sql.join()
 
 
@@ -276,6 +370,21 @@ def test_sql_limit__offset(patch):
                                   Sql.placeholder())
 
 
+def test_sql_returning(patch):
+    patch.many(Sql, ['format', 'identifier'])
+    result = Sql.returning('id')
+    Sql.identifier.assert_called_with('id')
+    Sql.format.assert_called_with('returning {}', Sql.identifier())
+    assert result == Sql.format()
+
+
+def test_sql_returning__columns(patch):
+    patch.object(Sql, 'format')
+    result = Sql.returning(SQL('"a", "b"'))
+    Sql.format.assert_called_with('returning {}', SQL('"a", "b"'))
+    assert result == Sql.format()
+
+
 def test_sql_insert(patch):
     patch.many(Sql, ['format', 'identifier', 'columns', 'placeholders'])
     result = Sql.insert('hello', None, message='world')
@@ -289,12 +398,38 @@ def test_sql_insert(patch):
 
 
 def test_sql_insert__returning(patch):
-    patch.many(Sql, ['format', 'identifier', 'columns', 'placeholders'])
+    patch.many(Sql, ['format', 'identifier', 'columns', 'placeholders',
+                     'returning'])
     Sql.insert('hello', 'col', message='world')
-    Sql.identifier.assert_called_with('col')
-    sql = 'insert into {} ({}) values ({}) returning {}'
+    Sql.returning.assert_called_with('col')
+    sql = 'insert into {} ({}) values ({}) {}'
     Sql.format.assert_called_with(sql, Sql.identifier(), Sql.columns(),
-                                  Sql.placeholders(), Sql.identifier())
+                                  Sql.placeholders(), Sql.returning())
+
+
+def test_sql_insert_many(patch):
+    patch.many(Sql, ['format', 'identifier', 'identifiers', 'table_columns',
+                     'placeholders', 'join'])
+    result = Sql.insert_many('table', ['col'], 2, None)
+    Sql.placeholders.assert_called_with(['col'])
+    row = Sql.format.return_value
+    Sql.join.assert_called_with(row, row, separator=', ')
+    Sql.identifiers.assert_called_with(['col'])
+    Sql.table_columns.assert_called_with(Sql.identifiers())
+    sql = 'insert into {} ({}) values {}'
+    Sql.format.assert_called_with(sql, Sql.identifier(), Sql.table_columns(),
+                                  Sql.join())
+    assert result == Sql.format()
+
+
+def test_sql_insert_many__returning(patch):
+    patch.many(Sql, ['format', 'identifier', 'identifiers', 'table_columns',
+                     'placeholders', 'join', 'returning'])
+    Sql.insert_many('table', ['col'], 2, 'id')
+    Sql.returning.assert_called_with('id')
+    sql = 'insert into {} ({}) values {} {}'
+    Sql.format.assert_called_with(sql, Sql.identifier(), Sql.table_columns(),
+                                  Sql.join(), Sql.returning())
 
 
 def test_sql_update(patch):
@@ -349,6 +484,27 @@ def test_sql_column__sql(patch, magic):
                                   column)
 
 
+def test_sql_index():
+    result = Sql.index('name', 'todos', ('user', ), False, None, (), None,
+                       False)
+    sql = 'create index if not exists {} on {} ({})'
+    expected = SQL(sql).format(Identifier('name'), Identifier('todos'),
+                               SQL(', ').join([Identifier('user')]))
+    assert result == expected
+
+
+def test_sql_index__options():
+    result = Sql.index('name', 'todos', ('user', ), True, 'btree', ('id', ),
+                       'done = false', True)
+    sql = ('create unique index concurrently if not exists {} on {} '
+           'using btree ({}) include ({}) where {}')
+    expected = SQL(sql).format(Identifier('name'), Identifier('todos'),
+                               SQL(', ').join([Identifier('user')]),
+                               SQL(', ').join([Identifier('id')]),
+                               SQL('done = false'))
+    assert result == expected
+
+
 def test_table_extension(patch):
     patch.object(Sql, 'format')
     result = Sql.extension('ext')
@@ -392,3 +548,89 @@ def test_sql_drop_table__cascade(patch):
     patch.many(Sql, ['format', 'identifier'])
     Sql.drop_table('table', True)
     Sql.format.assert_called_with('drop table {} cascade', Sql.identifier())
+
+
+def test_sql_begin():
+    assert Sql.begin(None, False) == SQL('begin')
+
+
+def test_sql_begin__isolation():
+    result = Sql.begin('serializable', True)
+    assert result == SQL('begin isolation level serializable read only')
+
+
+@mark.parametrize('method, sql', [
+    ('savepoint', 'savepoint {}'),
+    ('release', 'release savepoint {}'),
+    ('rollback_to', 'rollback to savepoint {}')
+])
+def test_sql_savepoints(patch, method, sql):
+    patch.many(Sql, ['format', 'identifier'])
+    result = getattr(Sql, method)('name')
+    Sql.identifier.assert_called_with('name')
+    Sql.format.assert_called_with(sql, Sql.identifier())
+    assert result == Sql.format()
+
+
+def test_sql_copy_from(patch):
+    patch.many(Sql, ['format', 'identifier', 'identifiers', 'table_columns'])
+    result = Sql.copy_from('table', ['col'], 'csv')
+    Sql.identifiers.assert_called_with(['col'])
+    Sql.table_columns.assert_called_with(Sql.identifiers())
+    Sql.identifier.assert_called_with('table')
+    sql = 'copy {} ({}) from stdin with (format csv)'
+    Sql.format.assert_called_with(sql, Sql.identifier(), Sql.table_columns())
+    assert result == Sql.format()
+
+
+def test_sql_copy_to(patch, sql):
+    patch.object(Sql, 'format')
+    result = Sql.copy_to('query', 'csv')
+    SQL.__init__.assert_called_with('query')
+    args = Sql.format.call_args[0]
+    assert args[0] == 'copy ({}) to stdout with (format csv)'
+    assert isinstance(args[1], SQL)
+    assert result == Sql.format()
+
+
+def test_sql_analyze(patch):
+    patch.many(Sql, ['format', 'identifier'])
+    result = Sql.analyze('table')
+    Sql.identifier.assert_called_with('table')
+    Sql.format.assert_called_with('analyze {}', Sql.identifier())
+    assert result == Sql.format()
+
+
+def test_sql_prepare(patch, sql):
+    patch.many(Sql, ['format', 'identifier'])
+    result = Sql.prepare('name', 'statement')
+    Sql.identifier.assert_called_with('name')
+    SQL.__init__.assert_called_with('statement')
+    args = Sql.format.call_args[0]
+    assert args[:2] == ('prepare {} as {}', Sql.identifier())
+    assert isinstance(args[2], SQL)
+    assert result == Sql.format()
+
+
+def test_sql_execute_prepared(patch):
+    patch.many(Sql, ['format', 'identifier', 'placeholders'])
+    result = Sql.execute_prepared('name', ['param'])
+    Sql.identifier.assert_called_with('name')
+    Sql.placeholders.assert_called_with(['param'])
+    Sql.format.assert_called_with('execute {} ({})', Sql.identifier(),
+                                  Sql.placeholders())
+    assert result == Sql.format()
+
+
+def test_sql_execute_prepared__no_params(patch):
+    patch.many(Sql, ['format', 'identifier'])
+    Sql.execute_prepared('name', [])
+    Sql.format.assert_called_with('execute {}', Sql.identifier())
+
+
+def test_sql_deallocate(patch):
+    patch.many(Sql, ['format', 'identifier'])
+    result = Sql.deallocate('name')
+    Sql.identifier.assert_called_with('name')
+    Sql.format.assert_called_with('deallocate {}', Sql.identifier())
+    assert result == Sql.format()
@@ -0,0 +1,89 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.Cache import Cache
+from psyker.Sql import Sql
+from psyker.Statements import Statements
+
+from pytest import fixture
+
+
+@fixture
+def statements():
+    return Statements(2, 1)
+
+
+@fixture
+def cursor(magic):
+    return magic()
+
+
+def test_statements_init(statements):
+    assert statements.threshold == 2
+    assert statements.counts == {}
+    assert isinstance(statements.prepared, Cache)
+    assert statements.prepared.size == 1
+    assert statements.sequence == 0
+
+
+def test_statements_positional():
+    result = Statements.positional('select * from t where a = %s limit %s')
+    assert result == 'select * from t where a = $1 limit $2'
+
+
+def test_statements_positional__escaped():
+    result = Statements.positional("select '100%%' where a = %s")
+    assert result == "select '100%' where a = $1"
+
+
+def test_statements_name(statements):
+    assert statements.name() == 'psyker_1'
+    assert statements.name() == 'psyker_2'
+
+
+def test_statements_prepare(patch, statements, cursor):
+    patch.many(Sql, ['prepare', 'execute_prepared', 'deallocate'])
+    patch.object(Statements, 'positional')
+    result = statements.prepare(cursor, 'shape', 'sql', ['params'])
+    Statements.positional.assert_called_with('sql')
+    Sql.prepare.assert_called_with('psyker_1', Statements.positional())
+    cursor.execute.assert_called_with(Sql.prepare())
+    Sql.execute_prepared.assert_called_with('psyker_1', ['params'])
+    Sql.execute_prepared().as_string.assert_called_with(cursor)
+    assert statements.prepared.items['shape'] == ('psyker_1', result)
+    assert result == Sql.execute_prepared().as_string()
+
+
+def test_statements_prepare__evict(patch, statements, cursor):
+    patch.many(Sql, ['prepare', 'execute_prepared', 'deallocate'])
+    statements.prepared.set('old', ('psyker_0', 'execute'))
+    statements.prepare(cursor, 'shape', 'sql', [])
+    Sql.deallocate.assert_called_with('psyker_0')
+    cursor.execute.assert_called_with(Sql.deallocate())
+
+
+def test_statements_statement(statements, cursor):
+    result = statements.statement(cursor, 'shape', 'sql', [])
+    assert statements.counts == {'shape': 1}
+    assert result == 'sql'
+
+
+def test_statements_statement__threshold(patch, statements, cursor):
+    patch.object(Statements, 'prepare')
+    statements.counts['shape'] = 1
+    result = statements.statement(cursor, 'shape', 'sql', [])
+    Statements.prepare.assert_called_with(cursor, 'shape', 'sql', [])
+    assert statements.counts == {}
+    assert result == Statements.prepare()
+
+
+def test_statements_statement__prepared(statements, cursor):
+    statements.prepared.set('shape', ('psyker_1', 'execute'))
+    assert statements.statement(cursor, 'shape', 'sql', []) == 'execute'
+
+
+def test_statements_repr(statements):
+    assert repr(statements) == '<Statements(0)>'
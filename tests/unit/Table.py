@@ -4,17 +4,19 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+from psyker.Index import Index
 from psyker.Sql import Sql
 from psyker.Table import Table
 from psyker.columns import Column
+from psyker.exceptions import ColumnError, IndexNameError
 
-from pytest import fixture
+from pytest import fixture, mark, raises
 
 
 @fixture
 def table(patch):
-    patch.many(Table, ['make_columns', 'make_relationships',
-                       'make_reverse_relationships'])
+    patch.many(Table, ['make_columns', 'make_indexes', 'make_relationships',
+                       'make_reverse_relationships', 'make_fragments'])
     return Table('db', 'name', col='type')
 
 
@@ -22,17 +24,20 @@ def test_table_init(table):
     assert table.name == 'name'
     Table.make_columns.assert_called_with({'col': 'type'}, 'uuid')
     assert table.columns == Table.make_columns()
+    Table.make_indexes.assert_called_with(())
+    assert table.indexes == Table.make_indexes()
     Table.make_relationships.assert_called_with('db', Table.make_columns())
     assert table.relationships == Table.make_relationships()
     assert table.reverse_relationships == []
     assert table.alias is None
     Table.make_reverse_relationships.assert_called_with('db',
                                                         table.relationships)
+    assert Table.make_fragments.call_count == 1
 
 
 def test_table_init__alias(patch):
-    patch.many(Table, ['make_columns', 'make_relationships',
-                       'make_reverse_relationships'])
+    patch.many(Table, ['make_columns', 'make_indexes', 'make_relationships',
+                       'make_reverse_relationships', 'make_fragments'])
     table = Table('db', 'name', alias='other')
     assert table.alias == 'other'
 
@@ -41,8 +46,8 @@ def test_table_init__underscore_name(patch):
     """
     Ensures that a name column is not eaten by that table name.
     """
-    patch.many(Table, ['make_columns', 'make_relationships',
-                       'make_reverse_relationships'])
+    patch.many(Table, ['make_columns', 'make_indexes', 'make_relationships',
+                       'make_reverse_relationships', 'make_fragments'])
     Table('db', 'name', name='hello')
     Table.make_columns.assert_called_with({'name': 'hello'}, 'uuid')
 
@@ -106,6 +111,47 @@ def test_table_make_relationships__unique(magic, db):
     assert result == [db.get_table()]
 
 
+def test_table_make_indexes(patch):
+    patch.init(Table)
+    table = Table()
+    table.name = 'name'
+    table.columns = {
+        'a': Column('a', 'int', index=True),
+        'b': Column('b', 'int', index=True, unique=True),
+        'c': Column('c', 'int'),
+        'id': Column('id', 'serial', index=True, primary_key=True)
+    }
+    index = Index('c', include=('a', ))
+    result = table.make_indexes((index, ))
+    assert len(result) == 2
+    assert result[0].columns == ('a', )
+    assert result[1] == index
+
+
+def test_table_make_indexes__unknown(patch):
+    patch.init(Table)
+    table = Table()
+    table.name = 'name'
+    table.columns = {'a': Column('a', 'int')}
+    with raises(ColumnError):
+        table.make_indexes((Index('a', include=('b', )), ))
+
+
+@mark.parametrize('index', [Index('a'), Index('b', name='name_a_idx')])
+def test_table_make_indexes__names(patch, index):
+    """
+    Ensures indexes with the same name are refused, since postgres would
+    skip all but the first.
+    """
+    patch.init(Table)
+    table = Table()
+    table.name = 'name'
+    table.columns = {'a': Column('a', 'int', index=True),
+                     'b': Column('b', 'int')}
+    with raises(IndexNameError):
+        table.make_indexes((index, ))
+
+
 def test_table_make_reverse_relationships(patch, magic, db):
     patch.init(Table)
     relationship = magic()
@@ -114,6 +160,85 @@ def test_table_make_reverse_relationships(patch, magic, db):
     relationship.reverse_relationships.append.assert_called_with(table)
 
 
+def test_table_make_fragments(patch):
+    patch.many(Sql, ['identifier', 'columns', 'columns_with_alias', 'join',
+                     'table_name'])
+    patch.init(Table)
+    table = Table()
+    table.name = 'name'
+    table.columns = {'col': 'column'}
+    table.alias = 't0'
+    table.make_fragments()
+    Sql.identifier.assert_called_with('name')
+    assert table.quoted_name == Sql.identifier()
+    Sql.columns.assert_called_with(table.columns)
+    assert table.quoted_columns == Sql.columns()
+    Sql.columns_with_alias.assert_called_with(table.columns, 't0')
+    Sql.join.assert_called_with(*Sql.columns_with_alias(), separator=', ')
+    assert table.aliased_columns == Sql.join()
+    Sql.table_name.assert_called_with(table)
+    assert table.alias_clause == Sql.table_name()
+
+
+def test_table_make_fragments__no_alias(patch):
+    patch.many(Sql, ['identifier', 'columns', 'columns_with_alias',
+                     'table_name'])
+    patch.init(Table)
+    table = Table()
+    table.name = 'name'
+    table.columns = {}
+    table.alias = None
+    table.make_fragments()
+    assert table.aliased_columns is None
+    assert Sql.columns_with_alias.call_count == 0
+
+
+def test_table_project(patch, table):
+    patch.object(Table, 'make_fragments')
+    table.columns = {'a': 'col_a', 'b': 'col_b', 'id': 'col_id'}
+    result = table.project(('b', ))
+    assert result.columns == {'b': 'col_b', 'id': 'col_id'}
+    assert result.name == table.name
+    assert table.columns == {'a': 'col_a', 'b': 'col_b', 'id': 'col_id'}
+    assert Table.make_fragments.call_count == 1
+
+
+def test_table_project__unknown(table):
+    table.columns = {'a': 'col_a'}
+    with raises(ColumnError):
+        table.project(('c', ))
+
+
+def test_table_defer(patch, table):
+    patch.object(Table, 'project')
+    table.columns = {'a': 'col_a', 'b': 'col_b', 'id': 'col_id'}
+    result = table.defer(('b', ))
+    Table.project.assert_called_with(['a', 'id'])
+    assert result == Table.project()
+
+
+def test_table_defer__unknown(table):
+    table.columns = {'a': 'col_a'}
+    with raises(ColumnError):
+        table.defer(('c', ))
+
+
+def test_table_aggregated(patch, magic, table):
+    patch.object(Table, 'make_fragments')
+    patch.init(Column)
+    amount = magic()
+    table.columns = {'user': 'col_user', 'amount': amount}
+    aggregates = {'total': ('sum', 'amount'), 'n': ('count', None)}
+    result = table.aggregated(('user', ), aggregates)
+    assert list(result.columns) == ['user', 'total', 'n']
+    assert result.columns['user'] == 'col_user'
+    amount.aggregate_type.assert_called_with('sum')
+    Column.__init__.assert_called_with('n', 'bigint')
+    assert isinstance(result.columns['total'], Column)
+    assert table.columns == {'user': 'col_user', 'amount': amount}
+    assert Table.make_fragments.call_count == 1
+
+
 def test_table_sql(patch, magic, table):
     patch.object(Sql, 'table')
     column = magic()
@@ -123,6 +248,14 @@ def test_table_sql(patch, magic, table):
     assert result == Sql.table()
 
 
+def test_table_indexes_sql(magic, table):
+    index = magic()
+    table.indexes = [index]
+    result = table.indexes_sql(True)
+    index.sql.assert_called_with(table.name, True)
+    assert result == [index.sql()]
+
+
 def test_table_cast(patch, magic, table):
     column = magic()
     table.columns = {'key': column}
@@ -131,6 +264,31 @@ def test_table_cast(patch, magic, table):
     assert result == {'key': column.cast()}
 
 
+def test_table_copy_lines(magic, table):
+    column = magic()
+    column.encode.return_value = 'value'
+    table.columns = {'a': column, 'b': column}
+    result = list(table.copy_lines([{'a': 1, 'b': 2}], ['a', 'b'], 'text'))
+    column.encode.assert_called_with(2, 'text')
+    assert result == ['value\tvalue\n']
+
+
+def test_table_copy_lines__csv(magic, table):
+    column = magic()
+    column.encode.return_value = 'value'
+    table.columns = {'a': column, 'b': column}
+    result = list(table.copy_lines([(1, 2)], ['a', 'b'], 'csv'))
+    assert result == ['value,value\n']
+
+
+def test_table_copy_lines__instance(magic, table):
+    column = magic()
+    column.encode.return_value = 'value'
+    table.columns = {'a': column}
+    list(table.copy_lines([magic(a=1)], ['a'], 'text'))
+    column.encode.assert_called_with(1, 'text')
+
+
 def test_table_as_string(patch, table):
     patch.object(Table, 'sql')
     result = table.as_string('cursor')
@@ -0,0 +1,281 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from contextvars import ContextVar
+from threading import local
+
+import psycopg2
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_INERROR,
+                                 TRANSACTION_STATUS_INTRANS)
+
+from psyker.Sql import Sql
+from psyker.Transaction import Transaction
+from psyker.exceptions import IsolationError, TransactionError
+
+from pytest import fixture, raises
+
+
+@fixture
+def connection(coroutine, magic):
+    connection = magic()
+    status = TRANSACTION_STATUS_IDLE
+    connection.conn.get_transaction_status.return_value = status
+    connection.wait = coroutine()
+    return connection
+
+
+@fixture
+def db(coroutine, magic, connection):
+    db = magic(local=local(), held=ContextVar('held', default=None))
+    db.pool.checkout.return_value = connection
+    db.acheckout = coroutine(return_value=connection)
+    return db
+
+
+@fixture
+def transaction(db):
+    return Transaction(db)
+
+
+def test_transaction_init(db, transaction):
+    assert transaction.db == db
+    assert transaction.isolation is None
+    assert transaction.readonly is False
+    assert transaction.connection is None
+    assert transaction.savepoint is None
+    assert transaction.owner is False
+    assert transaction.token is None
+    assert transaction.pool is None
+
+
+def test_transaction_init__isolation(db):
+    transaction = Transaction(db, 'Serializable', True)
+    assert transaction.isolation == 'Serializable'
+    assert transaction.readonly is True
+
+
+def test_transaction_init__isolation_error(db):
+    with raises(IsolationError):
+        Transaction(db, 'read whatever')
+
+
+def test_transaction_begin(patch, transaction, connection):
+    patch.object(Sql, 'begin')
+    result = transaction.begin(connection)
+    Sql.begin.assert_called_with(None, False)
+    assert result == Sql.begin()
+
+
+def test_transaction_begin__savepoint(patch, transaction, connection):
+    patch.object(Sql, 'savepoint')
+    status = TRANSACTION_STATUS_INTRANS
+    connection.conn.get_transaction_status.return_value = status
+    result = transaction.begin(connection)
+    assert transaction.savepoint == f'psyker_{id(transaction):x}'
+    Sql.savepoint.assert_called_with(transaction.savepoint)
+    assert result == Sql.savepoint()
+
+
+def test_transaction_aborted(transaction, connection):
+    transaction.connection = connection
+    assert transaction.aborted(None) is False
+    status = TRANSACTION_STATUS_INERROR
+    connection.conn.get_transaction_status.return_value = status
+    assert transaction.aborted(None) is True
+
+
+def test_transaction_aborted__error(transaction, connection):
+    """
+    Ensures blocks that raised are not aborted, since their error is raised
+    already.
+    """
+    transaction.connection = connection
+    status = TRANSACTION_STATUS_INERROR
+    connection.conn.get_transaction_status.return_value = status
+    assert transaction.aborted(ValueError) is False
+
+
+def test_transaction_end(transaction):
+    assert transaction.end(False) == 'commit'
+    assert transaction.end(True) == 'rollback'
+
+
+def test_transaction_end__savepoint(patch, transaction):
+    patch.many(Sql, ['release', 'rollback_to'])
+    transaction.savepoint = 'psyker_1'
+    assert transaction.end(False) == Sql.release.return_value
+    Sql.release.assert_called_with('psyker_1')
+    assert transaction.end(True) == Sql.rollback_to.return_value
+    Sql.rollback_to.assert_called_with('psyker_1')
+
+
+def test_transaction_invalidate(db, transaction, connection):
+    connection.tags = {'table'}
+    transaction.connection = connection
+    transaction.invalidate()
+    db.invalidate.assert_called_with({'table'})
+    assert connection.tags == set()
+
+
+def test_transaction_invalidate__none(db, transaction, connection):
+    connection.tags = set()
+    transaction.connection = connection
+    transaction.invalidate()
+    assert db.invalidate.call_count == 0
+
+
+def test_transaction(patch, db, transaction, connection):
+    patch.many(Transaction, ['begin', 'end', 'invalidate'])
+    with transaction as result:
+        assert db.local.connection == connection
+        begin = Transaction.begin.return_value
+        connection.cursor.execute.assert_called_with(begin)
+    Transaction.begin.assert_called_with(connection)
+    Transaction.end.assert_called_with(False)
+    end = Transaction.end.return_value
+    connection.cursor.execute.assert_called_with(end)
+    assert connection.cursor.models == db.models
+    assert db.local.connection is None
+    db.pool.checkin.assert_called_with(connection)
+    assert Transaction.invalidate.call_count == 1
+    assert result == transaction
+
+
+def test_transaction__error(patch, db, transaction, connection):
+    patch.many(Transaction, ['begin', 'end'])
+    with raises(ValueError):
+        with transaction:
+            raise ValueError
+    Transaction.end.assert_called_with(True)
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_transaction__reconnect(patch, magic, db, transaction, connection):
+    """
+    Ensures the connection goes back to its pool after the pool was
+    replaced.
+    """
+    patch.many(Transaction, ['begin', 'end', 'invalidate'])
+    pool = db.pool
+    with transaction:
+        db.pool = magic()
+    pool.checkin.assert_called_with(connection)
+    assert db.pool.checkin.call_count == 0
+
+
+def test_transaction__aborted(patch, db, transaction, connection):
+    """
+    Ensures a block that caught the error of a statement is rolled back and
+    raises, rather than committing an aborted transaction.
+    """
+    patch.many(Transaction, ['begin', 'end'])
+    patch.object(Transaction, 'aborted', return_value=True)
+    with raises(TransactionError):
+        with transaction:
+            pass
+    Transaction.aborted.assert_called_with(None)
+    Transaction.end.assert_called_with(True)
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_transaction__end_error(patch, db, transaction, connection):
+    """
+    Ensures errors on commit are raised, and that the connection goes back
+    to the pool.
+    """
+    patch.many(Transaction, ['begin', 'end'])
+    with raises(psycopg2.Error):
+        with transaction:
+            connection.cursor.execute.side_effect = psycopg2.Error
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_transaction__rollback_error(patch, db, transaction, connection):
+    """
+    Ensures a failing rollback doesn't hide the original error.
+    """
+    patch.many(Transaction, ['begin', 'end'])
+    with raises(ValueError):
+        with transaction:
+            connection.cursor.execute.side_effect = psycopg2.Error
+            raise ValueError
+
+
+def test_transaction__begin_error(patch, db, transaction, connection):
+    patch.object(Transaction, 'begin')
+    connection.cursor.execute.side_effect = psycopg2.Error
+    with raises(psycopg2.Error):
+        with transaction:
+            pass
+    assert db.local.connection is None
+    db.pool.checkin.assert_called_with(connection)
+
+
+def test_transaction__held(patch, db, transaction, connection):
+    patch.many(Transaction, ['begin', 'end', 'invalidate'])
+    db.local.connection = connection
+    with transaction:
+        pass
+    assert db.pool.checkout.call_count == 0
+    assert db.pool.checkin.call_count == 0
+    assert db.local.connection == connection
+    assert Transaction.invalidate.call_count == 0
+
+
+def test_transaction_async(patch, run, db, transaction, connection):
+    patch.many(Transaction, ['begin', 'end', 'invalidate'])
+
+    async def block():
+        async with transaction as result:
+            assert db.held.get() == connection
+        return result
+    assert run(block()) == transaction
+    end = Transaction.end.return_value
+    connection.cursor.execute.assert_called_with(end)
+    assert connection.wait.call_count == 2
+    Transaction.end.assert_called_with(False)
+    db.async_pool.checkin.assert_called_with(connection)
+    assert db.held.get() is None
+    assert Transaction.invalidate.call_count == 1
+
+
+def test_transaction_async__error(patch, run, db, transaction, connection):
+    patch.many(Transaction, ['begin', 'end'])
+
+    async def block():
+        async with transaction:
+            raise ValueError
+    with raises(ValueError):
+        run(block())
+    Transaction.end.assert_called_with(True)
+    db.async_pool.checkin.assert_called_with(connection)
+
+
+def test_transaction_async__aborted(patch, run, db, transaction,
+                                    connection):
+    patch.many(Transaction, ['begin', 'end'])
+    patch.object(Transaction, 'aborted', return_value=True)
+
+    async def block():
+        async with transaction:
+            pass
+    with raises(TransactionError):
+        run(block())
+    Transaction.end.assert_called_with(True)
+    db.async_pool.checkin.assert_called_with(connection)
+
+
+def test_transaction_async__held(patch, run, db, transaction, connection):
+    patch.many(Transaction, ['begin', 'end'])
+
+    async def block():
+        db.held.set(connection)
+        async with transaction:
+            pass
+    run(block())
+    assert db.acheckout.call_count == 0
+    assert db.async_pool.checkin.call_count == 0
@@ -25,6 +25,7 @@ def test_column_init(column):
     assert column.unique is False
     assert column.default is None
     assert column.primary_key is False
+    assert column.index is False
     assert column.options == {}
 
 
@@ -36,6 +37,10 @@ def test_column_init__unique():
     assert Column('name', 'int', unique=True).unique is True
 
 
+def test_column_init__index():
+    assert Column('name', 'int', index=True).index is True
+
+
 def test_column_init__default():
     assert Column('name', 'int', default='hello').default == 'hello'
 
@@ -84,6 +89,44 @@ def test_column_type__error(column):
         column.column_type()
 
 
+@mark.parametrize('field_type, array_type', (
+    ('foreign', 'uuid'),
+    ('serial', 'integer'),
+    ('uuid', 'uuid'),
+    ('int', 'integer')
+))
+def test_column_array_type(column, field_type, array_type):
+    column.field_type = field_type
+    assert column.array_type() == array_type
+
+
+@mark.parametrize('field_type, dtype', (
+    ('int', 'int32'),
+    ('bigint', 'int64'),
+    ('double', 'float64'),
+    ('bool', 'bool'),
+    ('datetime', 'datetime64[us]'),
+    ('str', None)
+))
+def test_column_dtype(column, field_type, dtype):
+    column.field_type = field_type
+    assert column.dtype() == dtype
+
+
+@mark.parametrize('field_type, function, aggregate_type', (
+    ('str', 'count', 'bigint'),
+    ('int', 'sum', 'bigint'),
+    ('bigint', 'sum', 'decimal'),
+    ('double', 'sum', 'double'),
+    ('int', 'avg', 'decimal'),
+    ('float', 'avg', 'double'),
+    ('date', 'max', 'date')
+))
+def test_column_aggregate_type(column, field_type, function, aggregate_type):
+    column.field_type = field_type
+    assert column.aggregate_type(function) == aggregate_type
+
+
 def test_column_relationship(column):
     column.field_type = 'foreign'
     column.options['reference'] = 'table'
@@ -140,5 +183,46 @@ def test_column_cast__uuid(column):
     assert column.cast(value) == str(value)
 
 
+@mark.parametrize('string, expected', [
+    ('value', 'value'),
+    ('', '""'),
+    ('a,b', '"a,b"'),
+    ('say "hi"', '"say ""hi"""'),
+    ('line\n', '"line\n"')
+])
+def test_column_quote_csv(string, expected):
+    assert Column.quote_csv(string) == expected
+
+
+def test_column_encode(patch, column):
+    patch.object(Column, 'cast', return_value=1)
+    assert column.encode(1) == '1'
+    Column.cast.assert_called_with(1)
+
+
+def test_column_encode__escapes(column):
+    assert column.encode('a\tb\nc\\') == 'a\\tb\\nc\\\\'
+
+
+def test_column_encode__none(column):
+    assert column.encode(None) == '\\N'
+
+
+def test_column_encode__bool(column):
+    assert column.encode(True) == 't'
+    assert column.encode(False) == 'f'
+
+
+def test_column_encode__csv(patch, column):
+    patch.object(Column, 'quote_csv')
+    result = column.encode('value', 'csv')
+    Column.quote_csv.assert_called_with('value')
+    assert result == Column.quote_csv()
+
+
+def test_column_encode__csv_none(column):
+    assert column.encode(None, 'csv') == ''
+
+
 def test_column_repr(column):
     assert str(column) == '<Column(name, type: int)>'
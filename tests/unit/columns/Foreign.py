@@ -16,7 +16,8 @@ def test_foreign():
 def test_foreign_init(patch):
     patch.init(Column)
     Foreign('name', 'foreign_table')
-    kwargs = {'nullable': True, 'unique': False, 'reference': 'foreign_table',
+    kwargs = {'nullable': True, 'unique': False, 'index': True,
+              'reference': 'foreign_table',
               'reference_column': 'id'}
     Column.__init__.assert_called_with('name', 'foreign', **kwargs)
 
@@ -24,16 +25,18 @@ def test_foreign_init(patch):
 def test_foreign_init__column(patch):
     patch.init(Column)
     Foreign('name', 'foreign_table', 'foreign_key')
-    kwargs = {'nullable': True, 'unique': False, 'reference': 'foreign_table',
+    kwargs = {'nullable': True, 'unique': False, 'index': True,
+              'reference': 'foreign_table',
               'reference_column': 'foreign_key'}
     Column.__init__.assert_called_with('name', 'foreign', **kwargs)
 
 
-@mark.parametrize('kwarg', ['nullable', 'unique'])
+@mark.parametrize('kwarg', ['nullable', 'unique', 'index'])
 def test_foreign_init__nullable(patch, kwarg):
     patch.init(Column)
     Foreign('name', 'foreign_table', **{kwarg: 'yes'})
-    kwargs = {'nullable': True, 'unique': False, 'reference': 'foreign_table',
+    kwargs = {'nullable': True, 'unique': False, 'index': True,
+              'reference': 'foreign_table',
               'reference_column': 'id'}
     kwargs[kwarg] = 'yes'
     Column.__init__.assert_called_with('name', 'foreign', **kwargs)
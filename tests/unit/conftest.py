@@ -4,6 +4,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 # -*- coding: utf-8 -*-
+import asyncio
+
 from pytest import fixture
 
 
@@ -43,6 +45,36 @@ def patch(mocker, patch_init, patch_many):
     return mocker.patch
 
 
+@fixture
+def coroutine(magic):
+    """
+    Makes a mock that returns an awaitable of its return value, since
+    AsyncMock is not available on every supported python.
+    """
+    def coroutine(**kwargs):
+        mock = magic(**kwargs)
+
+        async def result(*args, **kwargs):
+            return mock.return_value
+        mock.side_effect = result
+        return mock
+    return coroutine
+
+
+@fixture
+def run():
+    """
+    Runs a coroutine to completion on a new event loop.
+    """
+    def run(coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+    return run
+
+
 @fixture
 def table(magic):
     return magic()
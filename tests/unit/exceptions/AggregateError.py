@@ -0,0 +1,28 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import AggregateError
+
+
+def test_aggregateerror_init():
+    error = AggregateError('median')
+    assert error.function == 'median'
+    assert error.joined is None
+
+
+def test_aggregateerror_init__joined():
+    assert AggregateError('aggregate', 'users').joined == 'users'
+
+
+def test_aggregateerror_str():
+    result = str(AggregateError('median'))
+    assert result == 'Aggregate error: median is not a known aggregate'
+
+
+def test_aggregateerror_str__joined():
+    result = str(AggregateError('aggregate', 'users'))
+    assert result == ('Aggregate error: aggregate can not be used on a '
+                      'query joined with users')
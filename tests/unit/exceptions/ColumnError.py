@@ -0,0 +1,18 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import ColumnError
+
+
+def test_columnerror_init():
+    error = ColumnError('trees', 'leaves')
+    assert error.table == 'trees'
+    assert error.name == 'leaves'
+
+
+def test_columnerror_str():
+    result = str(ColumnError('trees', 'leaves'))
+    assert result == 'Column error: table trees has no column leaves'
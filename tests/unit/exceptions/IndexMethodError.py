@@ -0,0 +1,16 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import IndexMethodError
+
+
+def test_indexmethoderror_init():
+    assert IndexMethodError('rtree').method == 'rtree'
+
+
+def test_indexmethoderror_str():
+    result = str(IndexMethodError('rtree'))
+    assert result == 'Index method error: rtree is invalid or not supported'
@@ -0,0 +1,19 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import IndexNameError
+
+
+def test_indexnameerror_init():
+    error = IndexNameError('todos', 'todos_user_idx')
+    assert error.table == 'todos'
+    assert error.name == 'todos_user_idx'
+
+
+def test_indexnameerror_str():
+    result = str(IndexNameError('todos', 'todos_user_idx'))
+    assert result == ('Index name error: table todos has more than one '
+                      'index named todos_user_idx')
@@ -0,0 +1,16 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import IsolationError
+
+
+def test_isolationerror_init():
+    assert IsolationError('dirty').isolation == 'dirty'
+
+
+def test_isolationerror_str():
+    result = str(IsolationError('dirty'))
+    assert result == 'Isolation error: dirty is not an isolation level'
@@ -0,0 +1,40 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import PaginationError
+
+
+def test_paginationerror_init():
+    error = PaginationError('random')
+    assert error.order == 'random'
+    assert error.column is None
+    assert error.mode is None
+
+
+def test_paginationerror_init__column():
+    assert PaginationError('order', 'id').column == 'id'
+
+
+def test_paginationerror_init__mode():
+    assert PaginationError('order', mode='tuples').mode == 'tuples'
+
+
+def test_paginationerror_str():
+    result = str(PaginationError('random'))
+    expected = ('Pagination error: order random can not be used for keyset '
+                'pagination')
+    assert result == expected
+
+
+def test_paginationerror_str__column():
+    result = str(PaginationError({'id': 'asc'}, 'id'))
+    expected = "Pagination error: order {'id': 'asc'} needs a value for id"
+    assert result == expected
+
+
+def test_paginationerror_str__mode():
+    result = str(PaginationError('order', mode='tuples'))
+    assert result == 'Pagination error: pages can not be made in tuples mode'
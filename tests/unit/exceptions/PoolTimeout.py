@@ -0,0 +1,17 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import PoolTimeout
+
+
+def test_pooltimeout_init():
+    assert PoolTimeout(30).timeout == 30
+
+
+def test_pooltimeout_str():
+    result = str(PoolTimeout(30))
+    expected = 'Pool timeout: no connection was available after 30 seconds'
+    assert result == expected
@@ -0,0 +1,19 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import RelationshipError
+
+
+def test_relationshiperror_init():
+    error = RelationshipError('trees', 'bees')
+    assert error.table == 'trees'
+    assert error.name == 'bees'
+
+
+def test_relationshiperror_str():
+    result = str(RelationshipError('trees', 'bees'))
+    expected = 'Relationship error: table trees has no relationship with bees'
+    assert result == expected
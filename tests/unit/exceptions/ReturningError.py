@@ -0,0 +1,16 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import ReturningError
+
+
+def test_returningerror_init():
+    assert ReturningError('name').returning == 'name'
+
+
+def test_returningerror_str():
+    result = str(ReturningError('name'))
+    assert result == "Returning error: name is not one of None, 'id' or '*'"
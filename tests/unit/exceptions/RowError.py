@@ -0,0 +1,19 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import RowError
+
+
+def test_rowerror_init():
+    error = RowError('trees', ['name'])
+    assert error.table == 'trees'
+    assert error.columns == ['name']
+
+
+def test_rowerror_str():
+    result = str(RowError('trees', ['name']))
+    assert result == ('Row error: rows inserted in trees must all have the '
+                      "columns ['name']")
@@ -0,0 +1,24 @@
+# Copyright (C) 2019 Strangemachines
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+# -*- coding: utf-8 -*-
+from psyker.exceptions import TransactionError
+
+
+def test_transactionerror_init():
+    assert TransactionError().savepoint is None
+    assert TransactionError('psyker_1').savepoint == 'psyker_1'
+
+
+def test_transactionerror_str():
+    result = str(TransactionError())
+    assert result == ('Transaction error: a statement failed, so the '
+                      'transaction was rolled back')
+
+
+def test_transactionerror_str__savepoint():
+    result = str(TransactionError('psyker_1'))
+    assert result == ('Transaction error: a statement failed, so the '
+                      'transaction was rolled back to psyker_1')